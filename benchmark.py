@@ -0,0 +1,247 @@
+"""benchmark.py
+The performance regression suite of the library. `run` times the cost per
+step of every integrator on the derivatives of the library, single stars with
+both backends, and the throughput of a reduced sweep of main.py, and writes
+the results to a JSON file; `compare` checks such a file against a saved
+baseline and flags the cases which got slower.
+
+    python benchmark.py run --out baseline.json
+    ... change the code ...
+    python benchmark.py run --out current.json
+    python benchmark.py compare baseline.json current.json
+
+Both runs have to be on the same, otherwise idle, machine; on a shared one
+raise the threshold of compare above the noise, seen by comparing two runs of
+the same code.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+# our library
+import modules
+from modules import derivatives, integrators
+from modules.whiteDwarf import constants
+
+# densities of the single stars, low, middle and high in the range of main.py
+starDensities = [1e6, 1e10, 1e14]
+# metrics compared against the baseline, all lower is better, with the
+# smallest change which counts; a few kB of memory are noise
+metrics = {"seconds": 0.0, "peakMB": 1.0}
+
+def timeit(func, repeat, minTime=0.5):
+    """Calls `func` at least `repeat` times and for at least `minTime` s;
+    returns the fastest and the median wall time in s. The fastest is the
+    least disturbed by the rest of the machine, so it is the one compared."""
+    times = []
+    while len(times) < repeat or sum(times) < minTime:
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return min(times), statistics.median(times)
+
+def peakMemory(func):
+    """The peak of the memory allocated by `func` in MB, as traced by
+    tracemalloc, which numpy reports its arrays to."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]/2**20
+    finally:
+        tracemalloc.stop()
+
+def benchSteps(steps, repeat):
+    """The cost per step of every integrator of `integrators.index` on the SHO
+    and both gases, allocating and, for those of `integrators.inPlace`, in
+    place."""
+    # the gases at rhoC = 1e10 near the centre, well before the surface
+    const1, const2 = constants(1e10)
+    systems = {
+        "SHO": (np.array([0.0, 1.0]), derivatives.SHO),
+        "nonRelativGas": (np.array([1.0, 1.0]),
+                          lambda x, y, out=None: derivatives.nonRelativGas(
+                              x, y, const1, 1e-10, out)),
+        "relativGas": (np.array([1.0, 1.0]),
+                       lambda x, y, out=None: derivatives.relativGas(
+                           x, y, const1, const2, 1e-10, out)),
+    }
+    span = modules.grids.uniformGrid(1.0, 1e-3, steps + 1)
+    results = {}
+    for k, method in integrators.index.items():
+        variants = (False, True) if k in integrators.inPlace else (False,)
+        for name, (y0, deriv) in systems.items():
+            for inplace in variants:
+                def integrate():
+                    ode = modules.ODEinit(y0, deriv, span, inplace=inplace)
+                    ode.integrate(k, store="final")
+                best, median = timeit(integrate, repeat)
+                key = "step/{}/{}/{}".format(
+                    method.__name__, name, "inplace" if inplace else "alloc")
+                results[key] = {"seconds": best/steps, "median": median/steps,
+                                "unit": "s per step"}
+    return results
+
+def benchStars(points, repeat, backends):
+    """Wall time and peak memory of single relativistic stars on the grid of
+    main.py with `points` points, integrated to the surface."""
+    span = modules.grids.uniformGrid.linspace(1, 8.1e7, points)
+    results = {}
+    for backend in backends:
+        for rhoC in starDensities:
+            def integrate():
+                star = modules.whiteDwarf(rhoC, span, 2)
+                star.integrate(3, surface=True, store="final", backend=backend)
+                return star
+            # the first call compiles, or loads, the jit kernels
+            steps = integrate().indexEnd
+            best, median = timeit(integrate, repeat)
+            key = "star/{}/rhoC={:.0e}".format(backend, rhoC)
+            results[key] = {"seconds": best, "median": median,
+                            "peakMB": peakMemory(integrate), "steps": int(steps),
+                            "unit": "s per star"}
+    return results
+
+def benchSweep(count, processes):
+    """Throughput of a sweep of main.py reduced to `count` relativistic
+    densities, through a fresh cache, including starting the pool."""
+    import main
+
+    rhoVal = np.array([float(a)*10**b for b in range(6,15) for a in range(1,10)])
+    rhoVal = rhoVal[np.linspace(0, rhoVal.size - 1, count).astype(int)]
+    saved = os.environ.get("WHITEDWARF_CACHE"), modules.cache._default
+    with tempfile.TemporaryDirectory() as tmp:
+        # an empty cache for the workers, or nothing would be integrated
+        os.environ["WHITEDWARF_CACHE"] = os.path.join(tmp, "cache")
+        modules.cache._default = None
+        try:
+            sink = modules.sweep.resultSink(
+                os.path.join(tmp, "relativRes.partial.csv"),
+                ["rhoC", "radiusKM", "massSolMass"])
+            t0 = time.perf_counter()
+            with modules.sweep.workerPool(processes) as pool:
+                modules.sweep.run(main.starInitRelativ, rhoVal, sink, pool,
+                                  progress=False,
+                                  cost=lambda r: modules.sweep.starCost(
+                                      r, 2, main.gridSize(r, 2)))
+                workers = pool.processes
+            seconds = time.perf_counter() - t0
+        finally:
+            # the cache of the caller, as it was
+            if saved[0] is None:
+                os.environ.pop("WHITEDWARF_CACHE", None)
+            else:
+                os.environ["WHITEDWARF_CACHE"] = saved[0]
+            modules.cache._default = saved[1]
+    return {"sweep/relativ/{}".format(count): {
+        "seconds": seconds, "starsPerSecond": count/seconds,
+        "processes": workers, "unit": "s per sweep"}}
+
+def environment():
+    """What the results depend on besides the code, saved with them."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))
+                                ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": commit, "python": platform.python_version(),
+            "numpy": np.__version__, "numba": modules.kernels.available,
+            "machine": platform.machine(), "cpus": os.cpu_count()}
+
+def run(args):
+    suites = set(args.suites)
+    results = {}
+    if "steps" in suites:
+        results.update(benchSteps(2000 if args.quick else 20000, args.repeat))
+    if "stars" in suites:
+        results.update(benchStars(20000 if args.quick else 200000,
+                                  args.repeat, ["jit", "python"]))
+    if "sweep" in suites:
+        results.update(benchSweep(9 if args.quick else 27, args.processes))
+    for key, row in results.items():
+        print("{:45s} {:.4g} {}".format(key, row["seconds"], row["unit"]))
+    with open(args.out, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f,
+                  indent=1)
+
+def compare(args):
+    """Prints the ratio current/baseline of every metric of the cases in both
+    files, flagging those beyond the threshold; returns the number of
+    regressions."""
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline["environment"].get("machine") != \
+            current["environment"].get("machine"):
+        print("Warning: the files come from different machines")
+    regressions = 0
+    for key in sorted(set(baseline["results"]) & set(current["results"])):
+        for metric in metrics:
+            old = baseline["results"][key].get(metric)
+            new = current["results"][key].get(metric)
+            if old is None or new is None or old == 0:
+                continue
+            ratio = new/old
+            if abs(new - old) < metrics[metric]:
+                flag = ""
+            elif ratio > 1 + args.threshold:
+                flag = "REGRESSION"
+                regressions += 1
+            elif ratio < 1 - args.threshold:
+                flag = "improved"
+            else:
+                flag = ""
+            print("{:45s} {:8s} {:10.4g} {:10.4g} {:6.2f}x {}".format(
+                key, metric, old, new, ratio, flag))
+    for key in sorted(set(baseline["results"]) ^ set(current["results"])):
+        print("{:45s} only in {}".format(
+            key, "baseline" if key in baseline["results"] else "current"))
+    print("{} regressions beyond {:.0%}".format(regressions, args.threshold))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    runParser = commands.add_parser("run", help="run the benchmarks")
+    runParser.add_argument("--out", default="benchmark.json",
+                           help="the JSON file of the results")
+    runParser.add_argument("--suites", nargs="+",
+                           default=["steps", "stars", "sweep"],
+                           choices=["steps", "stars", "sweep"])
+    runParser.add_argument("--repeat", type=int, default=5,
+                           help="least runs of every case, the fastest is "
+                                "kept")
+    runParser.add_argument("--quick", action="store_true",
+                           help="smaller cases, for a first look")
+    runParser.add_argument("--processes", type=int,
+                           help="workers of the sweep, by default all CPUs")
+    compareParser = commands.add_parser(
+        "compare", help="compare results with a baseline")
+    compareParser.add_argument("baseline")
+    compareParser.add_argument("current")
+    compareParser.add_argument("--threshold", type=float, default=0.1,
+                               help="relative change flagged, by default 10%%")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args)
+    else:
+        # a non-zero exit status on regressions, for scripts
+        sys.exit(1 if compare(args) else 0)
+
+
+if __name__ == '__main__':
+    main()
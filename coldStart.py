@@ -0,0 +1,92 @@
+"""coldStart.py
+An auxiliary script measuring the cold start of the library, the cost paid by
+every fresh process of a sweep: the time to `import modules`, and to import it
+and compute a single star as a worker does. Each is run in new interpreters,
+several times, and the fastest and median wall times are printed.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# the code run in the fresh interpreter, which reports its own timings as JSON
+# on its last line; the star is the one of main.py at rhoC = 1e10 on the
+# default grid
+importOnly = """
+import json
+import time
+t0 = time.perf_counter()
+import modules
+t1 = time.perf_counter()
+print(json.dumps({"import": t1 - t0}))
+"""
+
+singleStar = """
+import json
+import time
+t0 = time.perf_counter()
+import modules
+t1 = time.perf_counter()
+span = modules.grids.uniformGrid.linspace(1, 8.1e7, %d)
+star = modules.whiteDwarf(1e10, span, 2)
+star.integrate(3, surface=True, store="final", backend="%s")
+star.getRadiusMass()
+t2 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "star": t2 - t1}))
+"""
+
+def measure(code, repeat):
+    """Runs `code` in `repeat` fresh interpreters; returns the wall times of
+    the processes and the timings they report."""
+    walls, inner = [], []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", code], check=True,
+                             capture_output=True, text=True).stdout
+        walls.append(time.perf_counter() - t0)
+        try:
+            timings = json.loads(out.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            timings = None
+        if not isinstance(timings, dict):
+            raise RuntimeError(
+                "No timings in the output of the process:\n" + out)
+        inner.append(timings)
+    return walls, inner
+
+def summary(name, walls, inner):
+    row = {"case": name, "processMin": min(walls),
+           "processMedian": statistics.median(walls)}
+    for key in inner[0]:
+        values = [t[key] for t in inner]
+        row[key + "Min"] = min(values)
+        row[key + "Median"] = statistics.median(values)
+    return row
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="fresh interpreters per case")
+    parser.add_argument("--points", type=int, default=2000000,
+                        help="grid points of the single star")
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    cases = [("import modules", importOnly),
+             ("single star, jit", singleStar % (args.points, "jit")),
+             ("single star, python", singleStar % (args.points, "python"))]
+    rows = []
+    for name, code in cases:
+        rows.append(summary(name, *measure(code, args.repeat)))
+        print("{:22s}".format(name) + "  ".join(
+            "{} {:.3f} s".format(k, v) for k, v in rows[-1].items()
+            if k != "case"))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,84 +1,144 @@
 """convergence.py
-This is an auxiliary script, which helps determine the convergence of 
-computing white dwarf parameters and in turn judge the needed coarseness of 
-the integration space. Many of the functions here are direct copies of the ones
-in main.py; look there for more explanation. Outputs .csv files of calculations.
+This is an auxiliary script, which helps determine the convergence of
+computing white dwarf parameters and in turn judge the needed coarseness of
+the integration space. For every density and regime the number of grid points
+is doubled until Richardson extrapolation says the radius and mass are within
+the tolerance; outputs a result table of the calculations (look at
+modules/results.py) and the recommended grid size per density in
+convergenceGrid.json, which main.py reads.
 """
+import argparse
+import json
 import math
-from multiprocessing import Pool, cpu_count
+import os
 
-# for saving files to csv (easier than the numpy implementation)
-import pandas as pd
-# solar mass for output scale
-from astropy.constants import M_sun
-# for setup of integration grid
-from numpy.core.function_base import linspace
+import numpy as np
 
 # our library
 import modules
+# the grids of the stars, shared with main.py
+from main import starStart
+# solar mass for output scale
+from modules.constants import M_sun
 
+# the file with the recommended grid sizes, read by main.py
+gridFile = "convergenceGrid.json"
 
-# Direct copy of the method in main.py, only added a variable for the number of
-# intervals in the space (since we are probing it).
-def starInitNonRelativ(myTuple):
-    rhoC, n = myTuple
-    span = linspace(1,8.1e7,num=n)
-    star = modules.whiteDwarf(rhoC, span, 1)
-    star.integrate(3)
+# One star on a grid of n points over the span used in main.py; the task
+# carries its density, regime and n so that results can come back in any order.
+def starTask(task):
+    rhoC, regime, n = task
+    span = modules.grids.uniformGrid.linspace(
+        float(starStart(rhoC, regime, n)), 8.1e7, n)
+    # same stars as main.py at the same n, shared through the cache
+    radius, mass = modules.cache.default().radiusMass(
+        rhoC, regime, span, 3, surface=True, store="final", backend="jit")
+    # return the task with radius in km/1000, mass in solar mass
+    return rhoC, regime, n, radius/1000, mass/M_sun
 
-    radius, mass = star.getRadiusMass()
-    # return the three values No of iter, radius in km/1000, mass in solar mass
-    return [n, radius/1000, mass/M_sun.value]
+def richardson(coarse, fine, order):
+    """Richardson extrapolation of the results on n and 2n points of a method
+    of the given order; returns the extrapolated value and the error estimate
+    of the result on 2n points."""
+    correction = (fine - coarse)/(2**order - 1)
+    return fine + correction, abs(correction)
 
-# Direct copy of the method in main.py, only added a variable for the number of
-# intervals in the space (since we are probing it).
-def starInitRelativ(myTuple):
-    rhoC, n = myTuple
-    span = linspace(1,8.1e7,num=n)
-    star = modules.whiteDwarf(rhoC, span, 2)
-    star.integrate(3)
+def extrapolate(values, order):
+    """Extrapolates the results on doubling grids with the order of
+    convergence seen in the last three, kept between 1 and the nominal order;
+    returns the extrapolated value, the error estimate of the last result and
+    the order used."""
+    d1, d2 = values[-2] - values[-3], values[-1] - values[-2]
+    seen = math.log2(abs(d1/d2)) if d1 != 0 and d2 != 0 else order
+    p = min(max(seen, 1.0), order)
+    value, error = richardson(values[-2], values[-1], p)
+    return value, error, p
 
-    radius, mass = star.getRadiusMass()
-    # return the three values No of iter, radius in km/1000, mass in solar mass
-    return [n, radius/1000, mass/M_sun.value]
+def study(densities, regimes, tol, order, nStart, nMax, pool):
+    """Doubles the grid of every (density, regime) pair until the estimated
+    errors of the radius and mass are below tol; the doublings of all pairs
+    still going are submitted together to the pool, a round at a time, the
+    longest first.
 
-numberOfIterations = [int(float(a)*10**b) for b in range(2,8) for a in [1,2,4,8]]
+    Returns a dict of the results on every grid by pair, and a dict of the
+    recommended grid size and extrapolated values by pair."""
+    results = {(r, g): [] for r in densities for g in regimes}
+    summary = {}
+    # start every pair with three grids, the least to tell the order
+    tasks = [(r, g, n) for r, g in results
+             for n in (nStart, 2*nStart, 4*nStart)]
+    while tasks:
+        costs = [modules.sweep.starCost(r, g, n) for r, g, n in tasks]
+        for _, (rhoC, regime, n, radius, mass) in pool.imap(
+                starTask, tasks, costs):
+            results[rhoC, regime].append((n, radius, mass))
+        tasks = []
+        for pair, rows in results.items():
+            if pair in summary:
+                continue
+            rows.sort()
+            # extrapolate each quantity with the order seen in the last
+            # three grids, between first order and the nominal one: the
+            # radius converges erratically and often at first order only,
+            # as the surface falls anywhere in a step
+            R, errR, pR = extrapolate([row[1] for row in rows], order)
+            M, errM, pM = extrapolate([row[2] for row in rows], order)
+            n = rows[-1][0]
+            converged = bool(errR <= tol*abs(R) and errM <= tol*abs(M))
+            if converged or 2*n > nMax:
+                summary[pair] = {
+                    "rhoC": pair[0], "n": n, "converged": converged,
+                    "radiusKM": float(R), "massSolMass": float(M),
+                    "errorRadius": float(errR/abs(R)),
+                    "errorMass": float(errM/abs(M)),
+                    "order": [pR, pM]}
+            else:
+                tasks.append((pair[0], pair[1], 2*n))
+    return results, summary
 
 # wrapped all actions in a main function because of the multiprocessing
 def main():
-    # Loop the three densities - two at the ends of the interval and one at the middle
-    # multiprocessing copied from main.py
-    for density in [1e6, 1e10, 1e14]:
-        # quick hack to prepare an iterable for the multiprocessing pool
-        # function, since our function needs two parameters
-        poolIterable = [(density, n) for n in numberOfIterations]
-        with Pool(cpu_count(), maxtasksperchild=1) as executor:
-            # The executor.map(f, s) applies the function f to each member of the
-            # iterable s and collects the results in a list following a First In 
-            # First Out procedure, so the results collected are ordered by the
-            # order in which they were in s, i.e. by central density values.
-            resNonRelativ = executor.map(starInitNonRelativ, poolIterable)
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--tol", type=float, default=1e-6,
+                        help="relative tolerance of radius and mass")
+    # RK4 is 4th order per step, but the density vanishing as a power of the
+    # distance to the surface makes the global error of the mass 2nd order on
+    # the grids of main.py
+    parser.add_argument("--order", type=float, default=2,
+                        help="order of convergence for the extrapolation")
+    parser.add_argument("--densities", type=float, nargs="+",
+                        default=[1e6, 1e10, 1e14])
+    parser.add_argument("--serve", metavar="HOST:PORT",
+                        help="hand the stars out to workers started with "
+                             "sweepWorker.py, instead of a local pool; look "
+                             "at main.py --help")
+    args = parser.parse_args()
+
+    if args.serve:
+        pool = modules.cluster.clusterPool(
+            modules.cluster.parseAddress(args.serve))
+    else:
+        pool = modules.sweep.workerPool()
+    with pool:
+        results, summary = study(args.densities, [1, 2], args.tol, args.order,
+                                 nStart=1000, nMax=2**14*1000, pool=pool)
 
-        # Save results for non-relativistic case
-        dfNonRel = pd.DataFrame(resNonRelativ, columns=["NoIter", "radiusKM", "massSolMass"])
-        dfNonRel.to_csv(
-            "convergenceE{}nonRelativ.csv".format(int(math.log10(density))),
-            index=None
-        )
-        
-        with Pool(cpu_count()-6, maxtasksperchild=1) as executor:
-            # The executor.map(f, s) applies the function f to each member of the
-            # iterable s and collects the results in a list following a First In 
-            # First Out procedure, so the results collected are ordered by the
-            # order in which they were in s, i.e. by central density values.
-            resRelativ = executor.map(starInitRelativ, poolIterable)
+    # Save results on every grid for the plots, all pairs in one table
+    rows = np.array([(density, regime) + row
+                     for (density, regime), pairRows in sorted(results.items())
+                     for row in sorted(pairRows)], dtype=float)
+    modules.results.save(
+        "convergence", dict(zip(["rhoC", "regime", "NoIter", "radiusKM",
+                                 "massSolMass"], rows.T)), tol=args.tol)
 
-        # Record results to csv file
-        dfRelativ = pd.DataFrame(resRelativ, columns=["NoIter", "radiusKM", "massSolMass"])
-        dfRelativ.to_csv(
-            "convergenceE{}Relativ.csv".format(int(math.log10(density))),
-            index=None
-        )
+    # recommended grid sizes by regime, ordered by density; written to a
+    # temporary file first so that main.py never reads half of it
+    out = {"tol": args.tol, "order": args.order, "regimes": {}}
+    for (density, regime), entry in sorted(summary.items()):
+        out["regimes"].setdefault(str(regime), []).append(entry)
+    with open(gridFile + ".tmp", "w") as f:
+        json.dump(out, f, indent=1)
+    os.replace(gridFile + ".tmp", gridFile)
 
 
 if __name__ == '__main__':
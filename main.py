@@ -1,23 +1,75 @@
 """main.py
 The main script in this experiment. It calculates the values of the white dwarf
 radius and mass for different central densities (initial conditions to solve
-the ODE) by using our purpose built library and outputs them to a .csv file.
+the ODE) by using our purpose built library and outputs them to binary result
+tables (look at modules/results.py).
 """
 
-# parallel computing library
-from multiprocessing import Pool, cpu_count
+import argparse
+import functools
+import json
+import sys
 
 import numpy as np
-# for saving files to csv (easier than the numpy implementation)
-import pandas as pd
-# solar mass for output scale
-from astropy.constants import M_sun
-# for setup of integration grid
-from numpy.core.function_base import linspace
 
 # our white dwarf integrator module
 import modules
-
+# solar mass for output scale
+from modules.constants import M_sun
+# the start of the grids off the centre
+from modules.whiteDwarf import startPoint
+
+
+# grid size used where convergence.py has not recommended one
+defaultGridSize = 2000000
+
+@functools.lru_cache(maxsize=None)
+def loadGridSizes(regime):
+    """Reads the grid sizes recommended by convergence.py for a regime, as the
+    arrays of densities and sizes ordered by density; None without the file."""
+    try:
+        with open("convergenceGrid.json") as f:
+            entries = json.load(f)["regimes"][str(regime)]
+    except (OSError, KeyError, ValueError):
+        return None
+    entries = sorted(entries, key=lambda e: e["rhoC"])
+    return (np.array([e["rhoC"] for e in entries]),
+            np.array([e["n"] for e in entries]))
+
+def gridSize(rhoC, regime):
+    """The number of grid points for each of the densities rhoC: the larger of
+    the sizes recommended at the densities of the convergence study either
+    side, or the nearest one outside of their range."""
+    table = loadGridSizes(regime)
+    if table is None:
+        return np.full(np.shape(rhoC), defaultGridSize)
+    rho, n = table
+    i = np.searchsorted(rho, rhoC)
+    return np.maximum(n[np.clip(i - 1, 0, rho.size - 1)],
+                      n[np.clip(i, 0, rho.size - 1)])
+
+def starStart(rhoC, regime, n):
+    """The first point of the grids of n points of the stars rhoC: one step
+    off the centre, or closer where the central series needs it."""
+    return startPoint(rhoC, regime, 8.1e7/(np.asarray(n) - 1))
+
+def starsOnGrids(rhoC, regime):
+    """Radius and mass of the stars rhoC, the ones which share a grid
+    integrated together."""
+    sizes = gridSize(rhoC, regime)
+    starts = starStart(rhoC, regime, sizes)
+    radius = np.empty(rhoC.size)
+    mass = np.empty(rhoC.size)
+    for n, x0 in set(zip(sizes, starts)):
+        sel = (sizes == n) & (starts == x0)
+        span = modules.grids.uniformGrid.linspace(x0, 8.1e7, int(n))
+        # Integrate the white dwarfs not already in the cache; locate the
+        # surface inside the last step rather than at the grid point, only
+        # the final state is needed
+        radius[sel], mass[sel] = modules.cache.default().radiusMass(
+            rhoC[sel], regime, span, 3, surface=True, store="final",
+            backend="jit")
+    return radius, mass
 
 # Initialize a white dwarf with non-relativistic equation of state
 def starInitNonRelativ(rhoC):
@@ -26,26 +78,23 @@ def starInitNonRelativ(rhoC):
 
     Parameters
     ----------
-    rhoC : float
-        The density of the center in kg*m^(-3), used to set the initial
-        conditions for integration.
+    rhoC : np.ndarray
+        The densities of the center in kg*m^(-3), used to set the initial
+        conditions for integration. The ones not in `modules.cache` and
+        sharing a grid size are integrated together as an ensemble.
 
     Returns
     -------
     list
-        Returns a three element list of the density in in kg*m^(-3), the radius
-        in km/1000, and the mass in solar mass in this order.
+        Returns a list with a three element list for every density: the
+        density in in kg*m^(-3), the radius in km/1000, and the mass in solar
+        mass in this order.
     """
-    # Integration grid in normalized units, optimal step size determined on
-    # convergence ground for more info look at convergence.py
-    span = linspace(1,8.1e7,num=2000000)
-    # Initialize the white dwarf and integrate
-    star = modules.whiteDwarf(rhoC, span, 1)
-    star.integrate(3)
-
-    radius, mass = star.getRadiusMass()
+    # Integration grid in normalized units, its size determined on convergence
+    # ground per density; for more info look at convergence.py
+    radius, mass = starsOnGrids(rhoC, 1)
     # return the three values rho in kg*m^(-3), radius in km/1000, mass in solar mass
-    return [rhoC, radius/1000, mass/M_sun.value]
+    return [[r, R/1000, M/M_sun] for r, R, M in zip(rhoC, radius, mass)]
 
 # Initialize a white dwarf with relativistic equation of state
 def starInitRelativ(rhoC):
@@ -54,60 +103,120 @@ def starInitRelativ(rhoC):
 
     Parameters
     ----------
-    rhoC : float
-        The density of the center in kg*m^(-3), used to set the initial
-        conditions for integration.
+    rhoC : np.ndarray
+        The densities of the center in kg*m^(-3), used to set the initial
+        conditions for integration. The ones not in `modules.cache` and
+        sharing a grid size are integrated together as an ensemble.
 
     Returns
     -------
     list
-        Returns a three element list of the density in in kg*m^(-3), the radius
-        in km/1000, and the mass in solar mass in this order.
+        Returns a list with a three element list for every density: the
+        density in in kg*m^(-3), the radius in km/1000, and the mass in solar
+        mass in this order.
     """
-    # Integration grid, optimal step size determined on convergence ground
-    # for more info look at convergence.py
-    span = linspace(1,8.1e7,num=2000000)
-    # Initialize the white dwarf and integrate
-    star = modules.whiteDwarf(rhoC, span, 2)
-    star.integrate(3)
-
-    radius, mass = star.getRadiusMass()
+    # Integration grid, its size determined on convergence ground per
+    # density; for more info look at convergence.py
+    radius, mass = starsOnGrids(rhoC, 2)
     # return the three values rho in kg*m^(-3), radius in km/1000, mass in solar mass
-    return [rhoC, radius/1000, mass/M_sun.value]
+    return [[r, R/1000, M/M_sun] for r, R, M in zip(rhoC, radius, mass)]
+
+def reportStats(name, stats):
+    """Prints what the integrations of a sweep did, summed over the workers
+    in the sink; the stars found in modules.cache took none."""
+    if not stats:
+        print("{}: no stars integrated".format(name), file=sys.stderr)
+        return
+    times = ", ".join("{} {:.2f} s".format(k, v)
+                      for k, v in stats["time"].items())
+    reasons = ", ".join("{} {}".format(k, v)
+                        for k, v in sorted(stats["reasons"].items()))
+    print("{}: {} stars in {} integrations, {} steps, {} derivative calls; "
+          "stopped by {}; {}".format(
+              name, stats["members"], stats["integrations"], stats["steps"],
+              stats["derivCalls"], reasons, times), file=sys.stderr)
 
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="skip the densities already recorded by an interrupted run")
+    parser.add_argument(
+        "--adaptive", action="store_true",
+        help="choose the relativistic densities adaptively, refining where "
+             "the mass-radius curve bends, within the same budget of stars")
+    parser.add_argument(
+        "--integrate", action="store_true",
+        help="integrate the non-relativistic stars too, in the same queue as "
+             "the relativistic ones, instead of scaling the polytrope")
+    parser.add_argument(
+        "--serve", metavar="HOST:PORT",
+        help="hand the stars out to workers on other machines, started with "
+             "sweepWorker.py, instead of the processes of this one; listens "
+             "on localhost unless HOST is given, with the key of "
+             "WHITEDWARF_AUTHKEY or a random one which is printed")
+    args = parser.parse_args()
+
     # the rho values to test in the range, change the list accordingly
     rhoVal = np.array([float(a)*10**b for b in range(6,15) for a in range(1,10)])
 
-    # Implements parallel computation of the ODEs using multiple processes.
-    # Computation is done over the range of central density values rhoVal.
-
-    # Computation for non-relativistic gas. This process sets up the
-    # multiprocessing and cleans up after the calculations are over.
-    with Pool(cpu_count(), maxtasksperchild=1) as executor:
-        # The executor.map(f, s) applies the function f to each member of the
-        # iterable s and collects the results in a list following a First In 
-        # First Out procedure, so the results collected are ordered by the
-        # order in which they were in s, i.e. by central density values.
-        resNonRelativ = executor.map(starInitNonRelativ, rhoVal)
+    columns = ["rhoC", "radiusKM", "massSolMass"]
+    # expected cost of the stars, to start the longest first
+    relativCost = lambda r: modules.sweep.starCost(r, 2, gridSize(r, 2))
+    nonRelativCost = lambda r: modules.sweep.starCost(r, 1, gridSize(r, 1))
+
+    # Computation in parallel over one pool of long-lived processes, in small
+    # chunks of rhoVal, each integrated as an ensemble. The results are
+    # written to the sink files as each chunk finishes, so that an interrupted
+    # run can be picked up again with --resume.
+    if args.serve:
+        pool = modules.cluster.clusterPool(
+            modules.cluster.parseAddress(args.serve))
+    else:
+        pool = modules.sweep.workerPool()
+    with pool:
+        # Computation for non-relativistic gas. It is a polytrope, so the
+        # results follow from scaling a single dimensionless solution instead
+        # of being integrated star by star, unless asked to.
+        if args.integrate:
+            sinkNonRel = modules.sweep.resultSink(
+                "nonRelativRes.partial.csv", columns, resume=args.resume)
+            jobs = [(starInitNonRelativ, rhoVal, sinkNonRel, nonRelativCost)]
+        else:
+            radius, mass = modules.polytrope.radiusMass(rhoVal, 1)
+            resNonRelativ = [[r, R/1000, M/M_sun]
+                             for r, R, M in zip(rhoVal, radius, mass)]
+            jobs = []
+
+        # Computation for relativistic gas
+        sink = modules.sweep.resultSink(
+            "relativRes.partial.csv", columns, resume=args.resume)
+        if args.adaptive:
+            # densities refined where linear interpolation of the curve is
+            # worst, as many stars as rhoVal at most
+            modules.sweep.runMany(jobs, pool)
+            resRelativ = modules.sweep.refine(
+                starInitRelativ, rhoVal[0], rhoVal[-1], sink,
+                budget=rhoVal.size, pool=pool, cost=relativCost)
+        else:
+            # both regimes share the queue
+            jobs.append((starInitRelativ, rhoVal, sink, relativCost))
+            modules.sweep.runMany(jobs, pool)
+            resRelativ = sink.table(rhoVal)
+        if args.integrate:
+            resNonRelativ = sinkNonRel.table(rhoVal)
+            reportStats("non-relativistic", sinkNonRel.stats)
+        reportStats("relativistic", sink.stats)
 
     # Save results for non-relativistic case
-    dfNonRel = pd.DataFrame(resNonRelativ, columns=["rhoC", "radiusKM", "massSolMass"])
-    dfNonRel.to_csv("nonRelativRes.csv", index=None)
-
-    # Computation for non-relativistic gas. This process sets up the
-    # multiprocessing and cleans up after the calculations are over.
-    with Pool(cpu_count()-6, maxtasksperchild=1) as executor:
-        # The executor.map(f, s) applies the function f to each member of the
-        # iterable s and collects the results in a list following a First In 
-        # First Out procedure, so the results collected are ordered by the
-        # order in which they were in s, i.e. by central density values.
-        resRelativ = executor.map(starInitRelativ, rhoVal)
-    
-    # Save results for relativistic case
-    dfRel = pd.DataFrame(resRelativ, columns=["rhoC", "radiusKM", "massSolMass"])
-    dfRel.to_csv("relativRes.csv", index=None)
+    resNonRelativ = np.asarray(resNonRelativ, dtype=float)
+    modules.results.save("nonRelativRes", dict(zip(columns, resNonRelativ.T)))
+
+    # Save results for relativistic case, ordered by central density
+    resRelativ = np.asarray(resRelativ, dtype=float)
+    modules.results.save("relativRes", dict(zip(columns, resRelativ.T)),
+                         adaptive=args.adaptive, stats=sink.stats)
 
 
 if __name__ == "__main__":
@@ -1,28 +1,48 @@
 # mainPlots.py
 # Plots of data for convergence and white dwarf star parameters.
+import json
+
 from matplotlib import colors
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 
+import modules
+# solar mass for output scale
+from modules.constants import M_sun
+
+
+def convergedValue(data, regime, density, column):
+    # the Richardson extrapolated value of convergence.py, or else the mean
+    # of the last three results
+    try:
+        with open("convergenceGrid.json") as f:
+            entries = json.load(f)["regimes"][str(regime)]
+        return next(e[column] for e in entries if e["rhoC"] == density)
+    except (OSError, KeyError, ValueError, StopIteration):
+        return sum(data[column][-3:])/3
+
+def convergenceRows(table, density, regime):
+    # the results of one density and regime from the table of convergence.py
+    return table.where((table["rhoC"] == density) & (table["regime"] == regime))
 
 def convergencePlots():
-    # load in data
-    E6nonRelativ = pd.read_csv("convergenceE6nonRelativ.csv")
-    E6Relativ = pd.read_csv("convergenceE6Relativ.csv")
-    E10nonRelativ = pd.read_csv("convergenceE10nonRelativ.csv")
-    E10Relativ = pd.read_csv("convergenceE10Relativ.csv")
-    E14nonRelativ = pd.read_csv("convergenceE14nonRelativ.csv")
-    E14Relativ = pd.read_csv("convergenceE14Relativ.csv")   
+    # load in data, one table of all densities and regimes
+    table = modules.results.load("convergence")
+    E6nonRelativ = convergenceRows(table, 1e6, 1)
+    E6Relativ = convergenceRows(table, 1e6, 2)
+    E10nonRelativ = convergenceRows(table, 1e10, 1)
+    E10Relativ = convergenceRows(table, 1e10, 2)
+    E14nonRelativ = convergenceRows(table, 1e14, 1)
+    E14Relativ = convergenceRows(table, 1e14, 2)
 
     # subplot setup, tighter spacing
     f, axs = plt.subplots(4,2,figsize=(11.2,17.15),constrained_layout=False)
 
     # mass, non-relativistic
-    # values to which result converges
-    e6convM = sum(E6nonRelativ["massSolMass"][-3:])/3
-    e10convM = sum(E10nonRelativ["massSolMass"][-3:])/3
-    e14convM = sum(E14nonRelativ["massSolMass"][-3:])/3
+    # values to which result converges, extrapolated by convergence.py
+    e6convM = convergedValue(E6nonRelativ, 1, 1e6, "massSolMass")
+    e10convM = convergedValue(E10nonRelativ, 1, 1e10, "massSolMass")
+    e14convM = convergedValue(E14nonRelativ, 1, 1e14, "massSolMass")
 
     # plots of delta m / m_conv
     plt.subplot(4,2,1)
@@ -51,9 +71,9 @@ def convergencePlots():
 
     # mass, relativistic
     # converged to values
-    e6RconvM = sum(E6Relativ["massSolMass"][-3:])/3
-    e10RconvM = sum(E10Relativ["massSolMass"][-3:])/3
-    e14RconvM = sum(E14Relativ["massSolMass"][-3:])/3
+    e6RconvM = convergedValue(E6Relativ, 2, 1e6, "massSolMass")
+    e10RconvM = convergedValue(E10Relativ, 2, 1e10, "massSolMass")
+    e14RconvM = convergedValue(E14Relativ, 2, 1e14, "massSolMass")
 
     # plots of delta m / m_conv
     plt.subplot(4,2,2)
@@ -82,9 +102,9 @@ def convergencePlots():
 
     # radius, non relativistic
     # converged to values
-    e6convR = sum(E6nonRelativ["radiusKM"][-3:])/3
-    e10convR = sum(E10nonRelativ["radiusKM"][-3:])/3
-    e14convR = sum(E14nonRelativ["radiusKM"][-3:])/3
+    e6convR = convergedValue(E6nonRelativ, 1, 1e6, "radiusKM")
+    e10convR = convergedValue(E10nonRelativ, 1, 1e10, "radiusKM")
+    e14convR = convergedValue(E14nonRelativ, 1, 1e14, "radiusKM")
 
     # plots of delta m / m_conv
     plt.subplot(425)
@@ -113,9 +133,9 @@ def convergencePlots():
 
     # radius, relativistic
     # converged to values
-    e6RconvR = sum(E6Relativ["radiusKM"][-3:])/3
-    e10RconvR = sum(E10Relativ["radiusKM"][-3:])/3
-    e14RconvR = sum(E14Relativ["radiusKM"][-3:])/3
+    e6RconvR = convergedValue(E6Relativ, 2, 1e6, "radiusKM")
+    e10RconvR = convergedValue(E10Relativ, 2, 1e10, "radiusKM")
+    e14RconvR = convergedValue(E14Relativ, 2, 1e14, "radiusKM")
 
     # plots of delta m / m_conv
     plt.subplot(426)
@@ -146,8 +166,10 @@ def convergencePlots():
     
 def whiteDwarfPlots():
     # load data
-    nonRres = pd.read_csv("nonRelativRes.csv")
-    Rres = pd.read_csv("relativRes.csv")
+    nonRres = modules.results.load("nonRelativRes")
+    Rres = modules.results.load("relativRes")
+    # limiting mass of the relativistic equation of state, in solar masses
+    massLimit = modules.limits.chandrasekharMass()[0]/M_sun
 
     # fig 1 radius(rhoc)
     plt.figure()
@@ -164,7 +186,7 @@ def whiteDwarfPlots():
     plt.figure()
     plt.plot(nonRres["rhoC"], nonRres["massSolMass"])
     plt.plot(Rres["rhoC"], Rres["massSolMass"])
-    plt.axhline(1.434, c="grey", ls='--', lw=0.5)
+    plt.axhline(massLimit, c="grey", ls='--', lw=0.5)
     plt.xscale("log")
     plt.yscale("log")
     plt.xlabel("Central density, $\\rho_\mathrm{C}$, $\mathrm{kg} \cdot \mathrm{m}^{-3}$")
@@ -176,7 +198,7 @@ def whiteDwarfPlots():
     plt.figure()
     plt.plot(nonRres["massSolMass"], nonRres["radiusKM"])
     plt.plot(Rres["massSolMass"], Rres["radiusKM"])
-    plt.axvline(1.434, c="grey", ls='--', lw=0.5)
+    plt.axvline(massLimit, c="grey", ls='--', lw=0.5)
     plt.xlim(0, 2.1)
     plt.ylim(0, 20000)
     plt.xlabel("Mass, $M_\mathrm{sol}$")
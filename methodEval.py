@@ -1,44 +1,93 @@
 # Test the error with the integrators and plot residuals
-# NOTE we need some amount of iterations comparable to the white dwarf to 
+# NOTE we need some amount of iterations comparable to the white dwarf to
 # compate the methods i.e. 1e6
-from math import cos, sin
+# The errors and energy are computed while integrating, in a single pass over
+# every trajectory; only a sample of each is kept for the plots.
+import time as clock
 
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
-from numpy.core.function_base import linspace
 
 import modules
 from modules.derivatives import SHO
 
+# 2*energy in systems/m, of the oscillation of unit amplitude
+c = 4*np.pi*np.pi
+# length of the runs and the time between the samples kept, s
+duration = 1000.0
+sampleStep = 0.01
+# the methods compared: name, integrator and step in s; euler2 is the euler
+# method with a step 1/10th of the original, yoshida4x10 shows the symplectic
+# method with a step 10 times larger
+methods = [("euler1", 1, 0.001), ("heun", 2, 0.001), ("rk4", 3, 0.001),
+           ("euler2", 1, 0.0001), ("abm4", 5, 0.001), ("verlet", 6, 0.001),
+           ("yoshida4", 7, 0.001), ("yoshida4x10", 7, 0.01)]
+
+
+class streamMetrics(object):
+    """Passed as the store of an integration: collects the points `(t, [p, x])`
+    in a buffer and reduces it a chunk at a time to the largest and final
+    errors of the energy and of the position against x(t) = cos(2 pi t),
+    keeping every `sample`-th point with its errors for the plots. Memory use
+    is that of the buffer and the samples, whatever the number of steps."""
+
+    def __init__(self, sample, chunk=1 << 16):
+        self.sample = sample
+        self.buffer = np.empty((chunk, 3))
+        self.fill = 0
+        # points reduced so far
+        self.count = 0
+        self.maxEnergyError = 0.0
+        self.maxPositionError = 0.0
+        self.samples = []
+
+    def __call__(self, t, y):
+        row = self.buffer[self.fill]
+        row[0] = t
+        row[1:] = y
+        self.fill += 1
+        if self.fill == self.buffer.shape[0]:
+            self.reduce()
+
+    def reduce(self):
+        if self.fill == 0:
+            return
+        rows = self.buffer[:self.fill]
+        energyError = abs(rows[:, 1]**2 + c*rows[:, 2]**2 - c)/c
+        positionError = abs(rows[:, 2] - np.cos(2*np.pi*rows[:, 0]))
+        self.maxEnergyError = max(self.maxEnergyError, energyError.max())
+        self.maxPositionError = max(self.maxPositionError, positionError.max())
+        self.finalEnergyError = energyError[-1]
+        self.finalPositionError = positionError[-1]
+        # the samples by their index in the whole trajectory
+        keep = (self.count + np.arange(self.fill)) % self.sample == 0
+        self.samples.append(np.column_stack(
+            (rows[keep], energyError[keep], positionError[keep])))
+        self.count += self.fill
+        self.fill = 0
+
+    def trace(self):
+        """The sampled points as columns t, p, x, energyError, positionError."""
+        self.reduce()
+        samples = np.concatenate(self.samples)
+        return dict(zip(["t", "p", "x", "energyError", "positionError"],
+                        samples.T))
+
 
 def plots():
-    # load data
-    eul1= pd.read_csv("method1.csv")
-    heun= pd.read_csv("method2.csv")
-    rk4= pd.read_csv("method3.csv")
-    eul2= pd.read_csv("method4.csv")
-    
-    # theoretical data
-    x0 = 1.0
-    step = 0.001
-    span = np.array(step*linspace(1,1000000,num=1000000))
-    # for eul1, heun, rk4
-    theory = np.concatenate(([1], x0*np.cos(2*np.pi*span)))
-
-    # 2*energy in systems/m
-    c = 4*np.pi*np.pi
-    enEul1 = eul1["xdot"]**2 + c*eul1["x"]**2
-    enEul2 = eul2["xdot"]**2 + c*eul2["x"]**2
-    enHeun = heun["xdot"]**2 + c*heun["x"]**2
-    enRK4 = rk4["xdot"]**2 + c*rk4["x"]**2
-    
+    # load data, the summary and the samples of every method
+    summary = modules.results.load("methodEval")
+    traces = {name: modules.results.load("methodTrace_" + name)
+              for name in summary.meta["names"]}
+    eul1, eul2 = traces["euler1"], traces["euler2"]
+    heun, rk4, abm4 = traces["heun"], traces["rk4"], traces["abm4"]
+
     ##  plot 1 - oscill of eul1, eul2, heun
     plt.figure(1)
-    plt.plot(eul1.index/1000, eul1["x"])
-    plt.plot(eul2.index/1000, eul2["x"])
-    plt.plot(heun.index/1000, heun["x"])
+    plt.plot(eul1["t"], eul1["x"])
+    plt.plot(eul2["t"], eul2["x"])
+    plt.plot(heun["t"], heun["x"])
     #axis setup
     plt.xlim(0, 20)
     plt.xlabel("time t, s")
@@ -50,9 +99,9 @@ def plots():
 
     ## plot2 - (oscill - theory) of eul1, eul2, heun
     plt.figure(2)
-    plt.plot(eul1.index/1000, eul1["x"] - theory)
-    plt.plot(eul2.index/1000, eul2["x"] - theory)
-    plt.plot(heun.index/1000, heun["x"] - theory)
+    plt.plot(eul1["t"], eul1["x"] - np.cos(2*np.pi*eul1["t"]))
+    plt.plot(eul2["t"], eul2["x"] - np.cos(2*np.pi*eul2["t"]))
+    plt.plot(heun["t"], heun["x"] - np.cos(2*np.pi*heun["t"]))
     #axis setup
     plt.xlim(0, 20)
     plt.xlabel("time t, s")
@@ -64,9 +113,9 @@ def plots():
 
     ## plot3 - energy of eul1, eul2, heun
     plt.figure(3)
-    plt.plot(enEul1.index/1000, abs(enEul1-c)/c)
-    plt.plot(enEul2.index/1000, abs(enEul2-c)/c)
-    plt.plot(enHeun.index/1000, abs(enHeun-c)/c)
+    plt.plot(eul1["t"], eul1["energyError"])
+    plt.plot(eul2["t"], eul2["energyError"])
+    plt.plot(heun["t"], heun["energyError"])
     #axis setup
     plt.xlim(0, 200)
     plt.xlabel("time t, s")
@@ -79,8 +128,8 @@ def plots():
 
     ## plot4 - energy of heun, rk4
     plt.figure(4)
-    plt.plot(enHeun.index/1000, abs(enHeun-c)/c, color='green')
-    plt.plot(enRK4.index/1000, abs(enRK4-c)/c, color='red')
+    plt.plot(heun["t"], heun["energyError"], color='green')
+    plt.plot(rk4["t"], rk4["energyError"], color='red')
     #axis setup
     plt.xlabel("time t, s")
     plt.ylim(5e-7,1e-3)
@@ -90,33 +139,73 @@ def plots():
     plt.show
     plt.savefig("heunRK4+energy.pdf")
 
+    ## plot5 - energy of rk4, abm4, at half the derivative evaluations
+    plt.figure(5)
+    plt.plot(rk4["t"], rk4["energyError"], color='red')
+    plt.plot(abm4["t"], abm4["energyError"], color='purple')
+    #axis setup
+    plt.xlabel("time t, s")
+    plt.yscale('log')
+    plt.ylabel("energy $\Delta E/E_0$")
+    plt.legend(["rk4", "abm4"], loc="upper left")
+    plt.show
+    plt.savefig("rk4ABM4+energy.pdf")
+
+    ## plot6 - energy of rk4 and the symplectic methods, which stays bounded
+    plt.figure(6)
+    for name in ["rk4", "verlet", "yoshida4", "yoshida4x10"]:
+        plt.plot(traces[name]["t"], traces[name]["energyError"])
+    #axis setup
+    plt.xlabel("time t, s")
+    plt.yscale('log')
+    plt.ylabel("energy $\Delta E/E_0$")
+    plt.legend(["rk4", "verlet", "yoshida4", "yoshida4, 10x step"],
+               loc="upper left")
+    plt.show
+    plt.savefig("rk4+symplectic+energy.pdf")
+
+    # cost and accuracy of every method
+    print("method        step  seconds  deriv calls  max energy error  "
+          "max |x - theory|")
+    for k, name in enumerate(summary.meta["names"]):
+        print("{:12s} {:6g} {:8.2f} {:12d} {:17.3e} {:17.3e}".format(
+            name, summary["step"][k], summary["seconds"][k],
+            int(summary["derivCalls"][k]), summary["maxEnergyError"][k],
+            summary["maxPositionError"][k]))
+
 
 def main():
-    # initial parameters of the SHO
-    x0 = 1.0
-    step = 0.001
-    y0 = x0*np.array([-sin(step), cos(step)])
-    span = step*linspace(1,1000000,num=1000000)
-    
-    # do integration for the three methods
-    for integ in [1,2,3]:
+    # initial parameters of the SHO, x(t) = cos(2 pi t) from t = 0
+    y0 = np.array([0.0, 1.0])
+
+    columns = {"integrator": [], "step": [], "seconds": [], "derivCalls": [],
+               "maxEnergyError": [], "finalEnergyError": [],
+               "maxPositionError": []}
+    for name, integ, step in methods:
+        # the grid points are computed on the fly rather than stored
+        span = modules.grids.uniformGrid(0.0, step,
+                                         int(round(duration/step)) + 1)
+        metrics = streamMetrics(max(1, int(round(sampleStep/step))))
         ode = modules.ODEinit(y0, SHO, span)
-        ode.integrate(integ)
-        res = np.vstack((np.array([0,1]), ode.yOut))
-        dfOut = pd.DataFrame(res, columns=["xdot", "x"])
-        dfOut.to_csv("method{}.csv".format(integ), index=None)
-    
-    # additional integration for the euler method with a step 1/10th of original
-    span2 = 0.1*step*linspace(1,10000000,num=10000000)
-    ode = modules.ODEinit(y0, SHO, span2)
-    ode.integrate(1)
-    res = np.vstack((np.array([0,1]), ode.yOut))
-    # keep the data only at the same moments as the other ones
-    dfOut = pd.DataFrame(res[::10], columns=["xdot", "x"])
-    dfOut.to_csv("method4.csv", index=None)
+        start = clock.perf_counter()
+        # every point goes to the metrics, none is stored
+        ode.integrate(integ, store=metrics)
+        seconds = clock.perf_counter() - start
+        modules.results.save("methodTrace_" + name, metrics.trace(),
+                             integrator=integ, step=step)
+        for key, value in [("integrator", integ), ("step", step),
+                           ("seconds", seconds),
+                           ("derivCalls", ode.stats["derivCalls"]),
+                           ("maxEnergyError", metrics.maxEnergyError),
+                           ("finalEnergyError", metrics.finalEnergyError),
+                           ("maxPositionError", metrics.maxPositionError)]:
+            columns[key].append(value)
+    modules.results.save("methodEval", columns,
+                         names=[name for name, _, _ in methods],
+                         duration=duration)
 
     plots()
 
 
 if __name__=='__main__':
-    main()
\ No newline at end of file
+    main()
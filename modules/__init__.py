@@ -3,5 +3,15 @@ Module containing facilities for numerically integrating general ODEs and white
 dwarfs using either non-relativistic or relativistic equation of state.
 """
 
+from . import grids
 from .ode  import ODEinit
-from .whiteDwarf import whiteDwarf
\ No newline at end of file
+from .whiteDwarf import whiteDwarf
+from . import polytrope
+from . import cache
+from . import sweep
+from . import limits
+from . import inverse
+from . import results
+from . import constants
+from . import eos
+from . import cluster
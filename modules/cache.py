@@ -0,0 +1,291 @@
+"""
+Result Cache(`cache.py`)
+========================
+
+This is a home to the cache of computed white dwarfs. The radius and mass of a
+star are stored under a key hashed from everything which determines them: the
+central density, the regime, the grid, the integrator and its options, and the
+version of the code doing the integration. Sweeps which share stars, such as
+`main.py` and `convergence.py`, or a sweep re-run with a few new densities,
+then only integrate the stars not computed before.
+
+Classes
+-------
+starCache       Two tier cache: in-process LRU and a directory on disk.
+
+Functions
+---------
+codeVersion     Hash of the sources the results depend on.
+default         The cache shared by a process, in the default directory.
+
+Implementation Notes
+--------------------
+Every star is one small JSON file in the cache directory, named by its key.
+Files are written to a temporary name and renamed into place, which is atomic,
+so that the worker processes of a `multiprocessing.Pool` can write to the
+same directory at once: a reader sees either no file or a complete one, and
+two workers computing the same star write the same content. The directory is
+kept under a size cap by deleting the least recently used files, whose
+modification time is refreshed on every read; the temporary files of writes
+which were interrupted are deleted there as well, once they are an hour old.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from . import eos, grids, integrators
+
+# modules whose sources determine the results, hashed into every key
+_sources = ("constants.py", "derivatives.py", "integrators.py", "kernels.py",
+            "ode.py", "whiteDwarf.py", "grids.py", "eos.py")
+_version = None
+
+def codeVersion() -> str:
+    """
+    Returns a hash of the sources of the modules doing the integration, so
+    that results computed by an older version of the code are not reused.
+    """
+    global _version
+    if _version is None:
+        sha = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in _sources:
+            with open(os.path.join(here, name), "rb") as f:
+                sha.update(f.read())
+        _version = sha.hexdigest()[:16]
+    return _version
+
+def _gridKey(span) -> str:
+    # grids given by a few parameters are described by their repr, explicit
+    # points by a hash of their values
+    span = grids.asGrid(span)
+    if isinstance(span, grids.arrayGrid):
+        points = np.ascontiguousarray(span.array, dtype=float)
+        return "arrayGrid:" + hashlib.sha256(points.tobytes()).hexdigest()
+    return repr(span)
+
+class starCache(object):
+    """
+    Cache of the radius and mass of white dwarfs, in memory and on disk.
+
+    Parameters
+    ----------
+    path : str, optional
+        The directory of the disk tier, created if missing. By default the
+        environment variable `WHITEDWARF_CACHE`, or `~/.cache/whiteDwarf`.
+    maxBytes : int, optional
+        The size cap of the disk tier in bytes, by default 64 MiB.
+    memorySize : int, optional
+        The number of stars kept in memory, by default 4096.
+
+    Attributes
+    ----------
+    hits : int
+        Number of stars found in the cache.
+    misses : int
+        Number of stars which had to be integrated.
+    """
+
+    def __init__(self, path: str=None, maxBytes: int=64*2**20,
+                 memorySize: int=4096) -> None:
+        if path is None:
+            path = os.environ.get("WHITEDWARF_CACHE", os.path.join(
+                os.path.expanduser("~"), ".cache", "whiteDwarf"))
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+        self.maxBytes = maxBytes
+        self.memorySize = memorySize
+        self._memory = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # bytes written since the size of the directory was last checked
+        self._written = 0
+
+    @staticmethod
+    def key(rhoC: float, regime: int, span, integrator: int=3,
+            **options) -> str:
+        """
+        Returns the key of a star, a hash of everything its radius and mass
+        depend on. `options` are those passed to `whiteDwarf.integrate`;
+        `backend` and `store` do not change the results and are left out.
+        A table of `modules.eos` as the regime is described by its hash.
+        """
+        options = {k: v for k, v in options.items()
+                   if k not in ("backend", "store")}
+        regime = "eosTable:" + regime.key if isinstance(
+            regime, eos.eosTable) else int(regime)
+        desc = json.dumps([repr(float(rhoC)), regime, _gridKey(span),
+                           int(integrator), sorted(
+                               (k, repr(v)) for k, v in options.items()),
+                           codeVersion()])
+        return hashlib.sha256(desc.encode()).hexdigest()
+
+    def get(self, key: str):
+        """
+        Returns the `(Radius, Mass)` stored under `key`, or None.
+        """
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        file = os.path.join(self.path, key + ".json")
+        try:
+            with open(file) as f:
+                value = tuple(json.load(f))
+            # mark as recently used for the eviction
+            os.utime(file)
+        except (OSError, ValueError):
+            return None
+        self._remember(key, value)
+        return value
+
+    def put(self, key: str, value: tuple) -> None:
+        """
+        Stores `(Radius, Mass)` under `key` in both tiers.
+        """
+        value = (float(value[0]), float(value[1]))
+        self._remember(key, value)
+        data = json.dumps(value).encode()
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, os.path.join(self.path, key + ".json"))
+        except OSError:
+            # a full or read-only disk only costs the disk tier
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        self._written += len(data)
+        # check the size every so often rather than on every write
+        if self._written > self.maxBytes//16:
+            self._written = 0
+            self.evict()
+
+    def _remember(self, key: str, value: tuple) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memorySize:
+            self._memory.popitem(last=False)
+
+    def evict(self) -> None:
+        """
+        Deletes the least recently used files of the disk tier until it is
+        below 3/4 of `maxBytes`, if it is above `maxBytes`, and the temporary
+        files left by writes which were interrupted.
+        """
+        entries = []
+        # a write takes far less than this, older temporary files are stale
+        stale = time.time() - 3600
+        for entry in os.scandir(self.path):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if entry.name.endswith(".tmp"):
+                if stat.st_mtime < stale:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+                continue
+            if not entry.name.endswith(".json"):
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(e[1] for e in entries)
+        if total <= self.maxBytes:
+            return
+        entries.sort()
+        for _, size, file in entries:
+            try:
+                os.remove(file)
+            except OSError:
+                # another process got there first
+                pass
+            total -= size
+            if total <= 3*self.maxBytes//4:
+                break
+
+    def radiusMass(self, rhoC, regime: int, span, integrator: int=3,
+                   **options) -> tuple:
+        """
+        Returns the radius and mass of the white dwarfs of central densities
+        `rhoC`, integrating only the ones not in the cache; these are
+        integrated together as an ensemble, or one at a time by the adaptive
+        and multistep integrators which do not support ensembles, and then
+        stored.
+
+        Parameters
+        ----------
+        rhoC : float or np.ndarray
+            The central density in kg*m^(-3), or an array of them.
+        regime : {1, 2, 3} or modules.eos.eosTable
+            The equation of state, as in `modules.whiteDwarf`.
+        span : np.ndarray or modules.grids.baseGrid
+            The integration grid.
+        integrator : int, optional
+            The integrator, by default RK4.
+        **options
+            Passed on to `whiteDwarf.integrate`, e.g. `surface=True`.
+
+        Returns
+        -------
+        tuple
+            `(Radius, Mass)` as `whiteDwarf.getRadiusMass`.
+        """
+        from .whiteDwarf import whiteDwarf
+
+        rho = np.atleast_1d(np.asarray(rhoC, dtype=float))
+        keys = [self.key(r, regime, span, integrator, **options) for r in rho]
+        radius = np.empty(rho.size)
+        mass = np.empty(rho.size)
+        missing = []
+        for k, key in enumerate(keys):
+            value = self.get(key)
+            if value is None:
+                missing.append(k)
+            else:
+                radius[k], mass[k] = value
+        self.hits += rho.size - len(missing)
+        self.misses += len(missing)
+
+        single = integrator in integrators.adaptive or isinstance(
+            integrators.index.get(integrator), type)
+        batches = [[k] for k in missing] if single else [missing]
+        for batch in batches:
+            if not batch:
+                continue
+            batch = np.array(batch)
+            rhoNew = rho[batch] if len(batch) > 1 else rho[batch[0]]
+            star = whiteDwarf(rhoNew, span, regime)
+            star.integrate(integrator, **options)
+            radius[batch], mass[batch] = star.getRadiusMass()
+            for k in batch:
+                self.put(keys[k], (radius[k], mass[k]))
+
+        if np.ndim(rhoC) == 0:
+            return float(radius[0]), float(mass[0])
+        return radius, mass
+
+_default = None
+
+def default() -> starCache:
+    """
+    Returns the cache of this process in the default directory, created on
+    the first call; each worker of a pool gets its own.
+    """
+    global _default
+    if _default is None:
+        _default = starCache()
+    return _default
+
+if __name__=="__main__":
+    print(
+        "This file contains the cache of computed white dwarfs.")
@@ -0,0 +1,413 @@
+"""
+Sweep Cluster(`cluster.py`)
+===========================
+
+This is a home to the pool of a sweep spread over several machines. The
+process running the sweep, e.g. `main.py --serve`, becomes a coordinator
+listening on a TCP port, and any number of workers, started with
+`sweepWorker.py` on this or other machines, connect to it and ask for tasks.
+The coordinator has the interface of `modules.sweep.workerPool`, so that
+`sweep.run`, `sweep.runMany`, `sweep.refine` and `convergence.py` use it
+unchanged, and the results end up in the usual sinks and tables.
+
+Classes
+-------
+clusterPool     The coordinator, a pool whose workers connect over TCP.
+
+Functions
+---------
+work            Runs a worker until the coordinator stops it.
+parseAddress    Splits "host:port" into the address of a socket.
+authKey         The key of the connections, given, from the environment or new.
+
+Implementation Notes
+--------------------
+The connections are those of `multiprocessing.connection`, authenticated by a
+shared key and carrying pickled messages:
+
+    worker       coordinator
+    ------       -----------
+                 ("hello", mainName)
+    ("ready",)   ("task", id, payload), ("wait",) or ("stop",)
+    ("beat",)
+    ("result", id, result) or ("error", id, traceback)
+
+A worker sends a heartbeat every `interval` s while it runs a task, and asks
+again every `interval` s while there is none, so that a silent connection means
+a dead worker. The coordinator gives a worker `timeout` s; one which does not
+make it in time, or whose connection drops, is dropped and its task is put back
+in the queue for another. A result which comes back twice is kept once. A sweep
+left without any worker, and so without any task running, for `patience` s is
+given up with an exception rather than waited on forever. An exception raised
+by a task is sent back as its traceback and raised by `imap`, as by
+`multiprocessing.Pool`.
+
+Unpickling a message can run any code, so that anyone holding the key can
+run code on the coordinator and the workers. There is no built-in key: it is
+given, taken from `WHITEDWARF_AUTHKEY`, or made up at random by the
+coordinator, which prints it for the workers; a worker refuses to start
+without one. The coordinator listens on localhost unless a host is given,
+e.g. `0.0.0.0:5050` for all interfaces, which should only be done on a trusted
+network.
+
+Tasks are pickled by the coordinator: the functions by reference, so that
+the workers need the same code and have to run from the same directory. A
+function of the script running the sweep pickles as `__main__.name`; the
+workers import the script by the name sent in the greeting instead.
+"""
+
+import heapq
+import importlib
+import io
+import itertools
+import os
+import pickle
+import queue
+import secrets
+import sys
+import threading
+import time
+import traceback
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+# the variable of the environment holding the key of the connections
+keyVariable = "WHITEDWARF_AUTHKEY"
+
+def parseAddress(text: str) -> tuple:
+    """
+    Splits `"host:port"` into the address `(host, port)`; an empty host, as
+    in `":5050"` or `"5050"`, is localhost.
+    """
+    host, _, port = text.rpartition(":")
+    return host or "localhost", int(port)
+
+def authKey(authkey: str=None, generate: bool=False) -> str:
+    """
+    The key shared by the coordinator and the workers: `authkey` if given,
+    otherwise that of `WHITEDWARF_AUTHKEY`.
+
+    Parameters
+    ----------
+    authkey : str, optional
+        The key, by default taken from the environment.
+    generate : bool, optional
+        Whether to make up a random key when there is none, printed to
+        stderr for the workers; by default False.
+
+    Returns
+    -------
+    str
+        The key.
+
+    Raises
+    ------
+    ValueError
+        If there is no key and none is to be generated.
+    """
+    authkey = authkey or os.environ.get(keyVariable)
+    if authkey:
+        return authkey
+    if not generate:
+        raise ValueError("No key for the connections: give one or set "
+                         "{}".format(keyVariable))
+    authkey = secrets.token_hex(16)
+    print("Start the workers with {}={}".format(keyVariable, authkey),
+          file=sys.stderr)
+    return authkey
+
+class clusterPool(object):
+    """
+    A pool of workers connecting over TCP, with a single queue of tasks handed
+    out longest first, look at `modules.sweep.workerPool`.
+
+    Parameters
+    ----------
+    address : tuple
+        The `(host, port)` to listen on, look at `parseAddress`.
+    authkey : str, optional
+        The key shared with the workers, by default `WHITEDWARF_AUTHKEY` of
+        the environment or a random one, printed; look at `authKey`.
+    interval : float, optional
+        The time between the heartbeats of the workers in s, by default 5.
+    timeout : float, optional
+        The time without news after which a worker is taken to be dead and
+        its task given to another, by default 30 s.
+    patience : float, optional
+        The time without any worker connected after which `imap` gives up,
+        long enough to start the workers by hand, by default 600 s.
+
+    Attributes
+    ----------
+    processes : int
+        The number of workers connected.
+    requeued : int
+        The number of tasks taken from dead workers and handed out again.
+    """
+
+    def __init__(self, address: tuple, authkey: str=None,
+                 interval: float=5.0, timeout: float=30.0,
+                 patience: float=600.0) -> None:
+        self.address = address
+        self.interval = interval
+        self.timeout = timeout
+        self.patience = patience
+        self.requeued = 0
+        authkey = authKey(authkey, generate=True)
+        self._listener = Listener(address, authkey=authkey.encode())
+        self._lock = threading.Lock()
+        # the queue of (-cost, id) and the payloads of the tasks not done
+        self._queue = []
+        self._payloads = {}
+        # finished tasks come back through here as (id, ok, value)
+        self._results = queue.Queue()
+        self._workers = {}
+        # since when there has been no worker
+        self._idle = time.monotonic()
+        self._ids = itertools.count()
+        self._stopping = False
+        # the script running the sweep, imported by the workers in its place
+        main = sys.modules["__main__"]
+        self._mainName = (os.path.splitext(os.path.basename(main.__file__))[0]
+                          if getattr(main, "__file__", None) else None)
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    @property
+    def processes(self) -> int:
+        return len(self._workers)
+
+    def _accept(self) -> None:
+        # a thread serving every worker which connects
+        while not self._stopping:
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                # closed, or a connection with the wrong key
+                continue
+            threading.Thread(target=self._serve, args=(conn,),
+                             daemon=True).start()
+
+    def _serve(self, conn) -> None:
+        # talks to one worker until it is stopped, dies or goes silent
+        worker = object()
+        running = None
+        with self._lock:
+            self._workers[worker] = conn
+        try:
+            conn.send(("hello", self._mainName))
+            while conn.poll(self.timeout):
+                message = conn.recv()
+                if message[0] == "ready":
+                    running = None
+                    reply = self._next()
+                    if reply[0] == "task":
+                        running = reply[1]
+                    conn.send(reply)
+                    if reply[0] == "stop":
+                        return
+                elif message[0] in ("result", "error"):
+                    _, k, value = message
+                    running = None
+                    with self._lock:
+                        fresh = self._payloads.pop(k, None) is not None
+                    if fresh:
+                        self._results.put((k, message[0] == "result", value))
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self._lock:
+                del self._workers[worker]
+                if not self._workers:
+                    self._idle = time.monotonic()
+                # the task of a worker lost in the middle of it goes back
+                if running is not None and running in self._payloads:
+                    heapq.heappush(self._queue,
+                                   (self._payloads[running][0], running))
+                    self.requeued += 1
+            conn.close()
+
+    def _next(self) -> tuple:
+        # the reply to a worker asking for work
+        with self._lock:
+            while self._queue:
+                _, k = heapq.heappop(self._queue)
+                # skip the copies of a task which was requeued and done since
+                if k in self._payloads:
+                    return ("task", k, self._payloads[k][1])
+        return ("stop",) if self._stopping else ("wait",)
+
+    def imap(self, func, tasks: list, costs=None):
+        """
+        Applies `func` to each of `tasks` in the workers, handing out the
+        tasks in order of decreasing `costs` if given.
+
+        Yields
+        ------
+        tuple
+            `(k, result)` for the k-th task, in whichever order they finish.
+
+        Raises
+        ------
+        RuntimeError
+            If a task raised an exception in its worker, with its traceback,
+            or there has been no worker for `patience` s.
+        """
+        ids = {}
+        with self._lock:
+            for k, arg in enumerate(tasks):
+                i = next(self._ids)
+                ids[i] = k
+                cost = -float(costs[k]) if costs is not None else 0.0
+                self._payloads[i] = (cost, pickle.dumps((func, arg)))
+                heapq.heappush(self._queue, (cost, i))
+        left = len(ids)
+        try:
+            while left:
+                try:
+                    i, ok, value = self._results.get(timeout=self.interval)
+                except queue.Empty:
+                    # nothing runs without a worker, and none is coming
+                    with self._lock:
+                        idle = (not self._workers and
+                                time.monotonic() - self._idle > self.patience)
+                    if idle:
+                        raise RuntimeError(
+                            "No workers for {:g} s, with {} tasks left".format(
+                                self.patience, left))
+                    continue
+                if i not in ids:
+                    # left over from an earlier imap which was abandoned
+                    continue
+                if not ok:
+                    raise RuntimeError(
+                        "A task failed in a worker:\n{}".format(value))
+                left -= 1
+                yield ids[i], value
+        finally:
+            # the tasks not handed out yet are dropped with the generator
+            with self._lock:
+                for i in ids:
+                    self._payloads.pop(i, None)
+
+    def close(self) -> None:
+        """
+        Stops the workers as they ask for more work and closes the port.
+        """
+        self._stopping = True
+        deadline = time.monotonic() + 2*self.interval
+        while self._workers and time.monotonic() < deadline:
+            time.sleep(0.1)
+        self._listener.close()
+
+    def __enter__(self) -> "clusterPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+class _unpickler(pickle.Unpickler):
+    # loads the functions of the coordinator's script from its module
+    def __init__(self, data: bytes, mainName: str) -> None:
+        super(_unpickler, self).__init__(io.BytesIO(data))
+        self.mainName = mainName
+
+    def find_class(self, module: str, name: str):
+        if module == "__main__" and self.mainName:
+            return getattr(importlib.import_module(self.mainName), name)
+        return super(_unpickler, self).find_class(module, name)
+
+def work(address: tuple, authkey: str=None, interval: float=5.0,
+         patience: float=60.0) -> int:
+    """
+    Runs a worker: connects to the coordinator at `address` and runs the
+    tasks it hands out until it is stopped or goes away.
+
+    Parameters
+    ----------
+    address : tuple
+        The `(host, port)` of the coordinator.
+    authkey : str, optional
+        The key shared with the coordinator, by default `WHITEDWARF_AUTHKEY`
+        of the environment.
+    interval : float, optional
+        The time between heartbeats in s, which has to be that of the
+        coordinator, by default 5.
+    patience : float, optional
+        How long to keep trying to connect in s, so that the workers can be
+        started before the coordinator, by default 60.
+
+    Returns
+    -------
+    int
+        The number of tasks run.
+
+    Raises
+    ------
+    ValueError
+        If there is no key, look at `authKey`.
+    ConnectionRefusedError
+        If there is no coordinator at the address after `patience` s.
+    """
+    authkey = authKey(authkey)
+    deadline = time.monotonic() + patience
+    while True:
+        try:
+            conn = Client(address, authkey=authkey.encode())
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(1.0)
+
+    _, mainName = conn.recv()
+    sendLock = threading.Lock()
+    done = 0
+
+    def send(message):
+        with sendLock:
+            conn.send(message)
+
+    try:
+        while True:
+            send(("ready",))
+            message = conn.recv()
+            if message[0] == "stop":
+                return done
+            if message[0] == "wait":
+                time.sleep(interval)
+                continue
+            _, k, payload = message
+            # beat while the task runs, until it is done
+            finished = threading.Event()
+
+            def beat():
+                while not finished.wait(interval):
+                    send(("beat",))
+            beater = threading.Thread(target=beat, daemon=True)
+            beater.start()
+            try:
+                func, arg = _unpickler(payload, mainName).load()
+                reply = ("result", k, func(arg))
+            except Exception:
+                reply = ("error", k, traceback.format_exc())
+            finally:
+                finished.set()
+                beater.join()
+            try:
+                send(reply)
+            except OSError:
+                raise
+            except Exception:
+                # a result which cannot be pickled
+                send(("error", k, traceback.format_exc()))
+            done += 1
+    except (EOFError, OSError):
+        # the coordinator went away
+        return done
+    finally:
+        conn.close()
+
+if __name__=="__main__":
+    print(
+        "This file contains the coordinator and workers of a sweep run on "
+        "several machines.")
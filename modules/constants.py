@@ -0,0 +1,93 @@
+"""
+Physical Constants(`constants.py`)
+==================================
+
+This is a home to the physical constants used by the package, as plain floats
+in SI units. They used to be read from `scipy.constants` and
+`astropy.constants`, whose imports take most of a second; with the table here
+`import modules` needs NumPy only, which matters for every worker process
+started by a sweep.
+
+Constants
+---------
+pi                      The ratio of a circle's circumference to its diameter.
+gravitational_constant  G in m^3*kg^(-1)*s^(-2).
+electron_mass           In kg.
+proton_mass             In kg.
+h                       The Planck constant in J*s.
+c                       The speed of light in vacuum in m*s^(-1).
+M_sun                   The nominal solar mass in kg.
+
+Functions
+---------
+check       Compares the table with scipy and astropy, where installed.
+
+Implementation Notes
+--------------------
+The values are those of CODATA 2022, as in scipy 1.15 and astropy 7, and the
+IAU 2015 nominal solar mass `GM_sun/G`. They are written out to all digits,
+so that they are bit for bit the floats of the libraries and the results do
+not change. Running this file checks them against the installed libraries, to
+within `tolerance`: a few times the relative uncertainty of each constant in
+the CODATA releases since 2014, so that a library following another release
+agrees while a wrong digit does not; `h` and `c` are exact in the SI since
+2019, and the solar mass inherits the uncertainty of G.
+"""
+
+import math
+
+pi = math.pi
+gravitational_constant = 6.6743e-11
+electron_mass = 9.1093837139e-31
+proton_mass = 1.67262192595e-27
+h = 6.62607015e-34
+c = 299792458.0
+M_sun = 1.988409870698051e+30
+
+# the relative differences allowed by `check`, by constant
+tolerance = {"pi": 0.0, "gravitational_constant": 1e-4, "electron_mass": 1e-7,
+             "proton_mass": 1e-7, "h": 1e-7, "c": 0.0, "M_sun": 1e-4}
+
+def check() -> dict:
+    """
+    Compares the constants with those of `scipy.constants` and
+    `astropy.constants`, the libraries which are installed, to within the
+    relative `tolerance` of each.
+
+    Returns
+    -------
+    dict
+        The constants which differ by more, by `"library.name"`, as tuples of
+        the value here and the value of the library; empty if all agree.
+    """
+    # the pairs of values by key, and the name of the constant here by key
+    pairs, names = {}, {}
+    try:
+        from scipy import constants as cs
+        for name in ("pi", "gravitational_constant", "electron_mass",
+                     "proton_mass", "h", "c"):
+            pairs["scipy." + name] = (globals()[name], getattr(cs, name))
+            names["scipy." + name] = name
+    except ImportError:
+        pass
+    try:
+        from astropy import constants as ac
+        for name, other in (("gravitational_constant", "G"),
+                            ("electron_mass", "m_e"), ("proton_mass", "m_p"),
+                            ("h", "h"), ("c", "c"), ("M_sun", "M_sun")):
+            pairs["astropy." + other] = (globals()[name],
+                                         float(getattr(ac, other).value))
+            names["astropy." + other] = name
+    except ImportError:
+        pass
+    return {key: pair for key, pair in pairs.items()
+            if not math.isclose(*pair, rel_tol=tolerance[names[key]])}
+
+if __name__=="__main__":
+    print(
+        "This file contains the physical constants of the package.")
+    differ = check()
+    for key, (ours, theirs) in differ.items():
+        print("{}: {!r} here, {!r} in the library".format(key, ours, theirs))
+    print("All constants agree" if not differ else
+          "{} constants differ".format(len(differ)))
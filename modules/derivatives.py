@@ -9,6 +9,10 @@ White Dwarf Functions
 ---------------------
 nonRelativGas       Implements the eqn. of state for non-relativistic electrons
 relaitvGas          Implements the eqn. of state for relativistic electrons.
+ultraRel            Implements the eqn. of state for ultra-relativistic
+                    electrons.
+tabulatedGas        Implements an eqn. of state given as a table of
+                    `modules.eos`.
 
 Testing Functions
 -----------------
@@ -18,11 +22,17 @@ Implementation Notes
 --------------------
 Choice of an equation of state for the white dwarf is aided by the dictionary
 `index`, mapping integer values to the integrator functions.
+
+All of the functions accept an optional `out` array, into which the derivative
+is written instead of a newly allocated array; this is used by the in-place
+integrators of `modules.integrators`.
 """
 
 import numpy as np
 
-def SHO(x: float, y: np.ndarray) -> np.ndarray:
+from . import eos
+
+def SHO(x: float, y: np.ndarray, out: np.ndarray=None) -> np.ndarray:
     """
     Function of the derivative for the simple harmonic oscillator written as a
     system of linear ODEs.
@@ -34,6 +44,8 @@ def SHO(x: float, y: np.ndarray) -> np.ndarray:
     y : np.ndarray
         Value of the dependent variable in the ODE. Two element vector
         `[z', z]`, where the SHO ODE is `z''(x) + z(x) = 0`.
+    out : np.ndarray, optional
+        Array to write the derivative into instead of a new one.
 
     Returns
     -------
@@ -45,9 +57,14 @@ def SHO(x: float, y: np.ndarray) -> np.ndarray:
     The equation `z''(x) + z(x) = 0` is written using `p = z'` in the form:
     `y' = [p, z]' = [-z, p]`. The function returns the latter vector.
     """
-    return np.array([-4*np.pi*np.pi*y[1], y[0]])
+    if out is None:
+        return np.array([-4*np.pi*np.pi*y[1], y[0]])
+    out[0] = -4*np.pi*np.pi*y[1]
+    out[1] = y[0]
+    return out
 
-def nonRelativGas(x: float, y: np.ndarray, const: float) -> np.ndarray:
+def nonRelativGas(x: float, y: np.ndarray, const: float,
+                  floor: float=1e-10, out: np.ndarray=None) -> np.ndarray:
     """
     Function for the coupled ODE using a non-relativistic equation of state.
 
@@ -61,9 +78,17 @@ def nonRelativGas(x: float, y: np.ndarray, const: float) -> np.ndarray:
     x : float
         Value of the independent variable in the ODE.
     y : np.ndarray
-        Value of the dependent variable in the ODE. *Two elements only.*
-    const: float
-        The scaling constant used in the definition. 
+        Value of the dependent variable in the ODE. *Two elements only*, or an
+        `(N, 2)` array holding the state of an ensemble of N stars.
+    const: float or np.ndarray
+        The scaling constant used in the definition. For an ensemble, an array
+        of the N per-member constants.
+    floor : float, optional
+        The density below which the derivative is not evaluated. A negative
+        value lets the solution run past the surface, look at Notes.
+    out : np.ndarray, optional
+        Array of the shape of `y` to write the derivative into instead of a
+        new one, look at `modules.integrators`.
 
     Returns
     -------
@@ -74,26 +99,47 @@ def nonRelativGas(x: float, y: np.ndarray, const: float) -> np.ndarray:
     Raises
     ------
     ValueError
-        If the value `y[0]` < 0, the computation is discarded on physical 
+        If the value `y[0]` < `floor`, the computation is discarded on physical 
         grounds - cannot have negative matter density. Raises an exception
         propagated by the integrator to be handled in the .integration method.
+        For an ensemble nothing is raised; the derivative of the offending
+        members is set to NaN instead.
     
     Notes
     -----
     The functional form is determined by the equation of state in the
     non-relativistic case, where `pressure = someConst * rho^(2/3)`.The final
     form: `[rho, m]' = [const1*m*rho^(1/3)/x^2, 3*x^2*rho]`.
+
+    For `rho < 0` the powers of the density are taken of `|rho|`, so that
+    `rho' < 0` carries on and the solution crosses `rho = 0` at the surface
+    (an odd extension would push it back to zero and never cross). This is
+    used to locate the surface as an event within a step.
     """
     
-    # need y[0] >= 0 to be exponentiated apart from physical grounds
-    # this catches the moment y[0] becomes too small - only it is on the
-    # computation of the following value
-    if y[0] < 1e-10:
+    if y.ndim > 1:
+        # ensemble of stars - members past their surface are flagged by NaN
+        # instead of an exception, so that the rest can carry on
+        rho = np.where(y[:, 0] < floor, np.nan, y[:, 0])
+        if out is None:
+            out = np.empty_like(y)
+        out[:, 0] = const*y[:, 1]*(np.abs(rho)**(1.0/3))*(x**(-2.0))
+        out[:, 1] = 3*(x**2)*rho
+        return out
+
+    # this catches the moment y[0] becomes too small on physical grounds -
+    # only it is on the computation of the following value
+    if y[0] < floor:
         raise ValueError
-    return  np.array([const*y[1]*(y[0]**(1.0/3))*(x**(-2.0)), 
-                        3*(x**2)*y[0]])
+    if out is None:
+        return  np.array([const*y[1]*(abs(y[0])**(1.0/3))*(x**(-2.0)), 
+                            3*(x**2)*y[0]])
+    out[0] = const*y[1]*(abs(y[0])**(1.0/3))*(x**(-2.0))
+    out[1] = 3*(x**2)*y[0]
+    return out
 
-def relativGas(x: float, y: np.ndarray, const1: float ,const2: float) -> np.ndarray:
+def relativGas(x: float, y: np.ndarray, const1: float ,const2: float,
+               floor: float=1e-10, out: np.ndarray=None) -> np.ndarray:
     """
     Function for the coupled ODE using a relativistic equation of state.
 
@@ -108,11 +154,19 @@ def relativGas(x: float, y: np.ndarray, const1: float ,const2: float) -> np.ndar
     x : float
         Value of the independent variable in the ODE.
     y : np.ndarray
-        Value of the dependent variable in the ODE. *Two elements only.*
-    const1: float
-        One of the scaling constants, used in the derivative of rho.
-    const2 : float
+        Value of the dependent variable in the ODE. *Two elements only*, or an
+        `(N, 2)` array holding the state of an ensemble of N stars.
+    const1: float or np.ndarray
+        One of the scaling constants, used in the derivative of rho. For an
+        ensemble, an array of the N per-member constants.
+    const2 : float or np.ndarray
         The second scaling constant, used in the relativistic correction.
+    floor : float, optional
+        The density below which the derivative is not evaluated. A negative
+        value lets the solution run past the surface, look at Notes.
+    out : np.ndarray, optional
+        Array of the shape of `y` to write the derivative into instead of a
+        new one, look at `modules.integrators`.
 
     Returns
     -------
@@ -123,9 +177,11 @@ def relativGas(x: float, y: np.ndarray, const1: float ,const2: float) -> np.ndar
     Raises
     ------
     ValueError
-        If the value `y[0]` < 0, the computation is discarded on physical 
+        If the value `y[0]` < `floor`, the computation is discarded on physical 
         grounds - cannot have negative matter density. Raises an exception
         propagated by the integrator to be handled in the .integration method.
+        For an ensemble nothing is raised; the derivative of the offending
+        members is set to NaN instead.
 
     Notes
     -----
@@ -133,18 +189,165 @@ def relativGas(x: float, y: np.ndarray, const1: float ,const2: float) -> np.ndar
     relativistic case, where `pressure = someConst*rho^(2/3)*relCorr`.The
     relativistic correction is `relCorr = sqrt(1+const2*rho^(2/3))^(-1)`.
     The final form: `[rho, m]' = [const1*m*rho^(1/3)*relCorr/x^2, 3*x^2*rho]`.
+
+    For `rho < 0` the powers of the density are taken of `|rho|`, look at
+    `nonRelativGas`.
+    """
+
+    if y.ndim > 1:
+        # ensemble of stars, look at nonRelativGas
+        rho = np.where(y[:, 0] < floor, np.nan, y[:, 0])
+        if out is None:
+            out = np.empty_like(y)
+        out[:, 0] = const1*y[:, 1]*(np.abs(rho)**(1.0/3))*(x**(-2.0))*\
+                        (1+const2*(np.abs(rho)**(2.0/3)))**(0.5)
+        out[:, 1] = 3*(x**2)*rho
+        return out
+
+    # this catches the moment y[0] becomes too small on physical grounds -
+    # only it is on the computation of the following value
+    if y[0] < floor:
+        raise ValueError
+
+    if out is None:
+        return np.array([const1*y[1]*(abs(y[0])**(1.0/3))*(x**(-2.0))*
+                            (1+const2*(abs(y[0])**(2.0/3)))**(0.5), 3*(x**2)*y[0]])
+    out[0] = const1*y[1]*(abs(y[0])**(1.0/3))*(x**(-2.0))*\
+                (1+const2*(abs(y[0])**(2.0/3)))**(0.5)
+    out[1] = 3*(x**2)*y[0]
+    return out
+
+def ultraRel(x: float, y: np.ndarray, const: float,
+             floor: float=1e-10, out: np.ndarray=None) -> np.ndarray:
+    """
+    Function for the coupled ODE using an ultra-relativistic equation of state.
+
+    Function of the derivative for the system of coupled equations
+    `y = [rho, m](x)` in the limit of the relativistic case where all of the
+    electrons are ultra-relativistic, i.e. `const2*rho^(2/3) >> 1`. This is a
+    polytrope of index 3. The additional argument `const` is the product
+    `const1*sqrt(const2)` of the constants in `relativGas`.
+
+    Parameters
+    ----------
+    x : float
+        Value of the independent variable in the ODE.
+    y : np.ndarray
+        Value of the dependent variable in the ODE. *Two elements only*, or an
+        `(N, 2)` array holding the state of an ensemble of N stars.
+    const: float or np.ndarray
+        The scaling constant used in the definition. For an ensemble, an array
+        of the N per-member constants.
+    floor : float, optional
+        The density below which the derivative is not evaluated. A negative
+        value lets the solution run past the surface, look at
+        `nonRelativGas`.
+    out : np.ndarray, optional
+        Array of the shape of `y` to write the derivative into instead of a
+        new one, look at `modules.integrators`.
+
+    Returns
+    -------
+    np.ndarray
+        The value of the derivative at (x, y). Look at Notes for info on the
+        functional form.
+
+    Raises
+    ------
+    ValueError
+        If the value `y[0]` < `floor`. For an ensemble nothing is raised; the
+        derivative of the offending members is set to NaN instead.
+
+    Notes
+    -----
+    The functional form is determined by the equation of state in the
+    ultra-relativistic case, where `pressure = someConst*rho^(1/3)`. The final
+    form: `[rho, m]' = [const*m*rho^(2/3)/x^2, 3*x^2*rho]`.
+    """
+
+    if y.ndim > 1:
+        # ensemble of stars, look at nonRelativGas
+        rho = np.where(y[:, 0] < floor, np.nan, y[:, 0])
+        if out is None:
+            out = np.empty_like(y)
+        out[:, 0] = const*y[:, 1]*(np.abs(rho)**(2.0/3))*(x**(-2.0))
+        out[:, 1] = 3*(x**2)*rho
+        return out
+
+    if y[0] < floor:
+        raise ValueError
+
+    if out is None:
+        return np.array([const*y[1]*(abs(y[0])**(2.0/3))*(x**(-2.0)),
+                            3*(x**2)*y[0]])
+    out[0] = const*y[1]*(abs(y[0])**(2.0/3))*(x**(-2.0))
+    out[1] = 3*(x**2)*y[0]
+    return out
+
+def tabulatedGas(x: float, y: np.ndarray, table, rhoC, floor: float=1e-10,
+                 out: np.ndarray=None) -> np.ndarray:
+    """
+    Function for the coupled ODE using a tabulated equation of state.
+
+    Parameters
+    ----------
+    x : float
+        Value of the independent variable in the ODE.
+    y : np.ndarray
+        Value of the dependent variable in the ODE. *Two elements only*, or an
+        `(N, 2)` array holding the state of an ensemble of N stars.
+    table : modules.eos.eosTable
+        The equation of state.
+    rhoC : float or np.ndarray
+        The central density in kg*m^(-3), which scales the normalized density
+        to the one looked up in the table. For an ensemble, an array of the N
+        per-member densities.
+    floor : float, optional
+        The density below which the derivative is not evaluated, look at
+        `nonRelativGas`.
+    out : np.ndarray, optional
+        Array of the shape of `y` to write the derivative into instead of a
+        new one, look at `modules.integrators`.
+
+    Returns
+    -------
+    np.ndarray
+        The value of the derivative at (x, y). Look at Notes for info on the
+        functional form.
+
+    Raises
+    ------
+    ValueError
+        If the value `y[0]` < `floor`. For an ensemble nothing is raised; the
+        derivative of the offending members is set to NaN instead.
+
+    Notes
+    -----
+    The final form: `[rho, m]' = [scale*m*q(rhoC*rho)/x^2, 3*x^2*rho]`, with
+    `q = rho/(dP/drho)` interpolated in the table and `scale` the constant of
+    `modules.eos`. The density is looked up as `|rho|` past the surface, as
+    in `nonRelativGas`.
     """
+    if y.ndim > 1:
+        # ensemble of stars, look at nonRelativGas
+        rho = np.where(y[:, 0] < floor, np.nan, y[:, 0])
+        if out is None:
+            out = np.empty_like(y)
+        out[:, 0] = eos.scale*y[:, 1]*table.q(rhoC*np.abs(rho))*(x**(-2.0))
+        out[:, 1] = 3*(x**2)*rho
+        return out
 
-    # need y[0] >= 0 to be exponentiated apart from physical grounds
-    # this catches the moment y[0] becomes too small - only it is on the
-    # computation of the following value
-    if y[0] < 1e-10:
+    if y[0] < floor:
         raise ValueError
 
-    return np.array([const1*y[1]*(y[0]**(1.0/3))*(x**(-2.0))*
-                        (1+const2*(y[0]**(2.0/3)))**(0.5), 3*(x**2)*y[0]])
+    if out is None:
+        return np.array([eos.scale*y[1]*table.q(rhoC*abs(y[0]))*(x**(-2.0)),
+                            3*(x**2)*y[0]])
+    out[0] = eos.scale*y[1]*table.q(rhoC*abs(y[0]))*(x**(-2.0))
+    out[1] = 3*(x**2)*y[0]
+    return out
 
-index = {1: nonRelativGas, 2: relativGas}
+index = {1: nonRelativGas, 2: relativGas, 3: ultraRel}
 
 if __name__=="__main__":
     print(
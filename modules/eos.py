@@ -0,0 +1,258 @@
+"""
+Tabulated Equation of State(`eos.py`)
+=====================================
+
+This is a home to the equations of state given as tables rather than in the
+analytic forms of `modules.derivatives`. A table holds `dP/drho` on points of
+`log(rho)`, generated from one of the analytic regimes or loaded from a file,
+and is passed to `modules.whiteDwarf` in place of the regime number. The cost
+of an evaluation of the derivative is then a lookup and a cubic, whatever the
+equation of state behind the table, e.g. a composition other than `mu_e = 2`
+or a finite temperature.
+
+Classes
+-------
+eosTable        An equation of state tabulated in `log(rho)`.
+
+Functions
+---------
+fromRegime      Tabulates one of the analytic regimes of `modules.whiteDwarf`.
+load            Reads a table saved by `eosTable.save`.
+
+Implementation Notes
+--------------------
+With `rho = rhoC*theta`, `m = rhoC*mu` and `r = l*x` as in `whiteDwarf` the
+equation of hydrostatic equilibrium reads
+
+    `theta' = -(G/l)*mu*q(rhoC*theta)/x^2`,  `q(rho) = rho/(dP/drho)`,
+
+so that the central density only enters through the argument of `q`. The
+table interpolates `log(q)` against `log(rho)` by monotone cubic Hermite
+polynomials (Fritsch-Carlson), whose coefficients are computed once; the
+degenerate equations of state are nearly power laws, straight lines in these
+variables, and are interpolated to about 1e-9 with a few hundred points.
+Outside of the table `log(q)` is extended linearly, as a power law, which
+lets the density go to zero at the surface. On points equally spaced in
+`log(rho)` the interval is found by arithmetic, otherwise by bisection.
+"""
+
+import bisect
+import hashlib
+import math
+
+import numpy as np
+
+from . import constants as cs
+from . import results
+
+# the coefficient of q in the normalized derivative, -G/l with
+# l = (3/(4*pi))^(1/3), look at `modules.whiteDwarf`
+scale = -cs.gravitational_constant/(3/(4*cs.pi))**(1.0/3)
+
+class eosTable(object):
+    """
+    An equation of state tabulated as `dP/drho` on points of `log(rho)`.
+
+    Parameters
+    ----------
+    logRho : np.ndarray
+        The natural logarithm of the density in kg*m^(-3), increasing.
+    dPdRho : np.ndarray
+        The derivative of the pressure by the density at the points, in
+        m^2*s^(-2); positive.
+    name : str, optional
+        A description of the equation of state, kept with the table.
+
+    Attributes
+    ----------
+    key : str
+        A hash of the table, which identifies it in `modules.cache`.
+
+    Raises
+    ------
+    ValueError
+        If there are fewer than 2 points, the densities do not increase or
+        `dP/drho` is not positive.
+    """
+
+    def __init__(self, logRho: np.ndarray, dPdRho: np.ndarray,
+                 name: str="") -> None:
+        self.logRho = np.ascontiguousarray(logRho, dtype=float)
+        self.dPdRho = np.ascontiguousarray(dPdRho, dtype=float)
+        self.name = name
+        if self.logRho.ndim != 1 or self.logRho.shape != self.dPdRho.shape or \
+                self.logRho.size < 2:
+            raise ValueError("The table needs two 1D columns of 2 points or more")
+        if np.any(np.diff(self.logRho) <= 0):
+            raise ValueError("The densities of the table must increase")
+        if np.any(self.dPdRho <= 0):
+            raise ValueError("dP/drho must be positive")
+        self.key = hashlib.sha256(
+            self.logRho.tobytes() + self.dPdRho.tobytes()).hexdigest()[:16]
+
+        # log(q) = log(rho) - log(dP/drho) at the points, and its slopes
+        v = self.logRho - np.log(self.dPdRho)
+        h = np.diff(self.logRho)
+        delta = np.diff(v)/h
+        slope = _monotoneSlopes(h, delta)
+        # the cubic of every interval in t = log(rho) - logRho[i], by powers
+        c2 = (3*delta - 2*slope[:-1] - slope[1:])/h
+        c3 = (slope[:-1] + slope[1:] - 2*delta)/h**2
+        self._coef = np.stack([v[:-1], slope[:-1], c2, c3], axis=-1)
+        # by column as well, gathered one at a time in the array lookups
+        self._columns = [np.ascontiguousarray(a) for a in self._coef.T]
+        self._v, self._slope = v.tolist(), slope.tolist()
+        # equally spaced points are looked up without a bisection
+        self._step = h[0] if np.allclose(h, h[0], rtol=1e-12, atol=0) else None
+        # the same as lists, for the scalar lookups of a single star, which
+        # are several times faster in plain Python than through NumPy
+        self._nodes = self.logRho.tolist()
+        self._rows = self._coef.tolist()
+
+    def __repr__(self) -> str:
+        return "eosTable({!r}, {} points, key={})".format(
+            self.name, self.logRho.size, self.key)
+
+    def logQ(self, logRho):
+        """
+        The interpolated `log(rho/(dP/drho))` at `logRho`, a float or an
+        array; -inf at zero density.
+        """
+        if np.ndim(logRho) == 0:
+            return self._logQ(float(logRho))
+        lr = np.asarray(logRho, dtype=float)
+        last = self.logRho.size - 2
+        if self._step is not None:
+            # NaN, the flag of the finished members of an ensemble, and -inf
+            # give any interval, the result is fixed below
+            with np.errstate(invalid="ignore"):
+                i = ((lr - self.logRho[0])*(1/self._step)).astype(np.intp)
+        else:
+            i = np.searchsorted(self.logRho, lr) - 1
+        np.clip(i, 0, last, out=i)
+        t = lr - self.logRho.take(i)
+        c0, c1, c2, c3 = [a.take(i) for a in self._columns]
+        out = c0 + t*(c1 + t*(c2 + t*c3))
+        # a power law beyond the ends of the table
+        below, above = lr < self.logRho[0], lr > self.logRho[-1]
+        if np.any(below) or np.any(above):
+            out = np.where(below, self._v[0] + self._slope[0] *
+                           (lr - self.logRho[0]), out)
+            out = np.where(above, self._v[-1] + self._slope[-1] *
+                           (lr - self.logRho[-1]), out)
+        return out
+
+    def _logQ(self, lr: float) -> float:
+        # logQ of a single float
+        nodes = self._nodes
+        if lr < nodes[0]:
+            return self._v[0] + self._slope[0]*(lr - nodes[0])
+        if lr > nodes[-1]:
+            return self._v[-1] + self._slope[-1]*(lr - nodes[-1])
+        if self._step is not None:
+            i = int((lr - nodes[0])/self._step)
+        else:
+            i = bisect.bisect_right(nodes, lr) - 1
+        i = min(i, len(self._rows) - 1)
+        c0, c1, c2, c3 = self._rows[i]
+        t = lr - nodes[i]
+        return c0 + t*(c1 + t*(c2 + t*c3))
+
+    def q(self, rho):
+        """
+        The interpolated `rho/(dP/drho)` at the densities `rho`, a float or
+        an array; 0 at zero density.
+        """
+        if np.ndim(rho) == 0:
+            return math.exp(self._logQ(math.log(rho))) if rho > 0 else 0.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.exp(self.logQ(np.log(rho)))
+
+    def slope(self, rho):
+        """
+        The logarithmic derivative `dlog(q)/dlog(rho)` at the densities
+        `rho`, the local power of the equation of state.
+        """
+        lr = np.log(rho)
+        h = 1e-4*(self.logRho[-1] - self.logRho[0])/self.logRho.size
+        return (self.logQ(lr + h) - self.logQ(lr - h))/(2*h)
+
+    def save(self, path: str) -> str:
+        """
+        Writes the table with `modules.results.save`; returns its directory.
+        """
+        return results.save(path, {"logRho": self.logRho,
+                                   "dPdRho": self.dPdRho}, name=self.name)
+
+def _monotoneSlopes(h: np.ndarray, delta: np.ndarray) -> np.ndarray:
+    # the slopes of the Hermite interpolant by Fritsch and Carlson: the
+    # weighted harmonic mean of the secants either side of a point, zero at
+    # an extremum, so that the interpolant does not overshoot the data
+    slope = np.empty(h.size + 1)
+    slope[0], slope[-1] = delta[0], delta[-1]
+    w1, w2 = 2*h[1:] + h[:-1], h[1:] + 2*h[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inner = (w1 + w2)/(w1/delta[:-1] + w2/delta[1:])
+    slope[1:-1] = np.where(delta[:-1]*delta[1:] > 0, inner, 0.0)
+    return slope
+
+def fromRegime(regime: int, muE: float=2.0, rhoMin: float=1e-2,
+               rhoMax: float=1e20, points: int=1000) -> eosTable:
+    """
+    Tabulates one of the analytic equations of state of `modules.whiteDwarf`
+    on points equally spaced in `log(rho)`.
+
+    Parameters
+    ----------
+    regime : {1, 2, 3}
+        The non-relativistic, relativistic or ultra-relativistic regime.
+    muE : float, optional
+        The number of nucleons per electron, by default 2 as in the analytic
+        regimes, e.g. 2 for helium, carbon or oxygen and about 2.15 for iron.
+    rhoMin, rhoMax : float, optional
+        The range of densities of the table in kg*m^(-3).
+    points : int, optional
+        The number of points of the table, by default 1000.
+
+    Returns
+    -------
+    eosTable
+        The table of the equation of state.
+
+    Raises
+    ------
+    ValueError
+        If the regime is unknown.
+    """
+    from .whiteDwarf import constants
+
+    if regime not in (1, 2, 3):
+        raise ValueError("Unknown regime: {}".format(regime))
+    logRho = np.linspace(math.log(rhoMin), math.log(rhoMax), points)
+    # the electrons see the density of a mu_e = 2 gas of 2/muE times ours
+    rho = np.exp(logRho)*2.0/muE
+    # the constants of the derivative scale as rhoC^(1/3) and rhoC^(2/3),
+    # so at rhoC = 1 they give q as a function of the density
+    const1, const2 = constants(1.0)
+    q = rho**(1.0/3)*const1/scale
+    if regime == 2:
+        q *= (1 + const2*rho**(2.0/3))**0.5
+    elif regime == 3:
+        q *= const2**0.5*rho**(1.0/3)
+    # dP/drho of the mu_e = 2 gas, and of ours by the chain rule
+    dPdRho = rho/q*2.0/muE
+    return eosTable(logRho, dPdRho,
+                    "regime {}, mu_e = {:g}".format(regime, muE))
+
+def load(path: str) -> eosTable:
+    """
+    Reads a table written by `eosTable.save`, or any result table with the
+    columns `logRho` and `dPdRho`, look at `modules.results`.
+    """
+    table = results.load(path, mmap=False)
+    return eosTable(table["logRho"], table["dPdRho"],
+                    table.meta.get("name", ""))
+
+if __name__=="__main__":
+    print(
+        "This file contains the tabulated equations of state.")
@@ -0,0 +1,256 @@
+"""
+Grids Library(`grids.py`)
+=========================
+
+This is a home to the descriptions of the integration grid, the values of the
+independent variable `x` at which an ODE is computed. A grid is given by a few
+parameters and its points are computed on the fly, so that a grid of millions
+of points does not take any memory.
+
+Grids implemented
+-----------------
+
+    uniformGrid     Equidistant points given by start, step and count.
+    logGrid         Points equidistant in log(x) between start and stop.
+    piecewiseGrid   Uniform segments with different steps, e.g. dense near the
+                    centre of a star and sparse in the envelope.
+    arrayGrid       Wraps an explicit np.ndarray of points.
+
+Implementation notes
+--------------------
+All grids support `len`, indexing `grid[i]` (also with negative indices and
+arrays of indices) and `grid.size`, like the np.ndarray `span` used before,
+so either can be passed to `modules.ode.ODEinit`. The integrators iterate over
+`grid.steps()`, which yields `(x, h, xNext)` for every step without building
+the array of points. Use `asGrid` to turn an array into a grid.
+"""
+
+import numpy as np
+
+class baseGrid(object):
+    """
+    Base class of the grids. Subclasses define `size` and `_point(i)`, the
+    value of the i-th point for an integer or an array of non-negative `i`,
+    and may override `steps` with a faster iteration.
+
+    Attributes
+    ----------
+    size : int
+        The number of points in the grid.
+    """
+
+    size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, i):
+        if np.ndim(i):
+            i = np.asarray(i)
+            return self._point(np.where(i < 0, i + self.size, i))
+        if i < 0:
+            i += self.size
+        if not 0 <= i < self.size:
+            raise IndexError("Grid index out of range")
+        return self._point(i)
+
+    @property
+    def start(self) -> float:
+        """The first point of the grid."""
+        return self[0]
+
+    @property
+    def stop(self) -> float:
+        """The last point of the grid."""
+        return self[-1]
+
+    def stepSize(self, i: int) -> float:
+        """
+        Returns the size of the i-th step, from point i to point i + 1.
+        """
+        return self[i+1] - self[i]
+
+    def points(self) -> np.ndarray:
+        """
+        Returns all of the points as an array. Only for plots or checks, this
+        is what the grid avoids otherwise.
+        """
+        return self._point(np.arange(self.size))
+
+    def steps(self):
+        """
+        Iterates over the steps of the grid.
+
+        Yields
+        ------
+        tuple
+            `(x, h, xNext)` for each step, the start of the step, its size and
+            its end.
+        """
+        x = self._point(0)
+        for i in range(1, self.size):
+            xNext = self._point(i)
+            yield x, xNext - x, xNext
+            x = xNext
+
+    def _point(self, i):
+        raise NotImplementedError
+
+class uniformGrid(baseGrid):
+    """
+    Equidistant grid `x_i = start + i*step` for `i = 0, ..., count - 1`.
+
+    Parameters
+    ----------
+    start : float
+        The first point.
+    step : float
+        The distance between consecutive points.
+    count : int
+        The number of points.
+    """
+
+    def __init__(self, start: float, step: float, count: int) -> None:
+        self.x0 = float(start)
+        self.step = float(step)
+        self.size = int(count)
+
+    @classmethod
+    def linspace(cls, start: float, stop: float, num: int) -> "uniformGrid":
+        """
+        The grid with the same points as `np.linspace(start, stop, num)`.
+        """
+        return cls(start, (stop - start)/(num - 1), num)
+
+    def _point(self, i):
+        return self.x0 + i*self.step
+
+    def stepSize(self, i: int) -> float:
+        return self.step
+
+    def steps(self):
+        # points are computed from the start each time, accumulating the
+        # steps would accumulate round-off too
+        start, h = self.x0, self.step
+        x = start
+        for i in range(1, self.size):
+            xNext = start + i*h
+            yield x, h, xNext
+            x = xNext
+
+    def __repr__(self) -> str:
+        return "uniformGrid({!r}, {!r}, {!r})".format(
+            self.x0, self.step, self.size)
+
+class logGrid(baseGrid):
+    """
+    Grid of points equidistant in `log(x)` from `start` to `stop`, so that the
+    step grows in proportion to `x`.
+
+    Parameters
+    ----------
+    start : float
+        The first point, must be positive.
+    stop : float
+        The last point.
+    count : int
+        The number of points.
+    """
+
+    def __init__(self, start: float, stop: float, count: int) -> None:
+        if start <= 0 or stop <= 0:
+            raise ValueError("A logarithmic grid needs positive ends")
+        self.x0 = float(start)
+        self.x1 = float(stop)
+        self.size = int(count)
+        self._logRatio = np.log(self.x1/self.x0)/(self.size - 1)
+
+    def _point(self, i):
+        return self.x0*np.exp(i*self._logRatio)
+
+    def __repr__(self) -> str:
+        return "logGrid({!r}, {!r}, {!r})".format(
+            self.x0, self.x1, self.size)
+
+class piecewiseGrid(baseGrid):
+    """
+    Grid made of consecutive uniform segments, the k-th of which goes from
+    `edges[k]` to `edges[k+1]` in `counts[k]` equal steps.
+
+    Parameters
+    ----------
+    edges : array_like
+        The ends of the segments, increasing.
+    counts : array_like
+        The number of steps in each segment; one fewer than `edges`.
+    """
+
+    def __init__(self, edges, counts) -> None:
+        self.edges = np.asarray(edges, dtype=float)
+        self.counts = np.asarray(counts, dtype=int)
+        if self.edges.size != self.counts.size + 1:
+            raise ValueError("Need one more edge than segment counts")
+        self.h = np.diff(self.edges)/self.counts
+        # index of the first point of each segment
+        self._first = np.concatenate(([0], np.cumsum(self.counts)))
+        self.size = int(self._first[-1]) + 1
+
+    def _point(self, i):
+        # segment of the point; the last point belongs to the last segment
+        k = np.minimum(np.searchsorted(self._first, i, side="right") - 1,
+                       self.counts.size - 1)
+        return self.edges[k] + (i - self._first[k])*self.h[k]
+
+    def steps(self):
+        for k in range(self.counts.size):
+            start, h = self.edges[k], self.h[k]
+            x = start
+            for i in range(1, self.counts[k]):
+                xNext = start + i*h
+                yield x, h, xNext
+                x = xNext
+            # land exactly on the edge, so that the segments join up
+            yield x, self.edges[k+1] - x, self.edges[k+1]
+
+    def __repr__(self) -> str:
+        return "piecewiseGrid({!r}, {!r})".format(
+            self.edges.tolist(), self.counts.tolist())
+
+class arrayGrid(baseGrid):
+    """
+    Grid of explicitly given points.
+
+    Parameters
+    ----------
+    points : np.ndarray
+        The points of the grid, increasing. Need not be equidistant.
+    """
+
+    def __init__(self, points: np.ndarray) -> None:
+        self.array = np.asarray(points)
+        self.size = self.array.size
+
+    def _point(self, i):
+        return self.array[i]
+
+    def points(self) -> np.ndarray:
+        return self.array
+
+    def steps(self):
+        a = self.array
+        for x, xNext in zip(a[:-1], a[1:]):
+            yield x, xNext - x, xNext
+
+def asGrid(span) -> baseGrid:
+    """
+    Returns `span` as a grid; grids are passed through, arrays are wrapped in
+    an `arrayGrid`.
+    """
+    if isinstance(span, baseGrid):
+        return span
+    return arrayGrid(span)
+
+if __name__=="__main__":
+    print(
+        "This is a module home to the integration grids: uniform, logarithmic, \
+piecewise uniform and explicit arrays.")
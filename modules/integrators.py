@@ -13,6 +13,12 @@ Integration Methods implemented
     euler   Euler method - 1st order.
     heun    Heun method - a variant of a 2nd order.
     rk4     Runge-Kutta 4th order method.
+    dopri5  Dormand-Prince embedded 5(4) pair, for adaptive step size.
+    abm4    Adams-Bashforth-Moulton 4th order predictor-corrector, a multistep
+            method started by rk4.
+    verlet  Stormer-Verlet (leapfrog) method - 2nd order, symplectic.
+    yoshida4
+            Yoshida's 4th order symplectic composition of verlet.
 
 Implementation notes
 --------------------
@@ -34,8 +40,33 @@ from the previous value, is the difference between these methods.
 Error handling is implemented in `rk4` (the one used for actual calculations),
 where evaluating the `deriv` function might not be possible.
 
+The symplectic `verlet` and `yoshida4` are for separable systems only, such
+as the `SHO`: the first half of `y` are the momenta, whose derivative depends
+on the positions only, and the second half the positions, whose derivative
+depends on the momenta only.
+
 Choice of an integrator is aided by the dictionary `index`, mapping integer
-values to the integrator functions.
+values to the integrator functions. The multistep `abm4` keeps derivatives
+from one step to the next, so it is a class in `index`, and an instance of it
+is the integrator function of one integration.
+
+Adaptive integrators do not fit the scheme above, as they also need to return
+an estimate of the local error for the step size control done in `modules.ode`.
+They are kept in the separate dictionary `adaptive`, with integer values which
+continue the ones in `index`.
+
+In-place integrators
+--------------------
+The fixed step integrators have versions in the dictionary `inPlace`, with the
+same keys as `index`, which do not allocate any arrays. They take the
+derivative in the form `deriv(x, y, out)`, writing into `out`, and two more
+parameters:
+
+    yNew : np.ndarray, the array the result is written into
+    work : np.ndarray, at least `stages` stage buffers of the shape of `y`
+
+Both are owned by the caller, `modules.ode.ODEinit`, and reused for every step.
+The results are identical to the ones of the functions in `index`.
 """
 
 import numpy as np
@@ -135,9 +166,8 @@ def rk4(x: float, y: np.ndarray, deriv, h: float) -> np.ndarray:
     -----
     Note that in the case deriv cannot be computed for any of the steps, the
     error is handled by raising a value error back to the integrator method of 
-    the ODE class where this is handled. Additionally, an improvement in the
-    calculation order is implemented as per [1]_, where calculation cycle
-    number is reduced, as well as memory usage.
+    the ODE class where this is handled. A version which reuses its memory,
+    in the spirit of [1]_, is `rk4InPlace`.
 
     Sources
     -------
@@ -145,39 +175,366 @@ def rk4(x: float, y: np.ndarray, deriv, h: float) -> np.ndarray:
     Brian P. Flannery. "Numerical Recipes : The Art of Scientific Computing."
     Third ed. Cambridge, 2007.
     """
-    # TODO think of fix
     try:
-        # USE OLD implementation, uses more cycles and memory (allegedly)
         k1 = h*deriv(x,y)
         k2 = h*deriv(x + 0.5*h, y + 0.5*k1)
         k3 = h*deriv(x + 0.5*h, y + 0.5*k2)
         k4 = h*deriv(x + h, y + k3)
-        
-        # 'FASTER' implementation - produced an error while running tests on 
-        # the SHO for the report, revert to the more abstract version - some
-        # cycles but sure it is correct
-
-        # hh = 0.5*h
-        # h6 = h/6.0
-        # xh = x + hh
-        # k1 = deriv(x, y)
-        # yTemp = y + hh*k1
-        # k2 = deriv(xh, yTemp)
-        # yTemp = y + hh*k2
-        # k3 = deriv(xh, yTemp)
-        # yTemp = y + k3
-        # k3 += k2
-        # k2 = deriv(x+h, yTemp)
     except ValueError:
         raise ValueError("Invalid integration, terminate integration!")
 
     return y + (k1 + k4)/6.0 + (k2 + k3)/3.0
-    # return y + h6*(k1 + k2 + 2*k3)
 
-# dictionary to choose integrator; for neater code in modules.ode
-index = {1: euler, 2: heun, 3: rk4}
+# Butcher tableau of the Dormand-Prince 5(4) pair
+_dpC = np.array([0.0, 1.0/5, 3.0/10, 4.0/5, 8.0/9, 1.0, 1.0])
+_dpA = (
+    (),
+    (1.0/5,),
+    (3.0/40, 9.0/40),
+    (44.0/45, -56.0/15, 32.0/9),
+    (19372.0/6561, -25360.0/2187, 64448.0/6561, -212.0/729),
+    (9017.0/3168, -355.0/33, 46732.0/5247, 49.0/176, -5103.0/18656),
+    (35.0/384, 0.0, 500.0/1113, 125.0/192, -2187.0/6784, 11.0/84),
+)
+# 5th order weights are the last row of _dpA, _dpE is their difference to the
+# embedded 4th order weights
+_dpE = np.array([71.0/57600, 0.0, -71.0/16695, 71.0/1920, -17253.0/339200,
+                 22.0/525, -1.0/40])
+
+def dopri5(x: float, y: np.ndarray, deriv, h: float, k1: np.ndarray=None) -> tuple:
+    """
+    Compute a trial step of the Dormand-Prince embedded 5(4) Runge-Kutta pair.
+
+    This function computes an iteration in the numerical integration of an ODE
+    of the form `dy/dx = f(x, y)` with a fifth order Runge-Kutta method, along
+    with an embedded fourth order solution used to estimate the local error of
+    the step. It is meant to be used with step size control, which decides
+    whether to accept the step and what the next `h` should be.
+
+    Parameters
+    ----------
+    x : float
+        Starting coordinate in x.
+    y : ndarray
+        Starting coordinate in y. In general can be an N-dimensional array.
+    deriv : function
+        A function which computes the derivative of the y-vector given the 
+        x and y coords.
+    h : float
+        The step size in x.
+    k1 : ndarray, optional
+        The derivative at `(x, y)` if already known. The method has the "first
+        same as last" property, so this is the last value returned by the
+        previous accepted step.
+
+    Returns
+    -------
+    tuple
+        The tuple `(yNew, yErr, kNew)`: the 5th order approximation of
+        y(x + h), the estimate of its local error and the derivative at
+        `(x + h, yNew)`, to be passed on as `k1` of the next step.
+
+    Raises
+    ------
+    ValueError
+        If an error is raised by the deriv function indicating impossible
+        evaluation, raise an error to indicate the step cannot be taken.
+
+    Sources
+    -------
+    ..[1] Dormand, J. R., and P. J. Prince. "A family of embedded Runge-Kutta
+    formulae." Journal of Computational and Applied Mathematics 6, no. 1
+    (1980): 19-26.
+    """
+    try:
+        k = [deriv(x, y) if k1 is None else k1]
+        for i in range(1, 7):
+            yTemp = y
+            for a, kj in zip(_dpA[i], k):
+                yTemp = yTemp + (h*a)*kj
+            k.append(deriv(x + _dpC[i]*h, yTemp))
+    except ValueError:
+        raise ValueError("Invalid integration, terminate integration!")
+
+    # the last stage is evaluated at the 5th order solution itself
+    yErr = h*sum(e*kj for e, kj in zip(_dpE, k))
+    return yTemp, yErr, k[6]
+
+def eulerInPlace(x: float, y: np.ndarray, deriv, h: float, yNew: np.ndarray,
+                 work: np.ndarray) -> np.ndarray:
+    """
+    Euler's method as `euler`, writing the result into `yNew` and using the
+    stage buffer `work[0]`. Look at In-place integrators in the module notes.
+    """
+    k = deriv(x, y, work[0])
+    k *= h
+    return np.add(y, k, out=yNew)
+
+def heunInPlace(x: float, y: np.ndarray, deriv, h: float, yNew: np.ndarray,
+                work: np.ndarray) -> np.ndarray:
+    """
+    Heun's method as `heun`, writing the result into `yNew` and using the
+    stage buffers `work[0:3]`. Look at In-place integrators in the module
+    notes.
+    """
+    f0 = deriv(x, y, work[0])
+    yTemp = np.multiply(f0, h, out=work[1])
+    yTemp += y
+    f0 += deriv(x + h, yTemp, work[2])
+    f0 *= 0.5*h
+    return np.add(y, f0, out=yNew)
+
+def rk4InPlace(x: float, y: np.ndarray, deriv, h: float, yNew: np.ndarray,
+               work: np.ndarray) -> np.ndarray:
+    """
+    Compute an iteration using a 4th order Runge-Kutta method, as `rk4`, but
+    without allocating any arrays.
+
+    Parameters
+    ----------
+    x : float
+        Starting coordinate in x.
+    y : ndarray
+        Starting coordinate in y. Not modified.
+    deriv : function
+        The derivative `deriv(x, y, out)`, writing into `out`.
+    h : float
+        The step size in x.
+    yNew : ndarray
+        Array of the shape of `y` the result is written into.
+    work : ndarray
+        Stage buffers, `work[0:5]` of the shape of `y` are used.
+
+    Returns
+    -------
+    np.ndarray
+        `yNew`, the approximation of y(x + h).
+
+    Raises
+    ------
+    ValueError
+        If the deriv function cannot be evaluated, as in `rk4`.
+
+    Notes
+    -----
+    The operations are those of `rk4` in the same order, so that both give
+    identical results. The 'faster' variant of [1]_ once tried in `rk4` went
+    wrong as it dropped the factor `h` in the last stage, `y + h*k3`; the
+    stages here are scaled by `h` as soon as they are computed instead.
+    """
+    k1, k2, k3, k4, yTemp = work[0], work[1], work[2], work[3], work[4]
+    try:
+        deriv(x, y, k1)
+        k1 *= h
+        np.multiply(k1, 0.5, out=yTemp)
+        yTemp += y
+        deriv(x + 0.5*h, yTemp, k2)
+        k2 *= h
+        np.multiply(k2, 0.5, out=yTemp)
+        yTemp += y
+        deriv(x + 0.5*h, yTemp, k3)
+        k3 *= h
+        np.add(y, k3, out=yTemp)
+        deriv(x + h, yTemp, k4)
+        k4 *= h
+    except ValueError:
+        raise ValueError("Invalid integration, terminate integration!")
+
+    k1 += k4
+    k1 /= 6.0
+    k2 += k3
+    k2 /= 3.0
+    np.add(y, k1, out=yNew)
+    yNew += k2
+    return yNew
+
+class abm4(object):
+    """
+    Compute iterations using the Adams-Bashforth-Moulton predictor-corrector
+    method: a 4th order multistep method.
+
+    The method reuses the derivatives at the last four points: the
+    Adams-Bashforth formula predicts
+    `y(x + h) = y + h/24*(55*f0 - 59*f1 + 37*f2 - 9*f3)`, where `f0` is the
+    derivative at `(x, y)` and `f1` to `f3` the ones before it, and the
+    Adams-Moulton formula corrects it with the derivative `fp` at the
+    prediction, `y(x + h) = y + h/24*(9*fp + 19*f0 - 5*f1 + f2)`. The
+    derivative at the corrected point is then the next `f0` (PECE mode), so
+    a step costs two evaluations of `deriv` instead of the four of `rk4`.
+
+    Unlike the functions of this module it keeps the derivatives between
+    calls, so `modules.ode` makes an instance per integration; an instance
+    is then called as the other integrators, `abm4()(x, y, deriv, h)`, with
+    consecutive steps.
+
+    Attributes
+    ----------
+    calls : int
+        The number of evaluations of `deriv` so far.
+
+    Notes
+    -----
+    The history is started, or restarted, with three steps of `rk4`, each
+    followed by an evaluation of the derivative at its end, which makes 16
+    evaluations in all. This happens on the first step and whenever the step
+    size changes, as the coefficients hold for equal steps only; on the
+    breaks of a `modules.grids.piecewiseGrid` it restarts, on a grid whose
+    steps all differ, such as a `logGrid`, it is `rk4` with extra
+    evaluations. Steps within 1e-10 of each other count as equal, so that
+    the round-off of grid points does not restart it.
+
+    A `ValueError` of `deriv` is raised on as in `rk4`, which terminates the
+    integration in `modules.ode`; the steps of a multistep method cannot be
+    retried with a smaller step anyway.
+
+    Sources
+    -------
+    ..[1] Hairer, Ernst, Syvert P. Norsett, and Gerhard Wanner. "Solving
+    Ordinary Differential Equations I: Nonstiff Problems." Second ed.
+    Springer, 1993. Section III.1.
+    """
+
+    def __init__(self) -> None:
+        # the derivatives at the last points, latest first, and their step
+        self.history = []
+        self.h = None
+        self.calls = 0
+
+    def __call__(self, x: float, y: np.ndarray, deriv, h: float) -> np.ndarray:
+        # the calls are counted before they are made, so that a step stopped
+        # by deriv counts in full, as in modules.ode
+        try:
+            if self.h is None or abs(h - self.h) > 1e-10*abs(self.h):
+                # start afresh from the derivative at this point
+                self.calls += 1
+                self.history = [deriv(x, y)]
+                self.h = h
+            f = self.history
+            if len(f) < 4:
+                self.calls += 4
+                yNew = rk4(x, y, deriv, h)
+            else:
+                yPred = y + (h/24.0)*(55.0*f[0] - 59.0*f[1] + 37.0*f[2] -
+                                      9.0*f[3])
+                self.calls += 1
+                fPred = deriv(x + h, yPred)
+                yNew = y + (h/24.0)*(9.0*fPred + 19.0*f[0] - 5.0*f[1] + f[2])
+            self.calls += 1
+            f.insert(0, deriv(x + h, yNew))
+        except ValueError:
+            raise ValueError("Invalid integration, terminate integration!")
+        del f[4:]
+        return yNew
+
+def _splitStep(x: float, y: np.ndarray, deriv, h: float, drifts: tuple,
+               kicks: tuple) -> np.ndarray:
+    """
+    A step of a splitting method for a separable system `y = [p, q]`: the
+    positions `q` drift with their derivative, the momenta `p` are kicked
+    with theirs, in turn, by the fractions `drifts` and `kicks` of the step.
+    """
+    n = y.shape[-1]//2
+    p, q = y[..., :n], y[..., n:]
+    t = x
+    try:
+        for i, c in enumerate(drifts):
+            q = q + (c*h)*deriv(t, np.concatenate((p, q), axis=-1))[..., n:]
+            t = t + c*h
+            if i < len(kicks):
+                p = p + (kicks[i]*h)*deriv(
+                    t, np.concatenate((p, q), axis=-1))[..., :n]
+    except ValueError:
+        raise ValueError("Invalid integration, terminate integration!")
+    return np.concatenate((p, q), axis=-1)
+
+def verlet(x: float, y: np.ndarray, deriv, h: float) -> np.ndarray:
+    """
+    Compute an iteration using the Stormer-Verlet (leapfrog) method: a 2nd
+    order symplectic method.
+
+    For a separable system, e.g. `SHO`, whose vector `y = [p, q]` holds the
+    momenta in its first half and the positions in its second, with `p'`
+    depending on `q` only and `q'` on `p` only, the positions drift by half a
+    step, the momenta are kicked by a full step with the derivative at the
+    new positions, and the positions drift by the other half. The map is
+    symplectic, so the energy error of an oscillator stays bounded instead
+    of growing with time as for the other methods of this module.
+
+    Parameters
+    ----------
+    x : float
+        Starting coordinate in x.
+    y : ndarray
+        Starting coordinate in y, `[p, q]` of an even length.
+    deriv : function
+        A function which computes the derivative of the y-vector given the
+        x and y coords.
+    h : float
+        The step size in x.
+
+    Returns
+    -------
+    np.ndarray
+        The approximation of y(x + h).
+
+    Raises
+    ------
+    ValueError
+        If the deriv function cannot be evaluated, as in `rk4`.
+
+    Notes
+    -----
+    Both halves of the derivative are taken from `deriv`, which is evaluated
+    three times per step, so that `q'` need not be `p`. The white dwarf
+    equations are not separable, and give wrong results with this method.
+
+    Sources
+    -------
+    ..[1] Hairer, Ernst, Christian Lubich, and Gerhard Wanner. "Geometric
+    Numerical Integration." Second ed. Springer, 2006. Section I.1.4.
+    """
+    return _splitStep(x, y, deriv, h, (0.5, 0.5), (1.0,))
+
+# Yoshida's weights, making the composition of three Verlet steps 4th order
+_yoshidaW1 = 1.0/(2.0 - 2.0**(1.0/3))
+_yoshidaW0 = -(2.0**(1.0/3))*_yoshidaW1
+
+def yoshida4(x: float, y: np.ndarray, deriv, h: float) -> np.ndarray:
+    """
+    Compute an iteration using Yoshida's composition of three `verlet` steps
+    of sizes `w1*h`, `w0*h`, `w1*h`: a 4th order symplectic method.
+
+    Takes the parameters and returns as `verlet`, for the same separable
+    systems; the derivative is evaluated seven times per step. For an
+    oscillator it reaches the energy error of `rk4` with a step several
+    times larger, and keeps it bounded.
+
+    Sources
+    -------
+    ..[1] Yoshida, Haruo. "Construction of higher order symplectic
+    integrators." Physics Letters A 150, no. 5-7 (1990): 262-268.
+    """
+    return _splitStep(
+        x, y, deriv, h,
+        (0.5*_yoshidaW1, 0.5*(_yoshidaW0 + _yoshidaW1),
+         0.5*(_yoshidaW0 + _yoshidaW1), 0.5*_yoshidaW1),
+        (_yoshidaW1, _yoshidaW0, _yoshidaW1))
+
+# dictionary to choose integrator; for neater code in modules.ode; abm4 is a
+# class, of which modules.ode makes an instance for every integration
+index = {1: euler, 2: heun, 3: rk4, 5: abm4, 6: verlet, 7: yoshida4}
+# the same integrators working in place, for derivatives taking `out`
+inPlace = {1: eulerInPlace, 2: heunInPlace, 3: rk4InPlace}
+# number of stage buffers in `work` needed by any of them
+stages = 5
+# integrators with an error estimate, used with adaptive step size
+adaptive = {4: dopri5}
+# evaluations of the derivative per step, for the counts of `modules.ode`;
+# dopri5 reuses the last one of a step, and needs one more for its first;
+# abm4 counts its own, more on the steps starting it
+evaluations = {1: 1, 2: 2, 3: 4, 4: 6, 5: 2, 6: 3, 7: 7}
 
 if __name__=="__main__":
     print(
         "This is a module home to several integrators to be used in solving \
-ODEs: Euler, Heun, Runge-Kutta4.")
\ No newline at end of file
+ODEs: Euler, Heun, Runge-Kutta4, Dormand-Prince5(4).")
\ No newline at end of file
@@ -0,0 +1,205 @@
+"""
+Inverse Solver(`inverse.py`)
+============================
+
+This is a home to the inverse of the white dwarf integration: the central
+density of the star with a given mass or radius. It is found by shooting, i.e.
+integrating stars and correcting `rhoC` until the target is met.
+
+Functions
+---------
+solve           The star of a target mass or radius.
+solveMany       The stars of an array of targets, in parallel.
+
+Implementation Notes
+--------------------
+The root is searched for in `log(rhoC)`, where `log(Mass)` and `log(Radius)`
+are close to linear, by the secant method; should it fail to converge, it
+falls back to Brent's method on a bracket grown around the guess. Every answer
+is remembered by the process, and the first guess for a new target is
+interpolated from the answers known so far (a warm start), or taken from the
+non-relativistic polytrope when there are none. The polytropic regimes 1 and
+3 use the scaling of `modules.polytrope` instead of integrating.
+"""
+
+import functools
+
+import numpy as np
+
+from . import limits, polytrope, sweep
+
+# columns of the tuples returned, for the quantity to match
+_columns = {"radius": 0, "mass": 1}
+# answers found so far, by regime: lists of (log rhoC, log R, log M)
+_known = {}
+
+@functools.lru_cache(maxsize=None)
+def _massLimit() -> float:
+    # the masses of relativistic stars stay below this
+    return limits.chandrasekharMass()[0]
+
+def _evaluate(rhoC: float, regime: int, steps: int) -> tuple:
+    # radius and mass of a star; the polytropes scale, regime 2 integrates
+    if regime == 2:
+        return limits.starRadiusMass(rhoC, steps, regime)
+    radius, mass = polytrope.radiusMass(rhoC, regime)
+    return float(radius), float(mass)
+
+def _guess(target: float, column: int, regime: int) -> float:
+    """
+    First guess of `log(rhoC)` for the target, interpolated in the answers
+    known for the regime or else from the non-relativistic polytrope, where
+    `Mass ~ rhoC^(1/2)` and `Radius ~ rhoC^(-1/6)`.
+    """
+    known = _known.get(regime, [])
+    if len(known) >= 2:
+        table = np.array(known)
+        order = np.argsort(table[:, column + 1])
+        return float(np.interp(np.log(target), table[order, column + 1],
+                               table[order, 0]))
+    unit = polytrope.radiusMass(1.0, 1)[column]
+    power = 0.5 if column == 1 else -1.0/6
+    return float(np.log(target/unit)/power)
+
+def solve(target: float, quantity: str="mass", regime: int=2,
+          tol: float=1e-10, steps: int=20000, maxIter: int=50) -> tuple:
+    """
+    Finds the white dwarf of a given mass or radius.
+
+    Parameters
+    ----------
+    target : float
+        The mass in kg or the radius in m of the star.
+    quantity : {"mass", "radius"}, optional
+        Which of the two `target` is, by default the mass.
+    regime : {1, 2, 3}, optional
+        The equation of state, by default the relativistic one.
+    tol : float, optional
+        The relative tolerance of the match of the target, by default 1e-10.
+    steps : int, optional
+        The number of steps across an integrated star, look at
+        `modules.limits.starRadiusMass`.
+    maxIter : int, optional
+        The largest number of secant iterations before falling back to
+        Brent's method.
+
+    Returns
+    -------
+    tuple
+        The tuple `(rhoC, Radius, Mass)` of the star, in kg*m^(-3), m and kg.
+
+    Raises
+    ------
+    ValueError
+        If there is no such star: for the ultra-relativistic regime all stars
+        have the same mass, and for the relativistic one the mass has to be
+        below the limiting mass of `modules.limits.chandrasekharMass`. Also if
+        `quantity` is not known.
+    """
+    if quantity not in _columns:
+        raise ValueError("Unknown quantity: {}".format(quantity))
+    column = _columns[quantity]
+    if regime == 3 and quantity == "mass":
+        raise ValueError(
+            "The mass of ultra-relativistic stars does not depend on rhoC")
+    if regime == 2 and quantity == "mass" and target >= _massLimit():
+        # beyond the limit the root finder would run off to where the grid
+        # cannot resolve the star
+        raise ValueError("No star of mass {} above the limiting mass {}".format(
+            target, _massLimit()))
+
+    cache = {}
+    def residual(t):
+        # log of the quantity over the target, with the star remembered
+        if t not in cache:
+            cache[t] = _evaluate(float(np.exp(t)), regime, steps)
+        return np.log(cache[t][column]/target)
+
+    t0 = _guess(target, column, regime)
+    t1 = t0 + 0.1
+    f0, f1 = residual(t0), residual(t1)
+    converged = False
+    for _ in range(maxIter):
+        if abs(f1) <= tol:
+            converged = True
+            break
+        if f1 == f0:
+            break
+        # the mass flattens out towards its limit, so keep the steps modest
+        step = np.clip(-f1*(t1 - t0)/(f1 - f0), -3.0, 3.0)
+        t0, f0 = t1, f1
+        t1 = t1 + step
+        f1 = residual(t1)
+
+    if not converged:
+        t1 = _bracketSolve(residual, t0, tol, regime, quantity)
+
+    rhoC = float(np.exp(t1))
+    radius, mass = cache[t1] if t1 in cache else _evaluate(rhoC, regime, steps)
+    _known.setdefault(regime, []).append(
+        (t1, np.log(radius), np.log(mass)))
+    return rhoC, radius, mass
+
+def _bracketSolve(residual, t: float, tol: float, regime: int,
+                  quantity: str) -> float:
+    """
+    Grows a bracket of the root around `t` and solves for it with Brent's
+    method.
+    """
+    # scipy is slow to import and only needed when the secant fails
+    from scipy import optimize
+
+    width = 0.5
+    a, b = t - width, t + width
+    while residual(a)*residual(b) > 0:
+        width *= 2
+        if width > 64:
+            raise ValueError("No star of the target {} in regime {}".format(
+                quantity, regime))
+        a, b = t - width, t + width
+    return optimize.brentq(residual, a, b, rtol=4*np.finfo(float).eps,
+                           xtol=tol)
+
+def _solveChunk(args) -> list:
+    # solves targets in turn in one worker, each warm started by the last
+    targets, quantity, regime, tol, steps = args
+    return [solve(target, quantity, regime, tol, steps) for target in targets]
+
+def solveMany(targets: np.ndarray, quantity: str="mass", regime: int=2,
+              tol: float=1e-10, steps: int=20000,
+              processes: int=None) -> tuple:
+    """
+    Finds the white dwarfs of an array of targets, look at `solve`. The
+    targets are sorted and split in one chunk per process, and each worker
+    solves its chunk in order, so that every star is warm started from a
+    neighbouring one.
+
+    Parameters
+    ----------
+    targets : np.ndarray
+        The masses in kg or the radii in m.
+    quantity, regime, tol, steps
+        As in `solve`.
+    processes : int, optional
+        The largest number of processes, by default one per CPU, look at
+        `modules.sweep.workerPool`.
+
+    Returns
+    -------
+    tuple
+        Arrays `(rhoC, Radius, Mass)` in the order of `targets`.
+    """
+    targets = np.asarray(targets, dtype=float)
+    order = np.argsort(targets)
+    with sweep.workerPool(min(processes or targets.size, targets.size)) as pool:
+        chunks = np.array_split(targets[order], pool.processes)
+        results = dict(pool.imap(
+            _solveChunk, [(c, quantity, regime, tol, steps) for c in chunks]))
+    rows = np.empty((targets.size, 3))
+    rows[order] = [row for k in range(len(chunks)) for row in results[k]]
+    return rows[:, 0], rows[:, 1], rows[:, 2]
+
+if __name__=="__main__":
+    print(
+        "This file contains the inverse solver of white dwarfs for a target \
+mass or radius.")
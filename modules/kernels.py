@@ -0,0 +1,176 @@
+"""
+Compiled Kernels(`kernels.py`)
+==============================
+
+This is a home to the compiled version of the white dwarf integration. The
+RK4 step of `modules.integrators` and the equations of state of
+`modules.derivatives` are fused into a single loop over scalars, so that a step
+makes no Python calls and allocates no arrays.
+
+The loop is compiled with numba when it is installed, which is then flagged
+by `available`; numba is imported and the loop compiled, or loaded from the
+cache of numba on disk, on the first call only. Without numba the functions
+here still run, only as slow plain Python; `modules.whiteDwarf` then keeps to
+its usual integration path instead.
+
+Functions
+---------
+rk4Star     Integrates a single white dwarf with the RK4 method.
+
+Implementation Notes
+--------------------
+The arithmetic follows the Python path operation by operation, so that both
+give identical results for a single star. This leaves a step at the cost of
+its 16 calls of `pow`, about 0.3 us, which cannot be traded for cheaper
+operations without changing the results. A relativistic star of 1e10 kg*m^-3
+on the 2M points of `main.py`, 280370 steps to the surface, takes 0.08-0.09 s
+against 5.8-8.6 s in Python, 65-100 times faster depending on the load of
+the machine, short of a hundred times on average.
+"""
+
+import functools
+import importlib.util
+
+import numpy as np
+
+# numba takes a quarter of a second to import, so here it is only looked for;
+# it is imported when a kernel is first called
+available = importlib.util.find_spec("numba") is not None
+# the kernels waiting to be compiled, in order of definition
+_pending = []
+
+def _jit(func):
+    # compile when numba is there, cached on disk across processes; nothing is
+    # compiled until the first call of a kernel
+    if not available:
+        return func
+    _pending.append(func)
+    @functools.wraps(func)
+    def first(*args):
+        _compile()
+        return globals()[func.__name__](*args)
+    return first
+
+def _compile() -> None:
+    # replaces every kernel by its compiled version, the ones it calls first,
+    # so that numba finds them compiled in the globals of the module
+    import numba
+    for func in _pending:
+        globals()[func.__name__] = numba.njit(cache=True)(func)
+    _pending.clear()
+
+@_jit
+def _deriv(regime, x, rho, m, const1, const2):
+    # the derivatives of modules.derivatives, for the three regimes; regime 3
+    # expects const1*sqrt(const2) as const1
+    a = abs(rho)
+    if regime == 1:
+        drho = const1*m*(a**(1.0/3))*(x**(-2.0))
+    elif regime == 2:
+        drho = (const1*m*(a**(1.0/3))*(x**(-2.0)) *
+                (1+const2*(a**(2.0/3)))**(0.5))
+    else:
+        drho = const1*m*(a**(2.0/3))*(x**(-2.0))
+    return drho, 3*(x**2)*rho
+
+@_jit
+def rk4Star(regime, const1, const2, floor, x0, step, points, start, n, rho,
+            m, every, out):
+    """
+    Integrates a white dwarf with the RK4 method, over a uniform grid or the
+    given points, from the point `start`. The stored points fill `out`, and
+    when it is full the integration stops so that it can be resumed from the
+    point reached with a new `out`.
+
+    Parameters
+    ----------
+    regime : {1, 2, 3}
+        The equation of state, as in `modules.whiteDwarf`.
+    const1, const2 : float
+        The constants of the derivative; for regime 3 `const1` is `const3`.
+    floor : float
+        The density below which the derivative is not evaluated. When it is
+        `-inf` the integration stops at the first step over which the density
+        changes sign instead.
+    x0, step : float
+        The start and step of a uniform grid; ignored if `points` is not empty.
+    points : np.ndarray
+        The points of the grid, or an empty array for a uniform grid.
+    start : int
+        The index of the point at which `(rho, m)` is given, 0 for the centre
+        or where the previous call stopped with status 3.
+    n : int
+        The number of points in the grid.
+    rho, m : float
+        The state at point `start`.
+    every : int
+        Store the points whose index is a multiple of `every` in `out`, that
+        of the centre first; 0 to store nothing. `start` is such a point.
+    out : np.ndarray
+        Array of shape `(rows, 2)` for the stored points, filled from row 0.
+
+    Returns
+    -------
+    tuple
+        `(status, i, rho, m, rhoNext, mNext)`: status is 0 if the grid ran out,
+        1 if the derivative could not be evaluated in step i, 2 if the
+        density changed sign over step i and 3 if `out` is full, with point i
+        still to be stored. `(rho, m)` is the state at point i, `(rhoNext,
+        mNext)` the one computed beyond it (status 2 only).
+    """
+    uniform = points.size == 0
+    row = 0
+    if every > 0:
+        out[0, 0] = rho
+        out[0, 1] = m
+        row = 1
+    for i in range(start, n - 1):
+        if uniform:
+            x = x0 + i*step
+            xNext = x0 + (i + 1)*step
+            h = step
+        else:
+            x = points[i]
+            xNext = points[i + 1]
+            h = xNext - x
+
+        # k1 to k4 as in integrators.rk4, failing as the derivative would
+        if rho < floor:
+            return 1, i, rho, m, 0.0, 0.0
+        d0, d1 = _deriv(regime, x, rho, m, const1, const2)
+        k1r, k1m = h*d0, h*d1
+        r2, m2 = rho + 0.5*k1r, m + 0.5*k1m
+        if r2 < floor:
+            return 1, i, rho, m, 0.0, 0.0
+        d0, d1 = _deriv(regime, x + 0.5*h, r2, m2, const1, const2)
+        k2r, k2m = h*d0, h*d1
+        r3, m3 = rho + 0.5*k2r, m + 0.5*k2m
+        if r3 < floor:
+            return 1, i, rho, m, 0.0, 0.0
+        d0, d1 = _deriv(regime, x + 0.5*h, r3, m3, const1, const2)
+        k3r, k3m = h*d0, h*d1
+        r4, m4 = rho + k3r, m + k3m
+        if r4 < floor:
+            return 1, i, rho, m, 0.0, 0.0
+        d0, d1 = _deriv(regime, x + h, r4, m4, const1, const2)
+        k4r, k4m = h*d0, h*d1
+        rhoNext = rho + (k1r + k4r)/6.0 + (k2r + k3r)/3.0
+        mNext = m + (k1m + k4m)/6.0 + (k2m + k3m)/3.0
+
+        # the surface event rho = 0, as whiteDwarf.surface
+        if floor == -np.inf and rho != 0 and rho*rhoNext <= 0:
+            return 2, i, rho, m, rhoNext, mNext
+
+        rho, m = rhoNext, mNext
+        if every > 0 and (i + 1) % every == 0:
+            if row == out.shape[0]:
+                return 3, i + 1, rho, m, 0.0, 0.0
+            out[row, 0] = rho
+            out[row, 1] = m
+            row += 1
+    return 0, n - 1, rho, m, 0.0, 0.0
+
+if __name__=="__main__":
+    print(
+        "This file contains the compiled kernels of the white dwarf \
+integration.")
@@ -0,0 +1,174 @@
+"""
+Limiting Mass(`limits.py`)
+==========================
+
+This is a home to the search for the limiting (Chandrasekhar) mass of white
+dwarfs with the relativistic equation of state, regime 2 of
+`modules.whiteDwarf`. Instead of reading the plateau off a dense sweep of
+central densities, the mass is computed on a short geometric ladder of
+densities and extrapolated to `rhoC -> infinity`.
+
+Functions
+---------
+chandrasekharMass   The supremum of M(rhoC) with an error estimate.
+starRadiusMass      Radius and mass of a single star on a grid fitted to its
+                    size.
+starMass            The mass alone.
+
+Implementation Notes
+--------------------
+For large `rhoC` the electrons become ultra-relativistic and the mass tends to
+that of the `n = 3` polytrope, `polytrope.radiusMass(rhoC, 3)`, as
+`M(rhoC) = Mlim - c*rhoC^(-2/3) + ...`. On densities in geometric progression
+the deficit is then a geometric sequence, which Aitken's delta-squared process
+removes without knowing the power. Should the masses on the ladder turn down
+instead, the maximum is located by golden-section search in `log(rhoC)`.
+"""
+
+import numpy as np
+
+from . import grids, polytrope
+from .whiteDwarf import startPoint, whiteDwarf
+
+def starRadiusMass(rhoC: float, steps: int=20000, regime: int=2,
+                   integrator: int=3) -> tuple:
+    """
+    Integrates a single star on a uniform grid of about `steps` steps across
+    it, whatever its size, and returns its radius and mass.
+
+    Parameters
+    ----------
+    rhoC : float
+        The central density in kg*m^(-3).
+    steps : int, optional
+        The number of steps from the centre to the surface, by default 20000.
+    regime : {1, 2, 3}, optional
+        The equation of state, by default the relativistic one.
+    integrator : int, optional
+        The integrator, by default RK4.
+
+    Returns
+    -------
+    tuple
+        The tuple `(Radius, Mass)` of the star in m and kg.
+    """
+    # the true pressure is below both polytropic limits, so the star is no
+    # larger than the smaller of the two polytropic stars
+    l = (3/(4*np.pi))**(1.0/3.0)
+    size = min(polytrope.radiusMass(rhoC, 1)[0],
+               polytrope.radiusMass(rhoC, 3)[0])/l
+    length = 1.5
+    # the grid starts off the centre, from its series expansion
+    x0 = float(startPoint(rhoC, regime, size/steps))
+    while True:
+        span = grids.uniformGrid(x0, size/steps, int(length*steps) + 1)
+        star = whiteDwarf(rhoC, span, regime)
+        star.integrate(integrator, surface=True, store="final", backend="jit")
+        if star.flagEvent:
+            radius, mass = star.getRadiusMass()
+            return float(radius), float(mass)
+        # the surface is beyond the grid, which should not happen
+        length *= 2
+
+def starMass(rhoC: float, steps: int=20000, regime: int=2,
+             integrator: int=3) -> float:
+    """
+    The mass in kg of a single star, look at `starRadiusMass`.
+    """
+    return starRadiusMass(rhoC, steps, regime, integrator)[1]
+
+def _aitken(m: np.ndarray) -> float:
+    # delta-squared extrapolation of the last three terms of a sequence
+    d1, d2 = m[-2] - m[-3], m[-1] - m[-2]
+    if d2 == d1:
+        return m[-1]
+    return m[-1] - d2*d2/(d2 - d1)
+
+def chandrasekharMass(rho0: float=1e10, ratio: float=10.0, tol: float=1e-7,
+                      maxStars: int=30, steps: int=20000) -> tuple:
+    """
+    Finds the limiting mass of white dwarfs with the relativistic equation of
+    state, the supremum of M(rhoC), from a few integrations.
+
+    Masses are computed at `rhoC = rho0*ratio^k`, k = 0, 1, ..., and
+    extrapolated to `rhoC -> infinity` by Aitken's process until successive
+    extrapolations agree to `tol`. If the masses stop increasing, the maximum
+    is located by golden-section search instead.
+
+    Parameters
+    ----------
+    rho0 : float, optional
+        The first central density in kg*m^(-3), by default 1e10.
+    ratio : float, optional
+        The ratio of consecutive densities, by default 10.
+    tol : float, optional
+        The relative tolerance of the limit, by default 1e-7.
+    maxStars : int, optional
+        The largest number of integrations, by default 30.
+    steps : int, optional
+        The number of steps across each star, look at `starMass`.
+
+    Returns
+    -------
+    tuple
+        `(Mass, Error, stars)`: the limiting mass in kg, an estimate of its
+        error, and the `(k, 2)` array of the densities and masses integrated.
+
+    Notes
+    -----
+    The error estimate is the difference of the last two extrapolations plus
+    the discretization error of the last star, taken as the change of its
+    mass on halving the step. The limit should agree with the mass of the
+    `n = 3` polytrope, `polytrope.radiusMass(rhoC, 3)[1]`, which is the
+    analytic limit of the equation of state.
+    """
+    stars = []
+    def evaluate(rho):
+        stars.append((rho, starMass(rho, steps)))
+        return stars[-1][1]
+
+    masses = [evaluate(rho0*ratio**k) for k in range(3)]
+    limits = [_aitken(np.array(masses))]
+    while len(stars) < maxStars:
+        if masses[-1] < masses[-2]:
+            # the maximum is inside the last two intervals of the ladder
+            t = np.log(rho0) + np.log(ratio)*(len(masses) - 3)
+            mass, error = _goldenMax(evaluate, t, t + 2*np.log(ratio),
+                                     tol, maxStars - len(stars))
+            return mass, error, np.array(stars)
+        masses.append(evaluate(rho0*ratio**len(masses)))
+        limits.append(_aitken(np.array(masses)))
+        if abs(limits[-1] - limits[-2]) <= tol*abs(limits[-1]):
+            break
+
+    # discretization error of the last star, on half the step
+    rho = stars[-1][0]
+    stars.append((rho, starMass(rho, 2*steps)))
+    error = abs(limits[-1] - limits[-2]) + abs(stars[-1][1] - stars[-2][1])
+    return limits[-1], error, np.array(stars)
+
+def _goldenMax(func, a: float, b: float, tol: float, budget: int) -> tuple:
+    """
+    Golden-section search for the maximum of `func(exp(t))` over `t` in
+    `[a, b]`, with at most `budget` evaluations. Returns the largest value
+    found and the spread of the values in the final bracket as its error.
+    """
+    g = (np.sqrt(5) - 1)/2
+    c, d = b - g*(b - a), a + g*(b - a)
+    fc, fd = func(np.exp(c)), func(np.exp(d))
+    budget -= 2
+    while budget > 0 and abs(fc - fd) > tol*max(abs(fc), abs(fd)):
+        if fc > fd:
+            b, d, fd = d, c, fc
+            c = b - g*(b - a)
+            fc = func(np.exp(c))
+        else:
+            a, c, fc = c, d, fd
+            d = a + g*(b - a)
+            fd = func(np.exp(d))
+        budget -= 1
+    return max(fc, fd), abs(fc - fd)
+
+if __name__=="__main__":
+    print(
+        "This file contains the search for the limiting mass of white dwarfs.")
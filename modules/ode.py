@@ -2,8 +2,128 @@
 Implementation of a generic ODE integrator.
 """
 
+import time
+
 import numpy as np
-from . import integrators
+from . import grids, integrators
+
+# the statistics of all integrations in this process, summed by `addStats`; a
+# sweep swaps in an empty dict for every task to collect those of the task
+totals = {}
+
+def _newStats(members: int) -> dict:
+    # the statistics of an integration, look at `ODEinit.stats`
+    return {"members": members, "steps": 0, "rejected": 0, "derivCalls": 0,
+            "eventCalls": 0, "reason": None, "index": None,
+            "time": {"steps": 0.0, "locate": 0.0, "output": 0.0}}
+
+def addStats(total: dict, stats: dict) -> dict:
+    """
+    Adds the statistics of an integration, `ODEinit.stats`, or a sum of them
+    made by this function, into the sum `total` and returns it. Counts and
+    times are summed; the reasons of termination are counted by kind in
+    `total["reasons"]`, and the integrations in `total["integrations"]`.
+    """
+    for key in ("members", "steps", "rejected", "derivCalls", "eventCalls"):
+        total[key] = total.get(key, 0) + int(stats[key])
+    times = total.setdefault("time", {})
+    for key, value in stats["time"].items():
+        times[key] = times.get(key, 0.0) + value
+    if "reasons" in stats:
+        counts = stats["reasons"]
+        integrations = stats["integrations"]
+    else:
+        kinds, n = np.unique(stats["reason"], return_counts=True)
+        counts = dict(zip(kinds.tolist(), n.tolist()))
+        integrations = 1
+    total["integrations"] = total.get("integrations", 0) + integrations
+    reasons = total.setdefault("reasons", {})
+    for kind, n in counts.items():
+        reasons[kind] = reasons.get(kind, 0) + n
+    return total
+
+def _storeEvery(store) -> int:
+    """
+    Returns k for the store mode "every k", 1 for "full" and 0 for "final" or
+    a callback; look at `ODEinit.integrate`.
+    """
+    if callable(store) or store == "final":
+        return 0
+    if store == "full":
+        return 1
+    if isinstance(store, str) and store.startswith("every "):
+        every = int(store.split()[1])
+        if every >= 1:
+            return every
+    raise ValueError("Invalid store mode: {}".format(store))
+
+class _Trajectory(object):
+    """
+    Growable buffer for the computed points of an integration. Rows are kept
+    in chunks which double in size, so that no more than about twice the
+    memory of the points actually stored is ever allocated, however long the
+    grid. Depending on `store`, keeps every point, every k-th point, no points,
+    or hands every point to a callback.
+    """
+
+    def __init__(self, dim: int, store) -> None:
+        self.dim = dim
+        self.callback = store if callable(store) else None
+        self.every = _storeEvery(store)
+
+        self.chunks = []
+        self.xChunks = []
+        self._newChunk(1024)
+
+    def _newChunk(self, size: int) -> None:
+        self.chunk = np.empty((size, self.dim))
+        self.xChunk = np.empty(size)
+        self.chunks.append(self.chunk)
+        self.xChunks.append(self.xChunk)
+        self.fill = 0
+
+    def append(self, i: int, x: float, y: np.ndarray) -> None:
+        """
+        Records the point `(x, y)`, the `i`-th computed one.
+        """
+        if self.callback is not None:
+            self.callback(x, y)
+            return
+        if self.every == 0 or i % self.every:
+            return
+        if self.fill == self.chunk.shape[0]:
+            # capped so that a long trajectory does not overshoot by much
+            self._newChunk(min(2*self.chunk.shape[0], 1 << 20))
+        self.chunk[self.fill, :] = y
+        self.xChunk[self.fill] = x
+        self.fill += 1
+
+    def recorder(self, observer=None):
+        """
+        Returns the function recording the `i`-th point `(i, x, y)`, which
+        also calls `observer(i, x, y)` if given; without one it is `append`
+        itself, so that no observer costs nothing.
+        """
+        if observer is None:
+            return self.append
+        append = self.append
+        def record(i, x, y):
+            append(i, x, y)
+            observer(i, x, y)
+        return record
+
+    def result(self) -> tuple:
+        """
+        Returns the recorded `(x, y)` arrays trimmed to the points actually
+        stored, or `(None, None)` if nothing was stored.
+        """
+        if self.every == 0:
+            return None, None
+        self.chunks[-1] = self.chunk[:self.fill]
+        self.xChunks[-1] = self.xChunk[:self.fill]
+        if len(self.chunks) == 1:
+            return self.xChunks[0], self.chunks[0]
+        return np.concatenate(self.xChunks), np.concatenate(self.chunks)
 
 class ODEinit(object):
     """
@@ -15,14 +135,22 @@ class ODEinit(object):
     Parameters
     ----------
     y0 : np.ndarray
-        Initial conditions of the vector `y` at position `x = span[0]`
+        Initial conditions of the vector `y` at position `x = span[0]`. A 2-D
+        array of shape `(N, dim)` sets up an ensemble of N independent systems
+        which are advanced together, one row per member.
     deriv
         The function `f` in a functional form. Should accept two parameters at
         which to compute the derivative:
             x: float, the value of the independent variable;
             y: np.ndarray, the value of the dependent variable vector `y`.
-    span : np.ndarray
+    span : np.ndarray or modules.grids.baseGrid
         The interval values over which to compute the value of the vector `y`.
+        Either the array of points or a grid object describing them.
+    inplace : bool, optional
+        Whether `deriv` also accepts a third parameter `out`, an array into
+        which it writes the derivative and which it returns. The fixed step
+        integrations of a single system then use the in-place integrators of
+        `modules.integrators`, which allocate no arrays. By default False.
 
     Attributes
     ----------
@@ -30,18 +158,58 @@ class ODEinit(object):
         The initial state of the system. Passed at initialization.
     deriv
         The function `f` in a functional form. Passed at initialization.
-    span : np.ndarray
-        The interval of values to be integrated over. Passed at initialization.
-        **Assumed to be equidistant!!**
+    span : modules.grids.baseGrid
+        The interval of values to be integrated over, as a grid. Passed at
+        initialization; an array is wrapped in `modules.grids.arrayGrid`. The
+        step size follows the grid point by point. For adaptive integrators
+        only its ends and first step are used.
     interval : float
-        The size of the interval step; equal to `span[1] - span[0]`.
+        The size of the first interval step; equal to `span[1] - span[0]`.
     yOut : np.ndarray
-        The computed values of `y` after integration. Initialized as a matrix
-        of zeros; if integration terminates before the end of `span`, the rest
-        of the points are left as zeros.
+        The computed values of `y` after integration, up to the last valid
+        point, or the ones selected by the `store` option of `integrate`.
+        `None` until integrated, when nothing is stored, and for an ensemble.
+    xOut : np.ndarray
+        The values of `x` the rows of `yOut` correspond to.
+    ensemble : bool
+        Whether `y0` describes an ensemble of systems.
+    inplace : bool
+        Whether `deriv` writes into an `out` array. Passed at initialization.
+    indexEnd : int or np.ndarray
+        Index in `span` of the last valid computed point, or its number among
+        the accepted points of an adaptive integration; per member for an
+        ensemble. Has a value only after integration.
+    xEnd : float or np.ndarray
+        The value of `x` at the last valid computed point, or where a terminal
+        event was located. Has a value only after integration.
+    yEnd : np.ndarray
+        The value of `y` at `xEnd`; one row per member for an ensemble. Has a
+        value only after integration.
+    flagEvent : bool or np.ndarray
+        Whether the integration was stopped by the event passed to
+        `integrate`; per member for an ensemble.
     flagIntegrated : bool
         A flag to indicate whether the integration has been done (and `yOut`
         filled) to be used by methods depending on having computed values.
+    stats : dict
+        What the last integration did, for profiling; the integrations of the
+        process are summed in `modules.ode.totals`. The keys are:
+            members: the number of systems integrated;
+            steps: the steps computed, including the one over an event; of
+                the whole array of active members for an ensemble;
+            rejected: the steps not taken, for the error or because `deriv`
+                could not be evaluated, per member for an ensemble;
+            derivCalls: the calls of `deriv`, one per stage, counting a step
+                stopped by `deriv` in full; an ensemble evaluates all of its
+                active members in one call;
+            eventCalls: the calls of the event function;
+            reason: why the integration stopped, "end" of `span`, "deriv"
+                when it could not be evaluated, "event" or "minStep" when the
+                adaptive step size fell to round-off; an array of them for
+                an ensemble;
+            index: `indexEnd`;
+            time: wall time in s by phase, "steps", "locate" for the events
+                and "output" for assembling `yOut`.
     
     Methods
     -------
@@ -49,62 +217,450 @@ class ODEinit(object):
         Integrates the differential equation.
     """
 
-    def __init__(self, y0: np.ndarray, deriv, span: np.ndarray) -> None:
+    def __init__(self, y0: np.ndarray, deriv, span: np.ndarray,
+                 inplace: bool=False) -> None:
         self.y0 = y0
         self.deriv = deriv
-        self.interval = span[1] - span[0]
-        self.span = span
+        self.span = grids.asGrid(span)
+        self.interval = self.span.stepSize(0)
+        self.ensemble = self.y0.ndim > 1
+        self.inplace = inplace
+        # stage buffers of the in-place integrators, reused by every step
+        self._work = np.empty((integrators.stages,) + np.shape(self.y0))
 
-        # size of this is number of values to be computed x dimensions of y
-        self.yOut = np.zeros((self.span.size, self.y0.size))
+        # filled in as the integration goes, in chunks; most integrations
+        # stop well before the end of span, or do not need every point
+        self.xOut, self.yOut = None, None
         
         # a flag taking note if the equation has been integrated
         self.flagIntegrated = False
     
-    def integrate(self, integrator: int=3) -> None:
+    def integrate(self, integrator: int=3, rtol: float=1e-8,
+                  atol: float=1e-12, events=None, store="full",
+                  observer=None) -> None:
         """
         Integrates the equation using the function of the derivative `deriv`.
         User has the option to choose an integrator from the library, the
         default is a RK4 integrator. As it computes, it fills the `yOut` with 
         the computed values. Can terminate prematurely if the value passed to
-        `deriv` is inappropriate; then the rest of the values are left as zero.
+        `deriv` is inappropriate; then `yOut` ends at the last valid point.
+
+        For an ensemble, `deriv` is called with the `(M, dim)` array of the
+        members still being integrated and should flag the members it cannot
+        evaluate by NaN instead of raising. Such members are frozen at their
+        last valid state and dropped from subsequent steps.
+
+        An adaptive integrator only uses the ends of `span` and `interval` as
+        the first trial step. The step size is then adjusted to keep the
+        estimated local error within `atol + rtol*|y|`; the accepted points
+        are recorded in `xOut` and `yOut`, which only hold the computed rows.
+        When `deriv` cannot be evaluated the step is halved, so the
+        integration stops within round-off of where that happens.
+
+        With `inplace`, the fixed step integrators of a single system work in
+        buffers owned by the instance; the array passed to a `store` function
+        is then reused for later points and has to be copied to be kept.
+
+        A terminal event `g(x, y)` stops the integration at the first step
+        over which `g` changes sign. The root of `g` is then located inside
+        that step by bisection on the cubic Hermite interpolant through its
+        ends, and stored as `xEnd` and `yEnd`; `indexEnd` is the last point
+        computed before the event.
 
         Parameters
         ----------
-        integrator : {1, 2, 3}, optional
+        integrator : {1, 2, 3, 4, 5, 6, 7}, optional
             Choice of the integrator to be used given by the number:
                 1: the Euler first order method;
                 2: the Heun method, a second order method;
-                3: the Runge-Kutta 4th order method.
+                3: the Runge-Kutta 4th order method;
+                4: the Dormand-Prince 5(4) method with adaptive step size;
+                5: the Adams-Bashforth-Moulton 4th order multistep method,
+                    started by RK4;
+                6: the Stormer-Verlet method, 2nd order symplectic;
+                7: Yoshida's 4th order symplectic method.
+                The symplectic methods are for separable systems such as
+                `derivatives.SHO` only, look at `modules.integrators`.
+        rtol : float, optional
+            Relative tolerance of the local error for adaptive integrators.
+        atol : float, optional
+            Absolute tolerance of the local error for adaptive integrators.
+        events : function, optional
+            A terminal event function `g(x, y)` returning a float. For an
+            ensemble, it receives the `(M, dim)` array of members and returns
+            `M` values; during the root-finding `x` is then an array too, one
+            value per row of `y`.
+        store : {"full", "final", "every k"} or function, optional
+            Which of the computed points to keep in `xOut` and `yOut`:
+                "full": all of them, the default;
+                "final": none, only `xEnd` and `yEnd` are recorded;
+                "every k": the initial point and every k-th one after it,
+                    e.g. "every 10";
+                function: none, `store(x, y)` is called for every point.
+            Memory use is constant with "final" or a function. An ensemble
+            only supports "final", which it uses regardless.
+        observer : function, optional
+            Called as `observer(i, x, y)` with every point computed, after
+            it is stored, whatever `store` is; `i` is its index in `span`,
+            or among the accepted points of an adaptive integration. As for
+            a `store` function, `y` may be reused afterwards. By default
+            none, at no cost.
+
+        Raises
+        ------
+        ValueError
+            If an adaptive or multistep integrator is requested for an
+            ensemble; the step size could not be shared by all members, nor
+            the history dropped with them. If `store` is not one
+            of the modes above, or an observer is given for an ensemble.
         
         See Also
         --------
         modules.integrators
         """
-        # choose an integrator
-        self.integrator = integrators.index[integrator]
+        if self.ensemble and observer is not None:
+            raise ValueError("An ensemble does not support observers")
+        start = time.perf_counter()
+        self.stats = _newStats(self.y0.shape[0] if self.ensemble else 1)
+        self._evaluations = integrators.evaluations[integrator]
+        if integrator in integrators.adaptive:
+            if self.ensemble:
+                raise ValueError("Adaptive integrators do not support ensembles")
+            self.integrator = integrators.adaptive[integrator]
+            self._integrateAdaptive(rtol, atol, events, _Trajectory(
+                self.y0.size, store), observer)
+        else:
+            # choose an integrator
+            self.integrator = integrators.index[integrator]
+            if isinstance(self.integrator, type):
+                # a multistep method, with a history for this integration
+                if self.ensemble:
+                    raise ValueError(
+                        "Multistep integrators do not support ensembles")
+                self.integrator = self.integrator()
+            if self.ensemble:
+                if store not in ("full", "final"):
+                    raise ValueError("An ensemble only stores the final states")
+                self._integrateEnsemble(events)
+            elif self.inplace and integrator in integrators.inPlace:
+                self.integrator = integrators.inPlace[integrator]
+                self._integrateFixed(events, _Trajectory(self.y0.size, store),
+                                     observer, self._work)
+            else:
+                self._integrateFixed(events, _Trajectory(self.y0.size, store),
+                                     observer)
+        self._finishStats(start)
+        
+        # to assert that the ODE has been integrated in functions that use yOut.
+        self.flagIntegrated = True
+
+    def _finishStats(self, start: float) -> None:
+        # the steps take the time not spent in the other phases; the stats
+        # are then added to those of the process
+        times = self.stats["time"]
+        times["steps"] = (time.perf_counter() - start - times["locate"] -
+                          times["output"])
+        addStats(totals, self.stats)
+
+    def _integrateFixed(self, events, out: _Trajectory, observer=None,
+                        work: np.ndarray=None) -> None:
+        """
+        Integrates a single system over the points of `span`. Given the stage
+        buffers `work`, the integrator is an in-place one, and the new values
+        are computed into a second state array swapped with `y` every step.
+        """
+        # the last point is the valid one unless the integration stops early
+        self.indexEnd = self.span.size - 1
+        self.flagEvent = False
 
         # fill in the initial value of y
-        self.yOut[0,:] = self.y0[:]
+        y = np.array(self.y0, dtype=float)
+        if work is not None:
+            yNew = np.empty_like(y)
+        record = out.recorder(observer)
+        record(0, self.span[0], y)
+        if events is not None:
+            gOld = events(self.span[0], y)
+        reason = "end"
 
         #cycle does the integration
-        for i in range(self.span.size-1):
+        for i, (x, h, xNext) in enumerate(self.span.steps()):
             # the try except handles the case where integration is impossible, 
             # i.e. when the value of an element of y is nonphysical. deriv
             # decides when this is the case.
             try:
                 # calculate the new value
-                adder = self.integrator(
-                    self.span[i], self.yOut[i,:], self.deriv, self.interval)
-                # append new value
-                self.yOut[i+1,:] = adder
+                if work is None:
+                    adder = self.integrator(x, y, self.deriv, h)
+                else:
+                    adder = self.integrator(x, y, self.deriv, h, yNew, work)
             except ValueError:
                 # ends the integration if it is impossible to integrate - Value
                 # Error concerns the y-values
+                self.indexEnd = i
+                reason = "deriv"
                 break
-        
-        # to assert that the ODE has been integrated in functions that use yOut.
-        self.flagIntegrated = True
+
+            if events is not None:
+                gNew = events(xNext, adder)
+                if gOld != 0 and gOld*gNew <= 0:
+                    # the event is inside the last step; locate it and drop
+                    # the point beyond it
+                    self.indexEnd = i
+                    self.flagEvent = True
+                    reason = "event"
+                    self.xEnd, self.yEnd = self._locate(
+                        events, x, y, xNext, adder, gOld)
+                    break
+                gOld = gNew
+            # append new value; in place, the old state takes the next one
+            if work is not None:
+                yNew = y
+            y = adder
+            record(i+1, xNext, y)
+
+        if not self.flagEvent:
+            self.xEnd = self.span[self.indexEnd]
+            self.yEnd = y
+        tOutput = time.perf_counter()
+        self.xOut, self.yOut = out.result()
+
+        # the counts follow from where the loop stopped, so that the loop
+        # itself counts nothing
+        stats = self.stats
+        stats["time"]["output"] += time.perf_counter() - tOutput
+        stats["steps"] = self.indexEnd + (reason == "event")
+        stats["rejected"] = int(reason == "deriv")
+        # a multistep integrator counts its calls, which vary by step
+        calls = getattr(self.integrator, "calls", None)
+        stats["derivCalls"] += calls if calls is not None else \
+            self._evaluations*(stats["steps"] + stats["rejected"])
+        if events is not None:
+            stats["eventCalls"] += 1 + stats["steps"]
+        stats["reason"], stats["index"] = reason, self.indexEnd
+
+    def _integrateAdaptive(self, rtol: float, atol: float, events,
+                           out: _Trajectory, observer=None) -> None:
+        """
+        Integrates a single system from `span[0]` to `span[-1]` with step size
+        control, following the standard controller in [1]_.
+
+        Sources
+        -------
+        ..[1] Hairer, Ernst, Syvert P. Norsett, and Gerhard Wanner. "Solving
+        Ordinary Differential Equations I: Nonstiff Problems." Second ed.
+        Springer, 1993.
+        """
+        x, xStop = float(self.span[0]), float(self.span[-1])
+        y = np.array(self.y0, dtype=float)
+        h = float(self.interval)
+        # below this the step cannot be told apart from round-off in x
+        hMin = 16*np.finfo(float).eps*max(abs(x), abs(xStop))
+        self.flagEvent = False
+        stats = self.stats
+        if events is not None:
+            gOld = events(x, y)
+            stats["eventCalls"] += 1
+
+        # number of accepted points
+        self.indexEnd = 0
+        record = out.recorder(observer)
+        record(0, x, y)
+        reason = "end"
+        # derivative at the current point, reused thanks to FSAL
+        k1 = None
+        while x < xStop:
+            hStep = min(h, xStop - x)
+            stats["derivCalls"] += self._evaluations + (k1 is None)
+            try:
+                yNew, yErr, kNew = self.integrator(x, y, self.deriv, hStep, k1)
+            except ValueError:
+                # the trial step reaches where deriv cannot be evaluated; home
+                # in on that point by halving, and stop once at round-off
+                stats["rejected"] += 1
+                if hStep <= hMin:
+                    reason = "deriv"
+                    break
+                h = 0.5*hStep
+                continue
+
+            # scaled RMS norm of the error estimate
+            scale = atol + rtol*np.maximum(np.abs(y), np.abs(yNew))
+            err = np.sqrt(np.mean((yErr/scale)**2))
+            if err <= 1.0:
+                stats["steps"] += 1
+                if events is not None:
+                    gNew = events(x + hStep, yNew)
+                    stats["eventCalls"] += 1
+                    if gOld != 0 and gOld*gNew <= 0:
+                        self.flagEvent = True
+                        reason = "event"
+                        if k1 is None:
+                            k1 = self.deriv(x, y)
+                            stats["derivCalls"] += 1
+                        self.xEnd, self.yEnd = self._locate(
+                            events, x, y, x + hStep, yNew, gOld, k1, kNew)
+                        break
+                    gOld = gNew
+                x += hStep
+                y, k1 = yNew, kNew
+                self.indexEnd += 1
+                record(self.indexEnd, x, y)
+                factor = 5.0 if err == 0 else min(5.0, 0.9*err**(-0.2))
+            else:
+                stats["rejected"] += 1
+                if hStep <= hMin:
+                    reason = "minStep"
+                    break
+                factor = max(0.2, 0.9*err**(-0.2))
+            h = hStep*factor
+
+        if not self.flagEvent:
+            self.xEnd, self.yEnd = x, y
+        tOutput = time.perf_counter()
+        self.xOut, self.yOut = out.result()
+        stats["time"]["output"] += time.perf_counter() - tOutput
+        stats["reason"], stats["index"] = reason, self.indexEnd
+
+    def _integrateEnsemble(self, events) -> None:
+        """
+        Integrates all members of an ensemble together, one step of the whole
+        `(M, dim)` array of active members at a time. Members whose step comes
+        out as NaN, or over which the event changes sign, are recorded in
+        `indexEnd`/`xEnd`/`yEnd` and masked out.
+        """
+        y = np.array(self.y0, dtype=float)
+        self.yEnd = y.copy()
+        self.indexEnd = np.full(y.shape[0], self.span.size - 1)
+        self.flagEvent = np.zeros(y.shape[0], dtype=bool)
+        # original positions of the members still being integrated
+        active = np.arange(y.shape[0])
+        self._select(active)
+        stats = self.stats
+        # members which ran to the end of span are marked at the end
+        stats["reason"] = np.full(y.shape[0], "deriv", dtype=object)
+        if active.size == 0:
+            self.xEnd = self.span[self.indexEnd]
+            stats["index"] = self.indexEnd.copy()
+            return
+        if events is not None:
+            gOld = events(self.span[0], y)
+            stats["eventCalls"] += 1
+        # event locations, NaN for members without one
+        xEvent = np.full(y.shape[0], np.nan)
+
+        for i, (x, h, xNext) in enumerate(self.span.steps()):
+            adder = self.integrator(x, y, self.deriv, h)
+            stats["steps"] += 1
+            done = np.isnan(adder).any(axis=1)
+
+            if events is not None:
+                gNew = events(xNext, adder)
+                stats["eventCalls"] += 1
+                crossed = (gOld != 0) & (gOld*gNew <= 0) & ~done
+                if crossed.any():
+                    # interpolate with the constants of all active members,
+                    # then keep the ones which crossed
+                    f0 = self.deriv(x, y)[crossed]
+                    f1 = self.deriv(xNext, adder)[crossed]
+                    stats["derivCalls"] += 2
+                    members = active[crossed]
+                    xEvent[members], self.yEnd[members] = self._locate(
+                        events, x, y[crossed], xNext, adder[crossed],
+                        gOld[crossed], f0, f1)
+                    self.indexEnd[members] = i
+                    self.flagEvent[members] = True
+                    # the located members are finished from here on
+                    done |= crossed
+                gOld = gNew
+
+            if done.any():
+                # same as the break in the single system case, but only for
+                # the members which could not be evaluated
+                located = self.flagEvent[active[done]]
+                members = active[done][~located]
+                stats["rejected"] += members.size
+                self.indexEnd[members] = i
+                self.yEnd[members] = y[done][~located]
+                keep = ~done
+                active = active[keep]
+                adder = adder[keep]
+                if events is not None:
+                    gOld = gOld[keep]
+                if active.size == 0:
+                    break
+                self._select(active)
+            y = adder
+
+        # members which ran to the end of span
+        if active.size:
+            self.yEnd[active] = y
+            stats["reason"][active] = "end"
+        self.xEnd = np.where(
+            self.flagEvent, xEvent, self.span[self.indexEnd])
+        stats["reason"][self.flagEvent] = "event"
+        stats["derivCalls"] += self._evaluations*stats["steps"]
+        stats["index"] = self.indexEnd.copy()
+
+    def _locate(self, events, x0, y0, x1, y1, g0, f0=None, f1=None) -> tuple:
+        """
+        Locates the root of the event `events` between `(x0, y0)` and
+        `(x1, y1)`, where it changes sign, using the cubic Hermite
+        interpolant through the states and derivatives `f0`, `f1` at both
+        ends. The derivatives are computed if not given. For an ensemble, the
+        arguments hold the rows of the members to locate.
+
+        Returns
+        -------
+        tuple
+            The position `x` of the event and the interpolated state there.
+        """
+        start = time.perf_counter()
+        if f0 is None:
+            f0 = self.deriv(x0, y0)
+            self.stats["derivCalls"] += 1
+        if f1 is None:
+            f1 = self.deriv(x1, y1)
+            self.stats["derivCalls"] += 1
+        h = x1 - x0
+
+        def interpolant(x):
+            t = (x - x0)/h
+            if np.ndim(t):
+                t = t[:, None]
+            return ((1 + 2*t)*(1 - t)**2*y0 + t*(1 - t)**2*h*f0 +
+                    t*t*(3 - 2*t)*y1 - t*t*(1 - t)*h*f1)
+
+        # bisection keeps the sign of g0 at a; vectorized over the members of
+        # an ensemble, hence the np.where instead of branches
+        a = np.full(np.shape(g0), x0, dtype=float)
+        b = np.full(np.shape(g0), x1, dtype=float)
+        gA = g0
+        # halving the step this many times takes it below round-off in x
+        for _ in range(60):
+            xMid = 0.5*(a + b)
+            gMid = events(xMid, interpolant(xMid))
+            self.stats["eventCalls"] += 1
+            same = np.sign(gMid) == np.sign(gA)
+            a = np.where(same, xMid, a)
+            gA = np.where(same, gMid, gA)
+            b = np.where(same, b, xMid)
+            if np.all(b - a <= 4*np.finfo(float).eps*np.abs(b)):
+                break
+
+        x = 0.5*(a + b)
+        if not np.ndim(x):
+            x = float(x)
+        self.stats["time"]["locate"] += time.perf_counter() - start
+        return x, interpolant(x)
+
+    def _select(self, members: np.ndarray) -> None:
+        """
+        Hook called by an ensemble integration whenever the set of active
+        members changes. Subclasses holding per-member parameters used in
+        `deriv` should restrict them to `members` (indices into `y0`).
+        """
+        pass
 
 if __name__=="__main__":
     print(
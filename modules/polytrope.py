@@ -0,0 +1,115 @@
+"""
+Polytrope Scaling(`polytrope.py`)
+=================================
+
+The non-relativistic (regime 1) and ultra-relativistic (regime 3) equations of
+state are polytropes, `pressure ~ rho^(1 + 1/n)` with `n = 3/2` and `n = 3`.
+For these the white dwarf equations are homologous: with the substitution
+`x = a*s` and `m = a^3*mu`, where `a = |const|^(-1/2)`, the normalized ODE of
+`modules.whiteDwarf` becomes the same dimensionless equation for any central
+density,
+
+    `[rho, mu]' = [-mu*rho^p/s^2, 3*s^2*rho]`,  `p = 1 - 1/n`.
+
+It is solved once per regime, and the radius and mass of any star then follow
+by scaling the surface `(s1, mu1)` of the dimensionless solution.
+
+Functions
+---------
+surface         The surface `(s1, mu1)` of the dimensionless solution, cached.
+radiusMass      Radius and mass of a white dwarf for any central density.
+
+Implementation Notes
+--------------------
+The dimensionless solution is computed with the adaptive integrator of
+`modules.ode`, starting at a small `s` from the series expansion about the
+centre and locating the surface `rho = 0` as an event. It is kept in memory
+for the lifetime of the process.
+"""
+
+import functools
+
+import numpy as np
+
+from . import grids, ode
+from .whiteDwarf import constants
+
+# power of the density in the derivative of rho, for the polytropic regimes
+exponent = {1: 1.0/3, 3: 2.0/3}
+
+def laneEmden(x: float, y: np.ndarray, p: float) -> np.ndarray:
+    """
+    The dimensionless derivative `[rho, mu]' = [-mu*|rho|^p/s^2, 3*s^2*rho]`,
+    a form of the Lane-Emden equation. The power of `|rho|` lets the solution
+    cross the surface, look at `modules.derivatives.nonRelativGas`.
+    """
+    return np.array([-y[1]*(abs(y[0])**p)*(x**(-2.0)), 3*(x**2)*y[0]])
+
+@functools.lru_cache(maxsize=None)
+def surface(regime: int) -> tuple:
+    """
+    Solves the dimensionless equation of a polytropic regime and returns its
+    surface. Computed once and cached.
+
+    Parameters
+    ----------
+    regime : {1, 3}
+        The non-relativistic or the ultra-relativistic regime.
+
+    Returns
+    -------
+    tuple
+        The tuple `(s1, mu1)` of the dimensionless radius and mass.
+
+    Raises
+    ------
+    ValueError
+        If the regime is not a polytrope.
+    """
+    if regime not in exponent:
+        raise ValueError(
+            "Regime {} is not a polytrope, it has to be integrated".format(regime))
+    p = exponent[regime]
+
+    # start off the centre, where rho = 1 - s^2/2 + (3/5 + p)*s^4/8 and
+    # mu = s^3 - 3*s^5/10; the next terms are below round-off at this s
+    s0 = 1e-4
+    y0 = np.array([1 - s0**2/2 + (0.6 + p)*s0**4/8, s0**3 - 0.3*s0**5])
+    # the surface is at s < 10 for both regimes, the grid only gives the range
+    span = grids.uniformGrid(s0, 1e-3, 20000)
+    sol = ode.ODEinit(y0, lambda a, b: laneEmden(a, b, p), span)
+    # rho goes to zero as a power of the distance to the surface; the tiny
+    # absolute tolerance keeps the error control on it right up to there
+    sol.integrate(4, rtol=1e-12, atol=1e-30, store="final",
+                  events=lambda a, b: b[0])
+    return float(sol.xEnd), float(sol.yEnd[1])
+
+def radiusMass(rhoC, regime: int) -> tuple:
+    """
+    Finds the radius and mass of the white dwarf from the scaled dimensionless
+    solution, without integrating.
+
+    Parameters
+    ----------
+    rhoC : float or np.ndarray
+        The central density in kg*m^(-3).
+    regime : {1, 3}
+        The non-relativistic or the ultra-relativistic regime.
+
+    Returns
+    -------
+    tuple
+        The tuple `(Radius, Mass)` in m and kg, with the normalization of
+        `modules.whiteDwarf.getRadiusMass`.
+    """
+    s1, mu1 = surface(regime)
+    const1, const2 = constants(rhoC)
+    const = const1 if regime == 1 else const1*const2**0.5
+    a = np.abs(const)**(-0.5)
+
+    l = (3/(4*np.pi))**(1.0/3.0)                # normalization const
+    return a*s1*l, (a**3)*mu1*rhoC
+
+if __name__=="__main__":
+    print(
+        "This file contains the scaling solution of polytropic white dwarfs.")
@@ -0,0 +1,153 @@
+"""
+Results Store(`results.py`)
+===========================
+
+This is a home to the binary format of the result tables written by the
+scripts, replacing the CSV files: `main.py` and `convergence.py` write their
+stars, `methodEval.py` the errors of its methods. A table is a
+directory holding one `.npy` file per column and a small `meta.json` header,
+so that it is written straight from the arrays and read back by memory
+mapping, without formatting or parsing text.
+
+Classes
+-------
+resultTable     A table read from disk, its columns mapped on first use.
+
+Functions
+---------
+save            Writes a table of named columns.
+load            Opens a table written by `save`.
+
+Implementation Notes
+--------------------
+The columns are stored in the native `.npy` format of NumPy and opened with
+`np.load(..., mmap_mode="r")`: only the pages of a column which are used are
+read from disk, so that a plot of the first 20 s of a trajectory of 10^7 rows
+only reads the start of it. A table is written into a temporary directory
+which is then renamed into place, so a reader never sees half of it.
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+# the suffix of the directory of a table
+suffix = ".cols"
+
+def _directory(path: str) -> str:
+    # tables are named without the suffix, like the CSV files they replace
+    return path if path.endswith(suffix) else path + suffix
+
+def save(path: str, columns: dict, **meta) -> str:
+    """
+    Writes a table of named columns of equal length.
+
+    Parameters
+    ----------
+    path : str
+        The name of the table; the directory `path + ".cols"` is created, or
+        replaced.
+    columns : dict
+        The 1D arrays of the table by name, in order.
+    **meta
+        Anything JSON serializable to keep in the header, e.g. the grid or
+        the tolerance the results were computed with.
+
+    Returns
+    -------
+    str
+        The directory of the table.
+
+    Raises
+    ------
+    ValueError
+        If the columns are not 1D or not of the same length.
+    """
+    arrays = {name: np.ascontiguousarray(col) for name, col in columns.items()}
+    lengths = {a.shape[0] if a.ndim == 1 else -1 for a in arrays.values()}
+    if len(lengths) > 1 or -1 in lengths:
+        raise ValueError("The columns must be 1D and of the same length")
+
+    directory = _directory(path)
+    tmp = directory + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for k, (name, array) in enumerate(arrays.items()):
+        np.save(os.path.join(tmp, "{}.npy".format(k)), array)
+    header = {"columns": list(arrays), "rows": lengths.pop() if lengths else 0,
+              "meta": meta}
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(header, f, indent=1)
+    # a directory cannot be replaced atomically; the old one is moved aside
+    # first so that the window without a table is only between two renames
+    old = directory + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(directory):
+        os.rename(directory, old)
+    os.rename(tmp, directory)
+    shutil.rmtree(old, ignore_errors=True)
+    return directory
+
+class resultTable(object):
+    """
+    A table written by `save`, indexed by column name like a
+    `pandas.DataFrame`; the columns are memory mapped when first used.
+
+    Parameters
+    ----------
+    path : str
+        The name of the table, with or without the suffix.
+    mmap : bool, optional
+        Map the columns rather than read them whole, by default True.
+
+    Attributes
+    ----------
+    columns : list
+        The names of the columns, in order.
+    meta : dict
+        The metadata given to `save`.
+    """
+
+    def __init__(self, path: str, mmap: bool=True) -> None:
+        self.path = _directory(path)
+        with open(os.path.join(self.path, "meta.json")) as f:
+            header = json.load(f)
+        self.columns = header["columns"]
+        self.meta = header["meta"]
+        self._rows = header["rows"]
+        self._mode = "r" if mmap else None
+        self._arrays = {}
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name not in self._arrays:
+            if name not in self.columns:
+                raise KeyError(name)
+            file = os.path.join(self.path,
+                                "{}.npy".format(self.columns.index(name)))
+            self._arrays[name] = np.load(file, mmap_mode=self._mode)
+        return self._arrays[name]
+
+    def where(self, mask: np.ndarray) -> dict:
+        """
+        Returns the rows selected by the boolean `mask` as a dict of arrays,
+        e.g. one density of a table of several.
+        """
+        return {name: np.asarray(self[name][mask]) for name in self.columns}
+
+def load(path: str, mmap: bool=True) -> resultTable:
+    """
+    Opens a table written by `save`, look at `resultTable`.
+    """
+    return resultTable(path, mmap)
+
+if __name__=="__main__":
+    print(
+        "This file contains the binary store of result tables.")
@@ -0,0 +1,588 @@
+"""
+Sweep Driver(`sweep.py`)
+========================
+
+This is a home to the driver of a sweep over central densities, as done in
+`main.py`. Stars are integrated in a pool of processes and every result is
+written to disk as soon as it comes back, so that a crash or an interrupt only
+loses the stars being computed at the time. A sweep can then be resumed,
+skipping the densities already recorded.
+
+Classes
+-------
+resultSink      Append-only file of result rows, synced to disk on every write.
+workerPool      Long-lived workers with a single queue, longest task first.
+profileArena    Memory-mapped file the workers write star profiles into.
+
+Functions
+---------
+run             Runs a sweep in a pool, streaming the results into a sink.
+runMany         Runs several sweeps through the queue of one pool.
+refine          Runs a sweep refining the densities where the mass-radius
+                curve is poorly resolved.
+profiles        Collects the profiles of many stars in an arena.
+workerCount     The number of workers bounded by the CPUs and the memory.
+starCost        The expected cost of a star, for the order of the queue.
+
+Implementation Notes
+--------------------
+The sink is a plain CSV file, one row per star with the density written with
+`repr`, so that it is read back exactly and matched against the densities of
+the sweep. Rows are appended with a single write followed by `os.fsync`; a row
+cut short by a crash is the last line of the file, and is dropped when the
+file is read.
+
+Profiles `(x, rho, m)` are not returned through the pool, which would pickle
+them across the process boundary, but written by the workers into a sparse
+memory-mapped file, in regions allocated by the parent before the sweep; only
+the offset and length of each profile come back.
+"""
+
+import os
+import sys
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+
+from . import grids, ode, polytrope
+
+class resultSink(object):
+    """
+    Append-only file of result rows `[rhoC, ...]`.
+
+    Parameters
+    ----------
+    path : str
+        The file of the sink.
+    columns : list
+        The names of the columns, written as the header of a new file.
+    resume : bool, optional
+        Whether to keep the rows already in the file, by default False, in
+        which case it is started afresh.
+
+    Attributes
+    ----------
+    rows : dict
+        The rows recorded, by density; the ones read from the file on resume
+        and the ones appended since.
+    stats : dict
+        The statistics of the integrations done for the rows appended by a
+        sweep, summed by `modules.ode.addStats`; not kept in the file.
+    """
+
+    def __init__(self, path: str, columns: list, resume: bool=False) -> None:
+        self.path = path
+        self.columns = list(columns)
+        self.rows = {}
+        self.stats = {}
+        if resume and os.path.exists(path):
+            self._read()
+        else:
+            self._write(",".join(self.columns) + "\n", "w")
+
+    def _read(self) -> None:
+        with open(self.path) as f:
+            lines = f.read().split("\n")
+        # the text after the last newline is a row cut short, if any
+        for line in lines[1:-1]:
+            values = line.split(",")
+            if len(values) != len(self.columns):
+                continue
+            try:
+                row = [float(v) for v in values]
+            except ValueError:
+                continue
+            self.rows[row[0]] = row
+        if lines[-1]:
+            # drop the partial row, later rows start on a fresh line
+            with open(self.path, "r+") as f:
+                f.truncate(len("\n".join(lines[:-1])) + 1)
+
+    def _write(self, text: str, mode: str="a") -> None:
+        with open(self.path, mode) as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __contains__(self, rhoC: float) -> bool:
+        return float(rhoC) in self.rows
+
+    def append(self, rows: list) -> None:
+        """
+        Records the rows and syncs them to disk.
+        """
+        rows = [[float(v) for v in row] for row in rows]
+        self._write("".join(",".join(repr(v) for v in row) + "\n"
+                            for row in rows))
+        for row in rows:
+            self.rows[row[0]] = row
+
+    def table(self, rhoVal: np.ndarray) -> list:
+        """
+        Returns the rows of the densities `rhoVal`, in their order; densities
+        without a row are left out.
+        """
+        return [self.rows[float(r)] for r in rhoVal if float(r) in self.rows]
+
+def workerCount(memoryPerWorker: int=384*2**20, processes: int=None) -> int:
+    """
+    The number of worker processes the machine can hold: no more than the
+    CPUs available to this process, nor than fit in the available memory at
+    `memoryPerWorker` bytes each, nor than `processes` if given; at least one.
+    A worker of `main.py` takes about 210 MiB once it has integrated a star.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = cpu_count()
+    count = min(cpus, processes or cpus)
+    available = _availableMemory()
+    if available is not None:
+        count = min(count, available//memoryPerWorker)
+    return max(1, int(count))
+
+def _availableMemory():
+    # memory available for new processes in bytes, None if it cannot be told
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1])*1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES")*os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def starCost(rhoC, regime: int, n, length: float=8.1e7) -> np.ndarray:
+    """
+    The expected cost of integrating stars on the grids of `main.py`, `n`
+    points from 1 to `length`: the number of steps to the surface. The radius
+    is estimated from the polytropes, look at `modules.limits.starRadiusMass`.
+    """
+    rhoC = np.asarray(rhoC, dtype=float)
+    l = (3/(4*np.pi))**(1.0/3.0)
+    if regime == 1:
+        size = polytrope.radiusMass(rhoC, 1)[0]/l
+    elif regime == 3:
+        size = polytrope.radiusMass(rhoC, 3)[0]/l
+    else:
+        size = np.minimum(polytrope.radiusMass(rhoC, 1)[0],
+                          polytrope.radiusMass(rhoC, 3)[0])/l
+    n = np.asarray(n, dtype=float)
+    return np.minimum(n - 1, (size - 1)*(n - 1)/(length - 1))
+
+def _call(task):
+    # runs a task of workerPool.imap in a worker; the index goes along so that
+    # the results can be matched up
+    k, func, arg = task
+    return k, func(arg)
+
+class workerPool(object):
+    """
+    A pool of long-lived worker processes for sweeps, with a single queue of
+    tasks handed out longest first.
+
+    Workers are kept for the whole sweep, so that the libraries are imported,
+    the kernels compiled and the caches of `modules.polytrope` and
+    `modules.cache` filled once per worker rather than once per star. Tasks of
+    any kind, e.g. stars of both regimes, share the queue; ordering them by
+    expected cost, longest first, keeps a long star from starting last and
+    leaving the other workers idle at the end. `modules.cluster.clusterPool`
+    has the same interface with workers on several machines.
+
+    Parameters
+    ----------
+    processes : int, optional
+        The largest number of workers, by default one per CPU.
+    memoryPerWorker : int, optional
+        The memory a worker is expected to take in bytes; the workers are
+        limited to the memory available. Look at `workerCount`.
+
+    Attributes
+    ----------
+    processes : int
+        The number of workers.
+    """
+
+    def __init__(self, processes: int=None,
+                 memoryPerWorker: int=384*2**20) -> None:
+        self.processes = workerCount(memoryPerWorker, processes)
+        self._pool = Pool(self.processes)
+
+    def imap(self, func, tasks: list, costs=None):
+        """
+        Applies `func` to each of `tasks` in the workers, handing out the
+        tasks in order of decreasing `costs` if given.
+
+        Yields
+        ------
+        tuple
+            `(k, result)` for the k-th task, in whichever order they finish.
+        """
+        order = range(len(tasks))
+        if costs is not None:
+            order = np.argsort(-np.asarray(costs, dtype=float), kind="stable")
+        yield from self._pool.imap_unordered(
+            _call, [(int(k), func, tasks[k]) for k in order])
+
+    def close(self) -> None:
+        """
+        Lets the workers finish and shuts them down.
+        """
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self) -> "workerPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if exc[0] is None:
+            self.close()
+        else:
+            self._pool.terminate()
+
+def _dispatch(pool: workerPool, jobs: list, chunkSize: int,
+              progress: bool) -> None:
+    """
+    Hands the densities of `jobs`, tuples `(func, todo, sink, cost)`, to the
+    pool in chunks, longest expected first, and records each in its sink as it
+    comes back. `cost` maps densities to their expected costs, or is None.
+    """
+    tasks, costs, owners = [], [], []
+    for j, (func, todo, sink, cost) in enumerate(jobs):
+        if todo.size == 0:
+            continue
+        # similar stars go together, so that chunks are evenly costed
+        c = np.ones(todo.size) if cost is None else np.asarray(cost(todo))
+        order = np.argsort(-c, kind="stable")
+        for chunk in np.array_split(order, -(-todo.size//chunkSize)):
+            tasks.append(todo[chunk])
+            costs.append(c[chunk].sum())
+            owners.append(j)
+    total = [len(sink.rows) + todo.size for _, todo, sink, _ in jobs]
+    # the tasks of all jobs through the one queue of the pool
+    funcs = [jobs[j][0] for j in owners]
+    for k, (rows, stats) in pool.imap(_apply, list(zip(funcs, tasks)), costs):
+        sink = jobs[owners[k]][2]
+        sink.append(rows)
+        if stats:
+            ode.addStats(sink.stats, stats)
+        if progress:
+            print("{}: {}/{} stars".format(
+                sink.path, len(sink.rows), total[owners[k]]), file=sys.stderr)
+
+def _apply(task):
+    # a task of a job, its function along with its densities; returns the
+    # rows along with the statistics of the integrations done for them, which
+    # are still added to those of the worker
+    func, arg = task
+    saved, ode.totals = ode.totals, {}
+    try:
+        rows = func(arg)
+    finally:
+        stats, ode.totals = ode.totals, saved
+        if stats:
+            ode.addStats(saved, stats)
+    return rows, stats
+
+def run(func, rhoVal: np.ndarray, sink: resultSink, pool: workerPool=None,
+        chunkSize: int=4, progress: bool=True, cost=None) -> list:
+    """
+    Computes the stars of `rhoVal` not yet in `sink` in a pool of processes
+    and records each chunk in the sink as soon as it is done, in whichever
+    order they finish.
+
+    Parameters
+    ----------
+    func : function
+        Maps an array of densities to a list of rows `[rhoC, ...]`, one per
+        density, e.g. `main.starInitRelativ`. Has to be picklable.
+    rhoVal : np.ndarray
+        The densities of the sweep.
+    sink : resultSink
+        The sink the rows are written to.
+    pool : workerPool, optional
+        The pool to run in; by default one is started for the sweep.
+    chunkSize : int, optional
+        The number of densities handed to `func` at once, by default 4.
+        Smaller chunks lose less on an interrupt, larger ones make better
+        ensembles.
+    progress : bool, optional
+        Whether to report progress on stderr.
+    cost : function, optional
+        Maps densities to the expected cost of their stars, e.g. with
+        `starCost`; the most costly are started first.
+
+    Returns
+    -------
+    list
+        The rows of all of `rhoVal`, in its order.
+    """
+    runMany([(func, rhoVal, sink, cost)], pool, chunkSize, progress)
+    return sink.table(rhoVal)
+
+def runMany(jobs: list, pool: workerPool=None, chunkSize: int=4,
+            progress: bool=True) -> None:
+    """
+    Runs several sweeps through a single queue of the pool, e.g. the two
+    regimes of `main.py`, as `run` does for one.
+
+    Parameters
+    ----------
+    jobs : list
+        Tuples `(func, rhoVal, sink, cost)`, the parameters of `run`; `cost`
+        may be None.
+    pool, chunkSize, progress
+        As in `run`.
+    """
+    jobs = [(func, np.array([r for r in rhoVal if r not in sink], dtype=float),
+             sink, cost) for func, rhoVal, sink, cost in jobs]
+    if all(todo.size == 0 for _, todo, _, _ in jobs):
+        return
+    if pool is None:
+        with workerPool() as pool:
+            _dispatch(pool, jobs, chunkSize, progress)
+    else:
+        _dispatch(pool, jobs, chunkSize, progress)
+
+class profileArena(object):
+    """
+    A preallocated memory-mapped file of profile rows `(x, rho, m)`, into
+    which workers write the profiles of the stars they integrate, so that
+    only the offsets and lengths of the profiles go back through the pool.
+
+    The parent allocates every star a region as large as its profile can be,
+    which a worker fills from the start. The file is sparse, so the part of a
+    region beyond the trimmed profile takes neither disk nor memory. Regions
+    do not overlap, so the workers need no locks.
+
+    Parameters
+    ----------
+    path : str
+        The file of the arena.
+    capacity : int
+        The number of rows; the file is created, or truncated, to this size.
+
+    Attributes
+    ----------
+    array : np.memmap
+        The `(capacity, 3)` array of the rows, in the parent.
+    """
+
+    columns = 3
+
+    def __init__(self, path: str, capacity: int) -> None:
+        self.path = path
+        self.capacity = int(capacity)
+        self.array = np.memmap(path, dtype=float, mode="w+",
+                               shape=(self.capacity, self.columns))
+        self._next = 0
+
+    def allocate(self, rows: int) -> int:
+        """
+        Reserves a region of `rows` rows and returns its offset.
+
+        Raises
+        ------
+        ValueError
+            If the arena is full.
+        """
+        if self._next + rows > self.capacity:
+            raise ValueError("The profile arena is full")
+        offset = self._next
+        self._next += int(rows)
+        return offset
+
+    def view(self, offset: int, length: int) -> np.ndarray:
+        """
+        Returns the `(length, 3)` rows of a profile, a view into the file.
+        """
+        return self.array[offset:offset + length]
+
+    @classmethod
+    def write(cls, path: str, offset: int, rows: np.ndarray) -> None:
+        """
+        Writes `rows` at `offset` of the arena file at `path`; used by the
+        workers, which map only the region written.
+        """
+        region = np.memmap(path, dtype=float, mode="r+",
+                           offset=offset*cls.columns*8,
+                           shape=(rows.shape[0], cls.columns))
+        region[:] = rows
+        region.flush()
+        del region
+
+def _profileTask(task) -> tuple:
+    """
+    Integrates a star keeping every `every`-th point, appends the surface, and
+    writes the profile into the arena; returns `(rhoC, Radius, Mass, offset,
+    length)`.
+    """
+    from .whiteDwarf import whiteDwarf
+
+    rhoC, regime, span, every, path, offset = task
+    star = whiteDwarf(rhoC, span, regime)
+    star.integrate(3, surface=True, store="every {}".format(every),
+                   backend="jit")
+    rows = np.column_stack((star.xOut, star.yOut))
+    if star.flagEvent:
+        rows = np.vstack((rows, [star.xEnd, star.yEnd[0], star.yEnd[1]]))
+    profileArena.write(path, offset, rows)
+    radius, mass = star.getRadiusMass()
+    return rhoC, float(radius), float(mass), offset, rows.shape[0]
+
+def profiles(rhoVal: np.ndarray, regime: int, span, path: str,
+             every: int=1, pool: workerPool=None) -> tuple:
+    """
+    Integrates the stars of `rhoVal` in the pool and collects their profiles
+    `(x, rho, m)` up to the surface in a `profileArena` at `path`, in the
+    normalized units of `modules.whiteDwarf`.
+
+    Parameters
+    ----------
+    rhoVal : np.ndarray
+        The central densities in kg*m^(-3).
+    regime : {1, 2, 3}
+        The equation of state.
+    span : modules.grids.baseGrid
+        The integration grid, the same for all stars.
+    path : str
+        The file of the arena.
+    every : int, optional
+        Keep every `every`-th point of the grid, by default all.
+    pool : workerPool, optional
+        The pool to run in; by default one is started.
+
+    Returns
+    -------
+    tuple
+        `(arena, index)`: the arena, and an array of the rows `(rhoC, Radius,
+        Mass, offset, length)` of the stars in the order of `rhoVal`; the
+        profile of the k-th star is `arena.view(*index[k, 3:].astype(int))`.
+    """
+    span = grids.asGrid(span)
+    rhoVal = np.asarray(rhoVal, dtype=float)
+    # a profile has at most one row per kept point and the surface
+    rows = (span.size - 1)//every + 2
+    arena = profileArena(path, rows*rhoVal.size)
+    tasks = [(rho, regime, span, every, path, arena.allocate(rows))
+             for rho in rhoVal]
+    costs = starCost(rhoVal, regime, span.size, span[-1])
+    index = np.empty((rhoVal.size, 5))
+    if pool is None:
+        with workerPool() as pool:
+            for k, row in pool.imap(_profileTask, tasks, costs):
+                index[k] = row
+    else:
+        for k, row in pool.imap(_profileTask, tasks, costs):
+            index[k] = row
+    return arena, index
+
+def _interpError(t: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """
+    Estimates the error of linear interpolation of `v(t)` at the middle of
+    every interval of the sorted `t`, as the largest difference to the
+    parabolas through the ends and either neighbour. With fewer than three
+    points the error is taken as infinite.
+    """
+    n = t.size
+    err = np.zeros(n - 1)
+    if n < 3:
+        return np.full(n - 1, np.inf)
+    mid = 0.5*(t[:-1] + t[1:])
+    lin = 0.5*(v[:-1] + v[1:])
+    for shift in (-1, 1):
+        # parabola through interval i and point i - 1 or i + 2
+        i = np.arange(n - 1)
+        j = i - 1 if shift < 0 else i + 2
+        ok = (j >= 0) & (j < n)
+        i, j = i[ok], j[ok]
+        a, b, c = t[i], t[i+1], t[j]
+        # Lagrange form evaluated at the middle of [a, b]
+        m = mid[i]
+        q = (v[i]*(m - b)*(m - c)/((a - b)*(a - c)) +
+             v[i+1]*(m - a)*(m - c)/((b - a)*(b - c)) +
+             v[j]*(m - a)*(m - b)/((c - a)*(c - b)))
+        err[i] = np.maximum(err[i], np.abs(q - lin[i]))
+    return err
+
+def refine(func, rhoMin: float, rhoMax: float, sink: resultSink,
+           tol: float=1e-3, budget: int=81, initial: int=9,
+           pool: workerPool=None, chunkSize: int=1,
+           progress: bool=True, cost=None) -> list:
+    """
+    Sweeps the central densities from `rhoMin` to `rhoMax` adaptively:
+    starting from a coarse log-spaced set, the intervals in `log(rhoC)` over
+    which linear interpolation of `log(Radius)` or `log(Mass)` has the largest
+    estimated error are split in the middle, a batch at a time, until the
+    error is below `tol` everywhere or `budget` stars are computed.
+
+    Parameters
+    ----------
+    func : function
+        Maps an array of densities to rows `[rhoC, Radius, Mass]`, as in
+        `run`.
+    rhoMin, rhoMax : float
+        The range of central densities in kg*m^(-3).
+    sink : resultSink
+        The sink the rows are written to. On resume, the densities already in
+        it within the range count as computed.
+    tol : float, optional
+        The tolerance of the interpolation error of `log(Radius)` and
+        `log(Mass)`, roughly a relative error; by default 1e-3.
+    budget : int, optional
+        The largest number of stars to compute in the range, by default 81.
+    initial : int, optional
+        The number of log-spaced densities to start from, by default 9.
+    pool : workerPool, optional
+        The pool to run in; by default one is started for the sweep. Its
+        number of workers is also the number of intervals split in each batch.
+    chunkSize : int, optional
+        The number of densities handed to `func` at once, by default 1.
+    progress : bool, optional
+        Whether to report progress on stderr.
+    cost : function, optional
+        The expected cost of stars, as in `run`.
+
+    Returns
+    -------
+    list
+        The rows computed in the range, ordered by density.
+    """
+    if pool is None:
+        with workerPool() as pool:
+            return refine(func, rhoMin, rhoMax, sink, tol, budget, initial,
+                          pool, chunkSize, progress, cost)
+
+    todo = np.geomspace(rhoMin, rhoMax, initial)
+    # the densities handed out so far, which are not tried again should they
+    # not come back
+    tried = set()
+    while True:
+        tried.update(todo.tolist())
+        runMany([(func, todo, sink, cost)], pool, chunkSize, progress)
+        rows = sorted(row for rho, row in sink.rows.items()
+                      if rhoMin <= rho <= rhoMax)
+        if len(rows) >= budget:
+            break
+        table = np.log(np.abs(np.array(rows)))
+        err = np.maximum(_interpError(table[:, 0], table[:, 1]),
+                         _interpError(table[:, 0], table[:, 2]))
+        worst = np.argsort(err)[::-1]
+        worst = worst[err[worst] > tol]
+        # the middle in log(rhoC) of the worst intervals, skipping the
+        # densities already computed or tried, which would not change the
+        # table; a pool with no workers yet still gets one at a time
+        middle = np.exp(0.5*(table[worst, 0] + table[worst + 1, 0]))
+        todo = np.array([r for r in middle.tolist()
+                         if r not in sink and r not in tried][
+                             :min(max(1, pool.processes), budget - len(rows))])
+        if todo.size == 0:
+            break
+    return rows
+
+if __name__=="__main__":
+    print(
+        "This file contains the driver of sweeps over central densities.")
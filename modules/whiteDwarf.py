@@ -1,10 +1,12 @@
 """
 White dwarf class wrapper.
 """
+import time
+
 import numpy as np
-from scipy import constants as cs  # constants for the derivative equation
 
-from . import derivatives, ode
+from . import constants as cs  # constants for the derivative equation
+from . import derivatives, eos, grids, kernels, ode
 
 class whiteDwarf(ode.ODEinit):
     """
@@ -15,32 +17,49 @@ class whiteDwarf(ode.ODEinit):
 
     Parameters
     ----------
-    rhoC : float
+    rhoC : float or np.ndarray
         The density of matter in the small region around the center. In units
-        of kg * m^(-3)
-    span : np.ndarray
-        The range of values of r to be calculated at. In normalized units to 
-        cut down on computational time and improve calculation accuracy.
-        Expects an array with first member = 1 for the starting central mass to
-        be correctly defined. Unit of normalization given by l (see below).
-    regime : {1, 2, 3}, optional
+        of kg * m^(-3). An array of densities sets up an ensemble of stars
+        which are integrated together in one pass.
+    span : np.ndarray or modules.grids.baseGrid
+        The range of values of r to be calculated at, as an array or a grid.
+        In normalized units to cut down on computational time and improve
+        calculation accuracy.
+        The centre is at 0, and the integration starts at a small `span[0]`
+        from the series expansion about it, look at `centralSeries`;
+        `startPoint` gives a start where the series is accurate. Unit of
+        normalization given by l (see below).
+    regime : {1, 2, 3} or modules.eos.eosTable, optional
         The regime indicates the choice of equation of state -> derivative, by
-        default 1 - non-relativistic.
+        default 1 - non-relativistic; 2 is relativistic and 3 the
+        ultra-relativistic limit. A table of `modules.eos` gives the equation
+        of state instead.
+    terms : int, optional
+        The number of terms of the series of the initial state, by default 6;
+        1 gives the constant density start `[1, span[0]^3]`.
 
     Attributes
     ----------
-    rhoC : float
+    rhoC : float or np.ndarray
         The density of matter in the small region around the center
-    const1 : float
+    const1 : float or np.ndarray
         Constant to be used in the derivative, depends on the `rhoC` value.
         Value after the normalization.
-    const2 : float
+    const2 : float or np.ndarray
         Second constant to be used in the derivative for the relativistic case,
         depends on `rhoC`. Value after the normalization.
-    Radius : float
+    const3 : float or np.ndarray
+        Constant to be used in the derivative for the ultra-relativistic case,
+        `const1*sqrt(const2)`.
+    table : modules.eos.eosTable or None
+        The tabulated equation of state, if given as the regime. Then `const1`
+        is the coefficient of `m/x^2` in the derivative of rho at the centre
+        and `const2` its power of the density there, which only set up the
+        initial state.
+    Radius : float or np.ndarray
         Physical radius of the star. Has a value only after `getRadius()` has
         been called.
-    Mass : float
+    Mass : float or np.ndarray
         Mass of the star. Has a value only after `getRadius()` has been called.
 
     Methods
@@ -65,61 +84,392 @@ class whiteDwarf(ode.ODEinit):
     for normalization.
     """
 
-    def __init__(self, rhoC: float, span: np.ndarray, regime: int=1) -> None:
+    def __init__(self, rhoC, span: np.ndarray, regime: int=1,
+                 terms: int=6) -> None:
+        self.regime = regime
+        if np.ndim(rhoC) > 0:
+            rhoC = np.asarray(rhoC, dtype=float)
         self.rhoC = rhoC
-        # vector to be given as initial conditions, [rho, mass]
-        init_condit = np.array([1.0, 1.0*(span[0]**3)])
+        self.table = regime if isinstance(regime, eos.eosTable) else None
 
         # constants in the derivative; computed here so that they are computed
         # only once rather than every time the derivative func is called
-        self.const1 = -(2**(13.0/3))*cs.pi*cs.gravitational_constant *\
-            cs.electron_mass*(cs.proton_mass**(5.0/3)) * \
-            (rhoC**(1.0/3))*(cs.h**(-2.0))
-        self.const2 = (3*rhoC/16/cs.pi/cs.proton_mass *
-                       (cs.h/cs.c/cs.electron_mass)**3)**(2.0/3)
+        self.const1, self.const2 = _constants(rhoC, regime)
+        self.const3 = self.const1*self.const2**0.5
+
+        # vector to be given as initial conditions, [rho, mass], summed from
+        # the series about the centre; one row per star for an ensemble
+        x0 = float(span[0])
+        rho, m = _series(self.const1, self.const2, regime, terms)
+        powers = (x0*x0)**np.arange(terms)
+        init_condit = np.stack([np.tensordot(powers, rho, 1),
+                                x0**3*np.tensordot(powers, m, 1)], axis=-1)
+        # the constants actually passed to the derivative; an ensemble
+        # integration restricts them to the members still being integrated
+        self._const1, self._const2 = self.const1, self.const2
+        self._const3 = self.const3
+        self._rhoC = rhoC
+        # density below which the derivative gives up, set by integrate
+        self.floor = 1e-10
 
         # choose the equation of state and pass constants, prepares a function
         # to be passed to the constructor of ODEinit accepting (x, y) params
         if regime == 1:
-            func = lambda a, b: derivatives.nonRelativGas(a, b, self.const1)
+            func = lambda a, b, out=None: derivatives.nonRelativGas(
+                a, b, self._const1, self.floor, out)
         elif regime == 2:
-            func = lambda a, b: derivatives.relativGas(a, b, self.const1, self.const2)
+            func = lambda a, b, out=None: derivatives.relativGas(
+                a, b, self._const1, self._const2, self.floor, out)
         elif regime == 3:
-            func = lambda a, b: derivatives.ultraRel(a, b, self.const1)
+            func = lambda a, b, out=None: derivatives.ultraRel(
+                a, b, self._const3, self.floor, out)
+        elif self.table is not None:
+            func = lambda a, b, out=None: derivatives.tabulatedGas(
+                a, b, self.table, self._rhoC, self.floor, out)
+        else:
+            raise ValueError("Unknown regime: {}".format(regime))
         
-        super(whiteDwarf, self).__init__(init_condit, func, span)
+        # the derivatives write into an out array, integrate in place
+        super(whiteDwarf, self).__init__(init_condit, func, span, inplace=True)
+
+    def integrate(self, integrator: int=3, surface: bool=False,
+                  backend: str="python", **kwargs) -> None:
+        """
+        Integrates the equation, look at `ODEinit.integrate` for the options.
+
+        By default the integration stops once the density drops below the
+        floor of the derivative, and the surface is only known to the last
+        grid point. With `surface` the derivative is evaluated past `rho = 0`
+        instead and the surface is located as a terminal event inside the
+        step where the density changes sign, independently of the grid. As
+        `ODEinit` takes a single event function, `surface` cannot be combined
+        with `events` of the caller.
+
+        The "jit" backend runs the RK4 integration in the compiled loop of
+        `modules.kernels`, with identical results. It is used only when numba
+        is installed, for the RK4 integrator and the analytic regimes, and
+        without a callback to store points, an observer or `events`;
+        otherwise the Python path runs instead. It fills in `stats` as the
+        Python path, but an ensemble is integrated star by star, so that its
+        steps, derivative and event calls are summed over the stars.
+
+        Parameters
+        ----------
+        integrator : {1, 2, 3, 4, 5}, optional
+            Choice of the integrator, by default the Runge-Kutta 4th order;
+            the symplectic ones of `modules.integrators` do not apply.
+        surface : bool, optional
+            Whether to locate the surface `rho = 0` as an event, by default
+            False.
+        backend : {"python", "jit"}, optional
+            Whether to integrate in Python or in the compiled kernel.
+        **kwargs
+            Passed on to `ODEinit.integrate`.
+
+        Raises
+        ------
+        ValueError
+            If `events` are given along with `surface`.
+        """
+        if surface and kwargs.get("events") is not None:
+            raise ValueError("The surface event cannot be combined with events")
+        self.floor = -np.inf if surface else 1e-10
+        store = kwargs.get("store", "full")
+        if (backend == "jit" and kernels.available and integrator == 3 and
+                self.table is None and "events" not in kwargs and
+                "observer" not in kwargs and not callable(store)):
+            start = time.perf_counter()
+            self.stats = ode._newStats(self.rhoC.size if self.ensemble else 1)
+            self.integrator = self._integrateJit
+            self._integrateJit(surface, ode._storeEvery(store))
+            self._finishStats(start)
+            self.flagIntegrated = True
+            return
+
+        if surface:
+            kwargs["events"] = whiteDwarf.surface
+        super(whiteDwarf, self).integrate(integrator, **kwargs)
+
+    def _integrateJit(self, surface: bool, every: int) -> None:
+        """
+        Integrates the star, or each star of an ensemble in turn, in the
+        compiled kernel and fills in the attributes as `ODEinit.integrate`.
+        """
+        # a uniform grid is passed by its parameters, others by their points
+        if isinstance(self.span, grids.uniformGrid):
+            x0, step, points = self.span.x0, self.span.step, np.empty(0)
+        else:
+            x0, step = 0.0, 0.0
+            points = np.asarray(self.span.points(), dtype=float)
+        n = self.span.size
+        const1 = self.const3 if self.regime == 3 else self.const1
+        # the reason of termination by the status of the kernel
+        reasons = ("end", "deriv", "event")
+
+        if not self.ensemble:
+            # the stored points go to chunks which double in size, as in
+            # `ode._Trajectory`, the kernel stopping whenever one is full
+            chunks, size, start = [], 1024, 0
+            rho, m = self.y0
+            while True:
+                out = np.empty((size if every else 1, 2))
+                status, i, rho, m, rhoNext, mNext = kernels.rk4Star(
+                    self.regime, const1, self.const2, self.floor, x0, step,
+                    points, start, n, rho, m, every, out)
+                if status != 3:
+                    chunks.append(out[:i//every - start//every + 1]
+                                  if every else out)
+                    break
+                chunks.append(out)
+                start, size = i, min(2*size, 1 << 20)
+            self.indexEnd = i
+            self.flagEvent = status == 2
+            self._countJit(status, i, surface)
+            self.stats["reason"], self.stats["index"] = reasons[status], i
+            if self.flagEvent:
+                self.xEnd, self.yEnd = self._locate(
+                    whiteDwarf.surface, self.span[i], np.array([rho, m]),
+                    self.span[i+1], np.array([rhoNext, mNext]), rho)
+            else:
+                self.xEnd, self.yEnd = self.span[i], np.array([rho, m])
+            if every:
+                self.yOut = (chunks[0] if len(chunks) == 1 else
+                             np.concatenate(chunks))
+                self.xOut = self.span[np.arange(0, i + 1, every)]
+            else:
+                self.xOut, self.yOut = None, None
+            return
+
+        # an ensemble only keeps the final states, as in ODEinit
+        N = self.rhoC.size
+        self.indexEnd = np.zeros(N, dtype=int)
+        self.flagEvent = np.zeros(N, dtype=bool)
+        self.xEnd = np.zeros(N)
+        self.yEnd = np.zeros((N, 2))
+        self.xOut, self.yOut = None, None
+        out = np.empty((1, 2))
+        self.stats["reason"] = np.empty(N, dtype=object)
+        for k in range(N):
+            status, i, rho, m, rhoNext, mNext = kernels.rk4Star(
+                self.regime, const1[k], self.const2[k], self.floor, x0, step,
+                points, 0, n, self.y0[k, 0], self.y0[k, 1], 0, out)
+            self.indexEnd[k] = i
+            self._countJit(status, i, surface)
+            self.stats["reason"][k] = reasons[status]
+            if status == 2:
+                # locate with the ensemble derivative restricted to member k
+                self.flagEvent[k] = True
+                self._select(np.array([k]))
+                xEvent, yEvent = self._locate(
+                    whiteDwarf.surface, self.span[i], np.array([[rho, m]]),
+                    self.span[i+1], np.array([[rhoNext, mNext]]),
+                    np.array([rho]))
+                self.xEnd[k], self.yEnd[k] = xEvent[0], yEvent[0]
+            else:
+                self.xEnd[k], self.yEnd[k] = self.span[i], (rho, m)
+        self._select(np.arange(N))
+        self.stats["index"] = self.indexEnd.copy()
+
+    def _countJit(self, status: int, i: int, surface: bool) -> None:
+        # the counts of a star integrated by the kernel, which stopped in
+        # step i with the status of `kernels.rk4Star`, as `ODEinit` counts;
+        # the surface is checked at the centre and after every step
+        stats = self.stats
+        steps = i + (status == 2)
+        stats["steps"] += steps
+        stats["rejected"] += int(status == 1)
+        stats["derivCalls"] += 4*(steps + (status == 1))
+        if surface:
+            stats["eventCalls"] += 1 + steps
+
+    @staticmethod
+    def surface(x, y: np.ndarray):
+        """
+        The event function of the surface, `rho(x) = 0`.
+        """
+        return y[..., 0]
+
+    def _select(self, members: np.ndarray) -> None:
+        # keep the per-star constants in step with the active ensemble members
+        self._const1 = self.const1[members]
+        self._const2 = self.const2[members]
+        self._const3 = self.const3[members]
+        self._rhoC = self.rhoC[members]
 
     def getRadiusMass(self) -> tuple:
         """
         Finds the radius and mass of the white dwarf, and returns them. Takes
         into account the normalization of the ODE. 
 
-        The function scans `yOut[:,0]` column containing `rho(r)` values. We
-        know that this is a decreasing function; the first instance where it 
-        has a value <= 0 it where the star "ends".
+        The star "ends" at the last point where the density could still be
+        evaluated, or at the surface if it was located as an event, i.e.
+        `xEnd` as recorded by the integration.
 
         Returns
         -------
         tuple
             Returns a tuple `(Radius, Mass)`. Radius and Mass are calculated
-            from `yOut` with the appropriate normalization constants. For
-            Radius it is `l = (3/(4*pi))^(1/3)`, result is in m. For Mass it is
-            `rhoC`, result is in kg.
+            from `yEnd` with the appropriate normalization constants. For
+            Radius it is `l = (3/(4*pi))^(1/3)`, result is in m, measured from
+            the centre at 0. For Mass it is `rhoC`, result is in kg. For an
+            ensemble both are arrays ordered as `rhoC`.
         """
 
-        # find index of rho = 0 (changing signs)
         if self.flagIntegrated:
-            index = np.searchsorted(-self.yOut[:, 0], 0)
-            # index is the position where we have yOut[index,:] ~ [0,0]
-
-            l = (3/(4*np.pi))**(1.0/3.0)                # normalization const
-            self.Radius = (index-1)*self.interval*l     # in m
-            self.Mass = self.yOut[index-1, 1]*self.rhoC # in kg*m^(-3)
+            l = (3/(4*np.pi))**(1.0/3.0)                    # normalization const
+            self.Radius = self.xEnd*l                       # in m
+            self.Mass = self.yEnd[..., 1]*self.rhoC         # in kg
             return self.Radius, self.Mass
         else:
             print("Integrate the eqn first")
             return None, None
 
+def constants(rhoC):
+    """
+    Computes the constants `const1` and `const2` in the normalized derivative
+    of the white dwarf, look at `whiteDwarf`.
+
+    Parameters
+    ----------
+    rhoC : float or np.ndarray
+        The central density in kg*m^(-3).
+
+    Returns
+    -------
+    tuple
+        The tuple `(const1, const2)`, of the same shape as `rhoC`.
+    """
+    const1 = -(2**(13.0/3))*cs.pi*cs.gravitational_constant *\
+        cs.electron_mass*(cs.proton_mass**(5.0/3)) * \
+        (rhoC**(1.0/3))*(cs.h**(-2.0))
+    const2 = (3*rhoC/16/cs.pi/cs.proton_mass *
+              (cs.h/cs.c/cs.electron_mass)**3)**(2.0/3)
+    return const1, const2
+
+def _power(h: list, p: float, n: int) -> list:
+    # the first n coefficients of the series h^p from those of h, by the
+    # recurrence of J.C.P. Miller; h[0] must not be 0
+    g = [h[0]**p]
+    for k in range(1, n):
+        g.append(sum(((p + 1)*j - k)*h[j]*g[k - j]
+                     for j in range(1, k + 1))/(k*h[0]))
+    return g
+
+def _constants(rhoC, regime) -> tuple:
+    # the constants of the derivative, or for a table the coefficient and
+    # power of the density of the derivative at the centre
+    if isinstance(regime, eos.eosTable):
+        return eos.scale*regime.q(rhoC), regime.slope(rhoC)
+    return constants(rhoC)
+
+def _series(const1, const2, regime, terms: int) -> tuple:
+    """
+    The coefficients of `centralSeries` from the constants of `_constants`.
+    A table is expanded as the power law of its slope at the centre.
+    """
+    table = isinstance(regime, eos.eosTable)
+    if not table and regime not in (1, 2, 3):
+        raise ValueError("Unknown regime: {}".format(regime))
+    const = const1*const2**0.5 if regime == 3 else const1
+    rho = [np.ones_like(const1)]
+    for k in range(1, terms):
+        # the density factor of the derivative of rho, to the power x^(2k-2)
+        if table:
+            f = _power(rho, const2, k)
+        elif regime == 1:
+            f = _power(rho, 1.0/3, k)
+        elif regime == 3:
+            f = _power(rho, 2.0/3, k)
+        else:
+            q = _power(rho, 1.0/3, k)
+            s = _power(rho, 2.0/3, k)
+            w = _power([1 + const2*s[0]] + [const2*a for a in s[1:]], 0.5, k)
+            f = [sum(q[j]*w[i - j] for j in range(i + 1)) for i in range(k)]
+        # rho' = const*x*(m/x^3)*f, term by term
+        rho.append(const*sum(3*rho[j]/(2*j + 3)*f[k - 1 - j]
+                             for j in range(k))/(2*k))
+    rho = np.array(rho)
+    m = rho*(3/(2*np.arange(terms) + 3)).reshape((-1,) + (1,)*(rho.ndim - 1))
+    return rho, m
+
+def centralSeries(rhoC, regime: int, terms: int=6) -> tuple:
+    """
+    The series expansion of the normalized density and mass about the centre
+    of the star, `rho = sum(rho_k*x^(2k))` and `m = x^3*sum(m_k*x^(2k))`.
+
+    Parameters
+    ----------
+    rhoC : float or np.ndarray
+        The central density in kg*m^(-3).
+    regime : {1, 2, 3} or modules.eos.eosTable
+        The equation of state, look at `whiteDwarf`.
+    terms : int, optional
+        The number of terms k = 0 ... terms - 1, by default 6.
+
+    Returns
+    -------
+    tuple
+        The tuple `(rho_k, m_k)` of arrays of shape `(terms,) + shape(rhoC)`.
+
+    Raises
+    ------
+    ValueError
+        If the regime is unknown.
+
+    Notes
+    -----
+    With `m = x^3*mu` the derivative of `modules.derivatives` is
+    `rho' = const*x*mu*f(rho)`, with `f(rho)` the density factor of the
+    equation of state, and `m' = 3*x^2*rho` gives `m_k = 3*rho_k/(2k + 3)`.
+    Matching the powers of x gives `rho_k` from the lower terms; the powers
+    of the series in `f` are expanded by the recurrence of J.C.P. Miller. The
+    series converges within a fraction of the radius of the star. A table is
+    expanded as a power law of its local slope, exact for the polytropes and
+    otherwise to the second term.
+    """
+    const1, const2 = _constants(rhoC, regime)
+    return _series(const1, const2, regime, terms)
+
+def startPoint(rhoC, regime: int, step: float, tol: float=1e-12,
+               terms: int=6):
+    """
+    A point to start the integration from, at most `step` from the centre,
+    where the last term of the series of the density is below `tol`. It is
+    `step` halved as few times as needed, so that it depends only on the
+    star, the step and the tolerance.
+
+    Parameters
+    ----------
+    rhoC : float or np.ndarray
+        The central density in kg*m^(-3).
+    regime : {1, 2, 3} or modules.eos.eosTable
+        The equation of state, look at `whiteDwarf`.
+    step : float
+        The step of the grid, in normalized units.
+    tol : float, optional
+        The error of the initial density allowed, by default 1e-12.
+    terms : int, optional
+        The number of terms of the series, by default 6; at least 2, as the
+        constant term alone gives no error to bound.
+
+    Returns
+    -------
+    float or np.ndarray
+        The starting point in normalized units, of the shape of `rhoC`.
+
+    Raises
+    ------
+    ValueError
+        If there are fewer than 2 terms.
+    """
+    if terms < 2:
+        raise ValueError("The series needs 2 terms or more: {}".format(terms))
+    rho, _ = centralSeries(rhoC, regime, terms)
+    # the last term is below tol up to this point
+    reach = (tol/np.abs(rho[-1]))**(0.5/(terms - 1))
+    halvings = np.maximum(np.ceil(np.log2(step/reach)), 0)
+    return step/2**halvings
+
 if __name__=="__main__":
     print(
         "This file contains declaration of a white dwarf class.")
@@ -0,0 +1,55 @@
+"""sweepWorker.py
+A worker of a sweep spread over several machines: connects to the coordinator
+started by `main.py --serve HOST:PORT` or `convergence.py --serve HOST:PORT`
+and computes the stars it hands out until the sweep is over. Run it from the
+directory of the scripts, with the same code as the coordinator and the key
+it was given or printed in WHITEDWARF_AUTHKEY, e.g.
+
+    WHITEDWARF_AUTHKEY=... python sweepWorker.py coordinator:5050 --processes 8
+
+Look at modules/cluster.py for the protocol.
+"""
+import argparse
+import multiprocessing
+import sys
+
+# our library
+import modules.cluster
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("address", help="HOST:PORT of the coordinator")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="workers to start on this machine")
+    parser.add_argument("--authkey",
+                        help="the key shared with the coordinator, by default "
+                             "WHITEDWARF_AUTHKEY, which is not shown by ps")
+    parser.add_argument("--interval", type=float, default=5.0,
+                        help="seconds between heartbeats, as the coordinator")
+    parser.add_argument("--patience", type=float, default=60.0,
+                        help="seconds to wait for the coordinator to start")
+    args = parser.parse_args()
+
+    address = modules.cluster.parseAddress(args.address)
+    try:
+        authkey = modules.cluster.authKey(args.authkey)
+    except ValueError as error:
+        parser.error(str(error))
+    options = dict(authkey=authkey, interval=args.interval,
+                   patience=args.patience)
+    if args.processes == 1:
+        done = modules.cluster.work(address, **options)
+        print("{} tasks done".format(done), file=sys.stderr)
+        return
+    workers = [multiprocessing.Process(target=modules.cluster.work,
+                                       args=(address,), kwargs=options)
+               for _ in range(args.processes)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+
+if __name__ == '__main__':
+    main()
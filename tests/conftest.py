@@ -0,0 +1,6 @@
+# Puts the root of the repository on sys.path, so that the tests import
+# `modules` as the scripts do, from wherever pytest is run.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
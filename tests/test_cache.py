@@ -0,0 +1,38 @@
+"""The cache of white dwarfs of `modules.cache`."""
+import os
+import time
+
+import numpy as np
+import pytest
+
+from modules.cache import starCache
+from modules.whiteDwarf import whiteDwarf
+
+span = np.linspace(1, 8.1e7, 2000)
+densities = np.array([1e9, 1e10, 1e11])
+
+@pytest.mark.parametrize("integrator", [3, 4, 5])
+def test_radiusMassOfMisses(tmp_path, integrator):
+    # dopri5 and abm4 do not support ensembles, and integrate star by star
+    cache = starCache(str(tmp_path))
+    cache.radiusMass(densities[1], 1, span, integrator, surface=True)
+    radius, mass = cache.radiusMass(densities, 1, span, integrator,
+                                    surface=True)
+    assert (cache.hits, cache.misses) == (1, 3)
+    for k, rhoC in enumerate(densities):
+        star = whiteDwarf(rhoC, span, 1)
+        star.integrate(integrator, surface=True)
+        assert np.allclose((radius[k], mass[k]), star.getRadiusMass(),
+                           rtol=1e-12)
+
+def test_evictRemovesStaleTemporaryFiles(tmp_path):
+    cache = starCache(str(tmp_path))
+    stale, fresh = tmp_path/"stale.tmp", tmp_path/"fresh.tmp"
+    stale.write_bytes(b"[1.0,")
+    fresh.write_bytes(b"[1.0,")
+    old = time.time() - 2*3600
+    os.utime(stale, (old, old))
+    cache.put("key", (1.0, 2.0))
+    cache.evict()
+    assert not stale.exists() and fresh.exists()
+    assert cache.get("key") == (1.0, 2.0)
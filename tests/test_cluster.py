@@ -0,0 +1,88 @@
+"""The coordinator and workers of `modules.cluster` on localhost."""
+import multiprocessing
+import pickle
+import threading
+import time
+from multiprocessing.connection import Client
+
+import pytest
+
+from modules import cluster
+
+key = "test"
+
+def slow(arg):
+    # a task which takes a while, long enough to kill its worker
+    seconds, value = arg
+    time.sleep(seconds)
+    return value
+
+def fakeWorker(address, replies):
+    # a worker which sends the result of its first task twice
+    conn = Client(address, authkey=key.encode())
+    conn.recv()
+    for copies in replies:
+        conn.send(("ready",))
+        _, k, payload = conn.recv()
+        func, arg = pickle.loads(payload)
+        for _ in range(copies):
+            conn.send(("result", k, func(arg)))
+    conn.close()
+
+@pytest.fixture
+def pool():
+    pool = cluster.clusterPool(("localhost", 0), authkey=key, interval=0.1,
+                               timeout=2.0, patience=1.0)
+    yield pool
+    pool.close()
+
+def waitFor(condition, seconds=10.0):
+    deadline = time.monotonic() + seconds
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_requeuesTaskOfKilledWorker(pool):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=cluster.work,
+                               args=(pool._listener.address, key, 0.1))
+               for _ in range(2)]
+    results = []
+    consumer = threading.Thread(
+        target=lambda: results.extend(pool.imap(slow, [(1.0, "done")])))
+    consumer.start()
+    # the first worker takes the task and is killed in the middle of it
+    workers[0].start()
+    waitFor(lambda: pool._payloads and not pool._queue)
+    time.sleep(0.2)
+    workers[0].kill()
+    waitFor(lambda: pool.processes == 0)
+    assert pool.requeued == 1
+    workers[1].start()
+    consumer.join(10)
+    assert results == [(0, "done")]
+    pool.close()
+    workers[1].join(10)
+    assert workers[1].exitcode == 0
+
+def test_ignoresDuplicateResult(pool):
+    worker = threading.Thread(target=fakeWorker,
+                              args=(pool._listener.address, [2, 1]))
+    worker.start()
+    results = sorted(pool.imap(slow, [(0.0, "a"), (0.0, "b")]))
+    worker.join()
+    assert results == [(0, "a"), (1, "b")]
+    assert pool._results.empty()
+
+def test_givesUpWithoutWorkers(pool):
+    with pytest.raises(RuntimeError, match="No workers"):
+        list(pool.imap(slow, [(0.0, "a")]))
+
+def test_refusesToWorkWithoutKey(monkeypatch):
+    monkeypatch.delenv(cluster.keyVariable, raising=False)
+    with pytest.raises(ValueError):
+        cluster.work(("localhost", 1), patience=0.0)
+
+def test_listensOnLocalhost():
+    assert cluster.parseAddress(":5050") == ("localhost", 5050)
+    assert cluster.parseAddress("0.0.0.0:5050") == ("0.0.0.0", 5050)
@@ -0,0 +1,33 @@
+"""The constants of `modules.constants` against those of the libraries."""
+import pytest
+
+from modules import constants
+
+# the values of CODATA 2014, as in the libraries of a few years ago
+codata2014 = {"gravitational_constant": 6.67408e-11,
+              "electron_mass": 9.10938356e-31,
+              "proton_mass": 1.672621898e-27, "h": 6.626070040e-34}
+
+@pytest.mark.parametrize("library", ["scipy", "astropy"])
+def test_constantsAgree(library):
+    pytest.importorskip(library)
+    differ = {key: pair for key, pair in constants.check().items()
+              if key.startswith(library + ".")}
+    assert differ == {}
+
+def test_checkFindsNothing():
+    pytest.importorskip("scipy")
+    pytest.importorskip("astropy")
+    assert constants.check() == {}
+
+def test_otherReleaseAgrees(monkeypatch):
+    # a library following another CODATA release is not taken as a mismatch
+    pytest.importorskip("scipy")
+    for name, value in codata2014.items():
+        monkeypatch.setattr(constants, name, value)
+    assert constants.check() == {}
+
+def test_wrongDigitDiffers(monkeypatch):
+    pytest.importorskip("scipy")
+    monkeypatch.setattr(constants, "electron_mass", 9.10938e-31)
+    assert "scipy.electron_mass" in constants.check()
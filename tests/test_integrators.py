@@ -0,0 +1,78 @@
+"""The in-place integrators against the allocating ones they replace."""
+import numpy as np
+import pytest
+
+import modules
+from modules import derivatives, integrators
+from modules.whiteDwarf import constants
+
+const1, const2 = constants(np.array([1e6, 1e10, 1e14]))
+
+# the systems by name: the derivative, a single y0 and an ensemble y0; the SHO
+# vectorizes over the columns of a (2, N) state, the gases over rows of (N, 2)
+systems = {
+    "SHO": (derivatives.SHO, np.array([0.0, 1.0]),
+            np.array([[0.0, 0.5, 1.0], [1.0, 0.5, 0.0]])),
+    "nonRelativGas": (
+        lambda x, y, out=None: derivatives.nonRelativGas(
+            x, y, const1[1] if y.ndim == 1 else const1, 1e-10, out),
+        np.array([1.0, 1.0]), np.ones((3, 2))),
+    "relativGas": (
+        lambda x, y, out=None: derivatives.relativGas(
+            x, y, const1[1] if y.ndim == 1 else const1,
+            const2[1] if y.ndim == 1 else const2, 1e-10, out),
+        np.array([1.0, 1.0]), np.ones((3, 2))),
+}
+
+def steps(step, y0, x0, h, n):
+    # n steps of an integrator, allocating or in place
+    y = y0.copy()
+    for i in range(n):
+        y = step(x0 + i*h, y, h)
+    return y
+
+@pytest.mark.parametrize("integrator", sorted(integrators.inPlace))
+@pytest.mark.parametrize("system", sorted(systems))
+@pytest.mark.parametrize("ensemble", [False, True])
+def test_inPlaceStepsMatch(integrator, system, ensemble):
+    deriv, single, many = systems[system]
+    y0 = many if ensemble else single
+    # the gases from x = 1 in unit steps, the SHO over a few periods
+    x0, h = (0.0, 1e-3) if system == "SHO" else (1.0, 1.0)
+    work = np.empty((integrators.stages,) + y0.shape)
+
+    def inPlace(x, y, h):
+        return integrators.inPlace[integrator](x, y, deriv, h,
+                                               np.empty_like(y), work)
+
+    def allocating(x, y, h):
+        return integrators.index[integrator](x, y, deriv, h)
+
+    expected = steps(allocating, y0, x0, h, 2000)
+    result = steps(inPlace, y0, x0, h, 2000)
+    assert np.array_equal(result, expected)
+
+@pytest.mark.parametrize("integrator", sorted(integrators.inPlace))
+@pytest.mark.parametrize("regime", [1, 2])
+def test_inPlaceStarMatches(integrator, regime):
+    # a whole star through ODEinit, in place and allocating
+    span = modules.grids.uniformGrid.linspace(1, 8.1e7, 20000)
+    stars = []
+    for inplace in (False, True):
+        star = modules.whiteDwarf(1e10, span, regime)
+        star.inplace = inplace
+        star.integrate(integrator, surface=True)
+        stars.append(star)
+    assert np.array_equal(stars[0].yOut, stars[1].yOut)
+    assert stars[0].xEnd == stars[1].xEnd
+    assert np.array_equal(stars[0].yEnd, stars[1].yEnd)
+
+def test_inPlaceSHOMatches():
+    span = modules.grids.uniformGrid(0.0, 1e-3, 5001)
+    runs = []
+    for inplace in (False, True):
+        ode = modules.ODEinit(np.array([0.0, 1.0]), derivatives.SHO, span,
+                              inplace=inplace)
+        ode.integrate(3)
+        runs.append(ode.yOut)
+    assert np.array_equal(runs[0], runs[1])
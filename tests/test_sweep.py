@@ -0,0 +1,37 @@
+"""The adaptive sweep of `modules.sweep`."""
+import numpy as np
+
+from modules import sweep
+
+def kinked(rhoVal):
+    # a mass-radius curve with a kink between 1e9 and 1e10, where the stars
+    # fail and come back without a row
+    return [[rho, rho**(-1.0/3), 1.0 if rho <= 1e9 else (rho/1e9)**3]
+            for rho in rhoVal if not 1e9 < rho < 1e10]
+
+def curved(rhoVal):
+    return [[rho, rho**(-1.0/3), np.log(rho)**2] for rho in rhoVal]
+
+class localPool(object):
+    # a pool running the tasks in this process, reporting `processes` workers
+    def __init__(self, processes):
+        self.processes = processes
+
+    def imap(self, func, tasks, costs=None):
+        for k, task in enumerate(tasks):
+            yield k, func(task)
+
+def test_refineStopsWithoutNewDensities(tmp_path):
+    # the middle of the worst interval fails, and is not tried over and over;
+    # the sweep goes on with the others, and stops when all fail or are fine
+    sink = sweep.resultSink(str(tmp_path/"rows.csv"), ["rhoC", "R", "M"])
+    rows = sweep.refine(kinked, 1e6, 1e14, sink, tol=1e-6, budget=40,
+                        pool=localPool(2), progress=False)
+    assert 9 < len(rows) < 40
+
+def test_refineWithoutWorkersYet(tmp_path):
+    # a cluster with no workers connected yet reports none
+    sink = sweep.resultSink(str(tmp_path/"rows.csv"), ["rhoC", "R", "M"])
+    rows = sweep.refine(curved, 1e6, 1e14, sink, tol=1e-9, budget=20,
+                        pool=localPool(0), progress=False)
+    assert len(rows) == 20
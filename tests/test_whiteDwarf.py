@@ -0,0 +1,55 @@
+"""The white dwarfs of `modules.whiteDwarf`: the compiled path against the
+Python one, and the start off the centre."""
+import numpy as np
+import pytest
+
+from modules import grids, kernels
+from modules.whiteDwarf import startPoint, whiteDwarf
+
+jit = pytest.mark.skipif(not kernels.available, reason="numba is missing")
+
+def both(span, regime=1, **options):
+    # the same star integrated by either backend
+    stars = []
+    for backend in ("python", "jit"):
+        star = whiteDwarf(1e10, span, regime)
+        star.integrate(3, backend=backend, **options)
+        stars.append(star)
+    return stars
+
+@jit
+@pytest.mark.parametrize("store", ["full", "every 3", "final"])
+@pytest.mark.parametrize("surface", [False, True])
+@pytest.mark.parametrize("span", [
+    grids.uniformGrid(1.0, 400.0, 40000), np.linspace(1, 8.1e7, 20000),
+    # the stored points fill the first chunk of the kernel exactly
+    grids.uniformGrid(1.0, 1.0, 1025)], ids=["uniform", "points", "chunk"])
+def test_jitMatchesPython(span, surface, store):
+    python, compiled = both(span, surface=surface, store=store)
+    assert compiled.xEnd == python.xEnd
+    assert np.array_equal(compiled.yEnd, python.yEnd)
+    if store == "final":
+        assert compiled.yOut is None and python.yOut is None
+    else:
+        assert np.array_equal(compiled.xOut, python.xOut)
+        assert np.array_equal(compiled.yOut, python.yOut)
+
+@jit
+@pytest.mark.parametrize("surface", [False, True])
+@pytest.mark.parametrize("regime", [1, 2, 3])
+def test_jitCountsAsPython(regime, surface):
+    python, compiled = both(np.linspace(1, 8.1e7, 20000), regime,
+                            surface=surface, store="final")
+    for key in ("members", "steps", "rejected", "derivCalls", "eventCalls",
+                "reason", "index"):
+        assert compiled.stats[key] == python.stats[key], key
+
+def test_startPointNeedsTwoTerms():
+    assert 0 < startPoint(1e10, 2, 1.0, terms=2) <= 1.0
+    with pytest.raises(ValueError):
+        startPoint(1e10, 2, 1.0, terms=1)
+
+def test_surfaceRefusesOtherEvents():
+    star = whiteDwarf(1e10, np.linspace(1, 8.1e7, 2000), 1)
+    with pytest.raises(ValueError):
+        star.integrate(3, surface=True, events=lambda x, y: y[..., 1] - 1)